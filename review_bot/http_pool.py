@@ -0,0 +1,93 @@
+import logging
+import os
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from importlib.util import find_spec
+from typing import Any
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class PooledHTTPClient:
+    """
+    Long-lived httpx.AsyncClient with keep-alive, pool limits and request
+    counters (every request, and those in flight, are counted here rather
+    than read from httpx internals). Owned by a service and closed on
+    application shutdown.
+    """
+
+    def __init__(self, name: str, **client_kwargs: Any):
+        self.name = name
+        self.max_connections = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "20"))
+        self.max_keepalive = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "10"))
+        self.keepalive_expiry = float(os.getenv("HTTP_POOL_KEEPALIVE_EXPIRY", "30"))
+        # HTTP/2 needs the optional h2 package (httpx[http2])
+        self.http2 = find_spec("h2") is not None
+
+        self.requests_total = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+        client_kwargs.setdefault("timeout", float(os.getenv("HTTP_TIMEOUT", "30")))
+        self.client = httpx.AsyncClient(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            **client_kwargs,
+        )
+        logger.info(
+            "HTTP pool %s ready (max %d connections, http2=%s)",
+            name,
+            self.max_connections,
+            self.http2,
+        )
+
+    async def request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        self.requests_total += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            return await self.client.request(method, url, **kwargs)
+        finally:
+            self.in_flight -= 1
+
+    @asynccontextmanager
+    async def stream(
+        self, method: str, url: str, **kwargs: Any
+    ) -> AsyncIterator[httpx.Response]:
+        """Streaming request; the connection is held until the block exits"""
+        self.requests_total += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            async with self.client.stream(method, url, **kwargs) as response:
+                yield response
+        finally:
+            self.in_flight -= 1
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    def stats(self) -> dict[str, Any]:
+        """Request counters kept by this wrapper (httpx exposes no pool stats)"""
+        return {
+            "max_connections": self.max_connections,
+            "http2": self.http2,
+            "requests_total": self.requests_total,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            # Above 1.0, requests wait for a connection or share HTTP/2 ones
+            "saturation": round(self.in_flight / self.max_connections, 3),
+        }
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+        logger.info("HTTP pool %s closed", self.name)
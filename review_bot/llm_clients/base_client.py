@@ -1,54 +1,98 @@
+import asyncio
+import hashlib
+import json
 import os
+import time
 from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator
 from typing import Any
 
+from review_bot.http_pool import PooledHTTPClient
+
+
+class EmptyResponseError(RuntimeError):
+    """Raised when a model returns no text."""
+
 
 class BaseLLMClient(ABC):
     """Base class for LLM clients with structured output"""
 
     def __init__(self, model_name: str):
         self.model_name = model_name
+        # Sampling settings sent with every call; part of response cache keys
+        self.generation_params: dict[str, Any] = {}
 
     @abstractmethod
-    def generate_structured_response(
+    async def generate_structured_response(
         self, prompt: str, system_prompt: str
     ) -> dict[str, Any]:
         """Generate structured JSON response from LLM"""
         pass
 
+    async def astream_response(
+        self, prompt: str, system_prompt: str
+    ) -> AsyncIterator[str]:
+        """
+        Yield the response text in chunks as it is generated. Clients without
+        native streaming yield the whole response as a single chunk.
+        """
+        response = await self.generate_structured_response(prompt, system_prompt)
+        yield response.get("response", "")
+
+    async def count_tokens(self, text: str) -> int | None:
+        """Exact token count from the model's tokenizer, if it exposes one"""
+        return None
+
+    async def aclose(self) -> None:  # noqa: B027
+        """Release network resources held by the client (none by default)"""
+
 
 class OllamaClient(BaseLLMClient):
     def __init__(self, model_name: str = "llama3.2"):
         super().__init__(model_name)
         self.base_url = os.getenv("OLLAMA_URL", "http://localhost:11434")
 
-    def generate_structured_response(
+        # Generations are slow, so keep the longer per-request timeout
+        self.http = PooledHTTPClient(f"ollama:{model_name}", timeout=60)
+
+    async def aclose(self) -> None:
+        await self.http.aclose()
+
+    def _payload(self, prompt: str, system_prompt: str, stream: bool) -> dict:
+        # A separate system prompt keeps the shared prefix reusable by
+        # Ollama's prompt cache across calls
+        return {
+            "model": self.model_name,
+            "system": system_prompt,
+            "prompt": prompt,
+            "stream": stream,
+            **({"options": self.generation_params} if self.generation_params else {}),
+        }
+
+    async def generate_structured_response(
         self, prompt: str, system_prompt: str
     ) -> dict[str, Any]:
         import logging
 
-        import requests
-
         logger = logging.getLogger(__name__)
 
-        full_prompt = f"{system_prompt}\n\nUser: {prompt}\n\nAssistant: "
         logger.info(
             "Sending to Ollama API (length: %d): %s...",
-            len(full_prompt),
-            full_prompt[:200],
+            len(prompt),
+            prompt[:200],
         )
 
-        response = requests.post(
+        response = await self.http.post(
             f"{self.base_url}/api/generate",
-            json={"model": self.model_name, "prompt": full_prompt, "stream": False},
-            timeout=60,
+            json=self._payload(prompt, system_prompt, stream=False),
         )
 
         if response.status_code != 200:
             logger.error(
                 "Ollama API error: %d - %s", response.status_code, response.text
             )
-            return {"response": f"Error: Ollama API returned {response.status_code}"}
+            # Raise so the caller can retry instead of posting the error text
+            response.raise_for_status()
 
         result = response.json()
         content = result.get("response", "")
@@ -56,7 +100,32 @@ class OllamaClient(BaseLLMClient):
             "Ollama API response (length: %d): %s...", len(content), content[:200]
         )
 
-        return {"response": content}
+        return {
+            "response": content,
+            "usage": {
+                "prompt_tokens": result.get("prompt_eval_count"),
+                "output_tokens": result.get("eval_count"),
+            },
+        }
+
+    async def astream_response(
+        self, prompt: str, system_prompt: str
+    ) -> AsyncIterator[str]:
+        async with self.http.stream(
+            "POST",
+            f"{self.base_url}/api/generate",
+            json=self._payload(prompt, system_prompt, stream=True),
+        ) as response:
+            response.raise_for_status()
+            # Ollama streams one JSON object per line
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("response"):
+                    yield chunk["response"]
+                if chunk.get("done"):
+                    break
 
 
 class GeminiClient(BaseLLMClient):
@@ -76,31 +145,163 @@ class GeminiClient(BaseLLMClient):
         self.client = genai.Client(api_key=api_key)
         logger.info("Gemini client initialized with model: %s", model_name)
 
-    def generate_structured_response(
+        # Static system prompts are registered once as cached content
+        self.context_cache = os.getenv("GEMINI_CONTEXT_CACHE", "true").lower() == "true"
+        self.context_cache_ttl = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+        # Prompt hash -> (cache name or None if caching was refused, expiry)
+        self._prompt_caches: dict[str, tuple[str | None, float]] = {}
+        self._cache_lock = asyncio.Lock()
+
+    async def aclose(self) -> None:
+        import logging
+
+        for name, _ in self._prompt_caches.values():
+            if name:
+                try:
+                    await self.client.aio.caches.delete(name=name)
+                except Exception as exc:
+                    logging.getLogger(__name__).warning(
+                        "Could not delete cached content %s: %s", name, exc
+                    )
+        await self.client.aio.aclose()
+
+    async def _prompt_cache(self, system_prompt: str) -> str | None:
+        """
+        Name of the cached content holding this system prompt, created on
+        first use and renewed before it expires. None when the model refuses
+        to cache it (e.g. the prompt is below its minimum size).
+        """
+        import logging
+
+        logger = logging.getLogger(__name__)
+
+        prompt_hash = hashlib.sha256(system_prompt.encode()).hexdigest()
+        async with self._cache_lock:
+            entry = self._prompt_caches.get(prompt_hash)
+            if entry and time.monotonic() < entry[1]:
+                return entry[0]
+
+            try:
+                cached = await self.client.aio.caches.create(
+                    model=self.model_name,
+                    config={
+                        "system_instruction": system_prompt,
+                        "ttl": f"{self.context_cache_ttl}s",
+                        "display_name": f"review-bot-{prompt_hash[:12]}",
+                    },
+                )
+                name = cached.name
+                logger.info("Cached system prompt for %s as %s", self.model_name, name)
+            except Exception as exc:
+                # Retry after a TTL; meanwhile send it as system_instruction
+                name = None
+                logger.info(
+                    "Context caching unavailable for %s: %s", self.model_name, exc
+                )
+
+            # Renew a minute early so calls never reference an expired cache
+            self._prompt_caches[prompt_hash] = (
+                name,
+                time.monotonic() + max(self.context_cache_ttl - 60, 0),
+            )
+            return name
+
+    async def _config(self, system_prompt: str) -> dict[str, Any]:
+        """Generation config carrying the system prompt separately from the diff"""
+        config: dict[str, Any] = dict(self.generation_params)
+        name = await self._prompt_cache(system_prompt) if self.context_cache else None
+        if name:
+            config["cached_content"] = name
+        else:
+            config["system_instruction"] = system_prompt
+        return config
+
+    def _drop_prompt_cache(self, config: dict[str, Any], exc: Exception) -> bool:
+        """Forget a cache the API no longer accepts; True if one was dropped"""
+        name = config.get("cached_content")
+        if not name or getattr(exc, "code", None) not in (400, 403, 404):
+            return False
+        self._prompt_caches = {
+            key: entry for key, entry in self._prompt_caches.items() if entry[0] != name
+        }
+        return True
+
+    async def generate_structured_response(
         self, prompt: str, system_prompt: str
     ) -> dict[str, Any]:
         import logging
 
         logger = logging.getLogger(__name__)
 
-        full_prompt = f"{system_prompt}\n\n{prompt}"
         logger.info(
             "Sending to Gemini API (length: %d): %s...",
-            len(full_prompt),
-            full_prompt[:200],
+            len(prompt),
+            prompt[:200],
         )
 
-        response = self.client.models.generate_content(
-            model=self.model_name, contents=[{"parts": [{"text": full_prompt}]}]
-        )
+        config = await self._config(system_prompt)
+        try:
+            response = await self.client.aio.models.generate_content(
+                model=self.model_name,
+                contents=[{"parts": [{"text": prompt}]}],
+                config=config,
+            )
+        except Exception as exc:
+            if not self._drop_prompt_cache(config, exc):
+                raise
+            logger.warning("Cached content rejected, resending system prompt")
+            response = await self.client.aio.models.generate_content(
+                model=self.model_name,
+                contents=[{"parts": [{"text": prompt}]}],
+                config=await self._config(system_prompt),
+            )
 
-        if not response or not response.candidates:
+        content = response.text if response and response.candidates else None
+        if not content:
             logger.error("Empty response from Gemini API")
-            return {"response": "Error: Empty response from Gemini API"}
+            # Raise like the Ollama client so the text is never posted or cached
+            raise EmptyResponseError(f"Empty response from {self.model_name}")
 
-        content = response.candidates[0].content.parts[0].text
+        usage = response.usage_metadata
         logger.info(
-            "Gemini API response (length: %d): %s...", len(content), content[:200]
+            "Gemini API response (length: %d, cached input tokens: %s): %s...",
+            len(content),
+            usage.cached_content_token_count if usage else None,
+            content[:200],
         )
 
-        return {"response": content}
+        return {
+            "response": content,
+            "usage": {
+                "prompt_tokens": usage.prompt_token_count if usage else None,
+                "output_tokens": usage.candidates_token_count if usage else None,
+            },
+        }
+
+    async def count_tokens(self, text: str) -> int | None:
+        result = await self.client.aio.models.count_tokens(
+            model=self.model_name, contents=[{"parts": [{"text": text}]}]
+        )
+        return result.total_tokens
+
+    async def astream_response(
+        self, prompt: str, system_prompt: str
+    ) -> AsyncIterator[str]:
+        config = await self._config(system_prompt)
+        try:
+            stream = await self.client.aio.models.generate_content_stream(
+                model=self.model_name,
+                contents=[{"parts": [{"text": prompt}]}],
+                config=config,
+            )
+        except Exception as exc:
+            if not self._drop_prompt_cache(config, exc):
+                raise
+            stream = await self.client.aio.models.generate_content_stream(
+                model=self.model_name,
+                contents=[{"parts": [{"text": prompt}]}],
+                config=await self._config(system_prompt),
+            )
+        async for chunk in stream:
+            if chunk.text:
+                yield chunk.text
@@ -0,0 +1,79 @@
+import json
+import logging
+from collections.abc import AsyncIterator
+from functools import lru_cache
+from typing import Any
+
+from review_bot.llm_clients.base_client import BaseLLMClient
+from review_bot.llm_clients.resilience import get_breaker
+from review_bot.services.cache_service import TieredCache, content_hash
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=64)
+def _prefix_hash(system_prompt: str) -> str:
+    # System prompts are long and shared by every call, so hash them once
+    return content_hash(system_prompt)
+
+
+def _cacheable(text: str | None) -> bool:
+    """Empty output and error text must not be replayed for days"""
+    return bool(text and text.strip()) and not text.startswith("Error:")
+
+
+class CachedLLMClient(BaseLLMClient):
+    """
+    Serves repeated calls from a TieredCache. Keys hash the model, its
+    generation params, the system prompt and the prompt. Fallback output
+    from another model, empty output and error text are never stored.
+    """
+
+    def __init__(self, client: BaseLLMClient, cache: TieredCache):
+        super().__init__(client.model_name)
+        self.client = client
+        self.cache = cache
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    async def count_tokens(self, text: str) -> int | None:
+        return await self.client.count_tokens(text)
+
+    def cache_key(self, prompt: str, system_prompt: str) -> str:
+        params = json.dumps(self.client.generation_params, sort_keys=True)
+        return content_hash(
+            self.model_name, params, _prefix_hash(system_prompt), content_hash(prompt)
+        )
+
+    async def generate_structured_response(
+        self, prompt: str, system_prompt: str
+    ) -> dict[str, Any]:
+        key = self.cache_key(prompt, system_prompt)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            return {"response": cached, "cached": True}
+
+        response = await self.client.generate_structured_response(prompt, system_prompt)
+        if not response.get("fallback") and _cacheable(response.get("response")):
+            await self.cache.set(key, response["response"])
+        return response
+
+    async def astream_response(
+        self, prompt: str, system_prompt: str
+    ) -> AsyncIterator[str]:
+        key = self.cache_key(prompt, system_prompt)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+        chunks = []
+        async for chunk in self.client.astream_response(prompt, system_prompt):
+            chunks.append(chunk)
+            yield chunk
+        # Streams do not say which model answered; an open circuit means
+        # the chunks came from the fallback
+        text = "".join(chunks)
+        if get_breaker(self.model_name).state == "closed" and _cacheable(text):
+            await self.cache.set(key, text)
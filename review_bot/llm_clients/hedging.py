@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+from typing import Any
+
+from review_bot.llm_clients.base_client import BaseLLMClient
+from review_bot.llm_clients.limiter import queue_events
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies for one model"""
+
+    def __init__(self, window: int):
+        self.samples: deque[float] = deque(maxlen=window)
+        self.hedges_sent = 0
+        self.hedges_won = 0
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, pct: float) -> float | None:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * pct / 100))
+        return ordered[index]
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "samples": len(self.samples),
+            "hedges_sent": self.hedges_sent,
+            "hedges_won": self.hedges_won,
+            **{
+                f"p{pct}": round(value, 3)
+                for pct in (50, 90, 95, 99)
+                if (value := self.percentile(pct)) is not None
+            },
+        }
+
+
+# One latency window per model, shared by every client that calls it
+_trackers: dict[str, LatencyTracker] = {}
+
+
+def get_latency_tracker(model_name: str) -> LatencyTracker:
+    if model_name not in _trackers:
+        _trackers[model_name] = LatencyTracker(
+            int(os.getenv("LLM_LATENCY_WINDOW", "200"))
+        )
+    return _trackers[model_name]
+
+
+def latency_stats() -> dict[str, dict[str, Any]]:
+    return {name: tracker.stats() for name, tracker in _trackers.items()}
+
+
+class HedgedLLMClient(BaseLLMClient):
+    """
+    Sends a duplicate request when a call runs past a percentile of the
+    model's recent latency. The hedge goes to `hedge_client` (the same
+    client by default); the first successful answer wins and the other
+    request is cancelled. No hedging happens until enough samples exist.
+    Streaming calls pass straight through. Both clients should be rate
+    limited themselves, so the hedge is counted against the model it
+    actually calls.
+    """
+
+    def __init__(
+        self, client: BaseLLMClient, hedge_client: BaseLLMClient | None = None
+    ):
+        super().__init__(client.model_name)
+        self.client = client
+        self.hedge_client = hedge_client or client
+        self.percentile = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+        self.min_samples = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+        self.min_delay = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1"))
+        self.tracker = get_latency_tracker(client.model_name)
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+        if self.hedge_client is not self.client:
+            await self.hedge_client.aclose()
+
+    async def count_tokens(self, text: str) -> int | None:
+        return await self.client.count_tokens(text)
+
+    def hedge_delay(self) -> float | None:
+        if len(self.tracker.samples) < self.min_samples:
+            return None
+        return max(self.min_delay, self.tracker.percentile(self.percentile))
+
+    async def _timed_call(
+        self, client: BaseLLMClient, prompt: str, system_prompt: str
+    ) -> dict[str, Any]:
+        started = time.monotonic()
+        outer = queue_events.get()
+
+        def queue_event(queued: bool) -> None:
+            # Time spent waiting for the model's limiter is not latency
+            nonlocal started
+            started = time.monotonic()
+            if outer:
+                outer(queued)
+
+        token = queue_events.set(queue_event)
+        try:
+            response = await client.generate_structured_response(prompt, system_prompt)
+        finally:
+            queue_events.reset(token)
+        # Only successes: quick failures and cancelled losers would drag the
+        # percentile, and so the hedge delay, down
+        get_latency_tracker(client.model_name).record(time.monotonic() - started)
+        return response
+
+    async def generate_structured_response(
+        self, prompt: str, system_prompt: str
+    ) -> dict[str, Any]:
+        primary = asyncio.create_task(
+            self._timed_call(self.client, prompt, system_prompt)
+        )
+        tasks = {primary}
+        try:
+            delay = self.hedge_delay()
+            if delay is not None and not (await asyncio.wait(tasks, timeout=delay))[0]:
+                self.tracker.hedges_sent += 1
+                logger.info(
+                    "%s slower than p%g (%.1fs), sending hedge to %s",
+                    self.model_name,
+                    self.percentile,
+                    delay,
+                    self.hedge_client.model_name,
+                )
+                tasks.add(
+                    asyncio.create_task(
+                        self._timed_call(self.hedge_client, prompt, system_prompt)
+                    )
+                )
+
+            # The first answer that did not fail wins
+            pending, error = tasks, None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                    elif task is primary:
+                        return task.result()
+                    else:
+                        self.tracker.hedges_won += 1
+                        return self._mark(task.result())
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def astream_response(
+        self, prompt: str, system_prompt: str
+    ) -> AsyncIterator[str]:
+        # Streams are not hedged: chunks already shown cannot be swapped
+        async for chunk in self.client.astream_response(prompt, system_prompt):
+            yield chunk
+
+    def _mark(self, response: dict[str, Any]) -> dict[str, Any]:
+        if self.hedge_client.model_name == self.model_name:
+            return response
+        return {**response, "fallback": self.hedge_client.model_name}
@@ -0,0 +1,143 @@
+import json
+import logging
+import os
+from collections.abc import AsyncIterator, Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any
+
+from review_bot.llm_clients.base_client import BaseLLMClient
+from review_bot.services.rate_limiter import (
+    Priority,
+    PrioritySemaphore,
+    PriorityTokenBucket,
+)
+from review_bot.services.sharding import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Priority of the LLM calls made in the current context (and tasks it spawns)
+request_priority: ContextVar[Priority] = ContextVar(
+    "llm_request_priority", default=Priority.NORMAL
+)
+
+# Called with True when a call starts waiting for a model's limiter and with
+# False once it is let through, so layers above can leave queueing time out
+# of their deadlines and latencies
+queue_events: ContextVar[Callable[[bool], None] | None] = ContextVar(
+    "llm_queue_events", default=None
+)
+
+
+@contextmanager
+def llm_priority(priority: Priority) -> Iterator[None]:
+    """Run the enclosed LLM calls at the given priority"""
+    token = request_priority.set(priority)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+
+class ModelLimiter:
+    """
+    Caps one model's in-flight calls, requests per minute and (estimated)
+    prompt tokens per minute. Every queue serves higher priorities first.
+    """
+
+    def __init__(self, model_name: str, concurrency: int, rpm: float, tpm: float):
+        self.model_name = model_name
+        self.slots = PrioritySemaphore(concurrency)
+        # Allow a full minute's budget as burst, refilled continuously
+        self.requests = PriorityTokenBucket(f"{model_name}:rpm", rpm / 60, rpm)
+        self.tokens = PriorityTokenBucket(f"{model_name}:tpm", tpm / 60, tpm)
+
+    async def acquire(self, priority: Priority, prompt_tokens: int) -> None:
+        listener = queue_events.get()
+        if listener:
+            listener(True)
+        await self.requests.acquire(priority)
+        await self.tokens.acquire(priority, prompt_tokens)
+        await self.slots.acquire(priority)
+        if listener:
+            listener(False)
+
+    async def release(self) -> None:
+        await self.slots.release()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            **self.slots.stats(),
+            "requests": self.requests.stats(),
+            "tokens": self.tokens.stats(),
+        }
+
+
+# One limiter per model, shared by every client that calls it
+_limiters: dict[str, ModelLimiter] = {}
+
+
+def get_model_limiter(model_name: str) -> ModelLimiter:
+    if model_name not in _limiters:
+        # Per-model overrides, e.g. {"gemini-1.5-pro": {"rpm": 150}}
+        overrides = json.loads(os.getenv("LLM_MODEL_LIMITS") or "{}").get(
+            model_name, {}
+        )
+        _limiters[model_name] = ModelLimiter(
+            model_name,
+            concurrency=int(
+                overrides.get("concurrency", os.getenv("LLM_MAX_CONCURRENCY", "4"))
+            ),
+            rpm=float(overrides.get("rpm", os.getenv("LLM_REQUESTS_PER_MINUTE", "60"))),
+            tpm=float(
+                overrides.get("tpm", os.getenv("LLM_TOKENS_PER_MINUTE", "1000000"))
+            ),
+        )
+    return _limiters[model_name]
+
+
+def limiter_stats() -> dict[str, dict[str, Any]]:
+    return {name: limiter.stats() for name, limiter in _limiters.items()}
+
+
+class RateLimitedLLMClient(BaseLLMClient):
+    """
+    Queues requests behind the model's limiter at the context's priority
+    (see llm_priority). Wraps a concrete client, so every request sent to a
+    model (retries, hedges and fallbacks included) is counted against that
+    model's limits; the slot is held until the request, or its stream, ends.
+    """
+
+    def __init__(self, client: BaseLLMClient):
+        super().__init__(client.model_name)
+        self.client = client
+        self.limiter = get_model_limiter(client.model_name)
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    async def count_tokens(self, text: str) -> int | None:
+        return await self.client.count_tokens(text)
+
+    async def generate_structured_response(
+        self, prompt: str, system_prompt: str
+    ) -> dict[str, Any]:
+        await self.limiter.acquire(
+            request_priority.get(), estimate_tokens(system_prompt + prompt)
+        )
+        try:
+            return await self.client.generate_structured_response(prompt, system_prompt)
+        finally:
+            await self.limiter.release()
+
+    async def astream_response(
+        self, prompt: str, system_prompt: str
+    ) -> AsyncIterator[str]:
+        await self.limiter.acquire(
+            request_priority.get(), estimate_tokens(system_prompt + prompt)
+        )
+        try:
+            async for chunk in self.client.astream_response(prompt, system_prompt):
+                yield chunk
+        finally:
+            await self.limiter.release()
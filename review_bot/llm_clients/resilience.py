@@ -0,0 +1,327 @@
+import asyncio
+import logging
+import math
+import os
+import random
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Any
+
+import httpx
+
+from review_bot.llm_clients.base_client import BaseLLMClient
+from review_bot.llm_clients.limiter import queue_events
+
+logger = logging.getLogger(__name__)
+
+# Throttling and transient server-side failures
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised when a model's circuit breaker is open and there is no fallback."""
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Timeouts, connection errors and throttling/5xx API errors"""
+    if isinstance(exc, TimeoutError | httpx.TransportError):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in RETRYABLE_STATUS
+    # google.genai errors carry the HTTP status as .code
+    code = getattr(exc, "code", None)
+    return isinstance(code, int) and code in RETRYABLE_STATUS
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `failure_threshold` consecutive failures. Once
+    `reset_timeout` has passed a single probe call is let through
+    (half-open); it closes the breaker on success or reopens it on failure.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if (
+            self.state == "open"
+            and time.monotonic() - self.opened_at >= self.reset_timeout
+        ):
+            self.state = "half_open"
+            logger.info("Circuit for %s half-open, sending a probe call", self.name)
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self) -> None:
+        if self.state != "closed":
+            logger.info("Circuit for %s closed", self.name)
+        self.state = "closed"
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or (
+            self.state == "closed" and self.failures >= self.failure_threshold
+        ):
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.times_opened += 1
+            logger.warning(
+                "Circuit for %s opened after %d failures", self.name, self.failures
+            )
+
+    def record_cancelled(self) -> None:
+        """
+        A call was cancelled before it finished. A cancelled probe proves
+        nothing, so the breaker reopens and waits before the next one.
+        """
+        if self.state == "half_open":
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            logger.info("Circuit for %s probe cancelled, reopened", self.name)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+# One breaker per model, shared by every client that calls it
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(model_name: str) -> CircuitBreaker:
+    if model_name not in _breakers:
+        _breakers[model_name] = CircuitBreaker(
+            model_name,
+            failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+            reset_timeout=float(os.getenv("LLM_BREAKER_RESET", "60")),
+        )
+    return _breakers[model_name]
+
+
+def breaker_stats() -> dict[str, dict[str, Any]]:
+    return {name: breaker.stats() for name, breaker in _breakers.items()}
+
+
+class _Deadline:
+    """
+    A call's deadline, in event loop time. It runs from the start of the
+    call, but is held while the call waits for its model's limiter and
+    restarts once the first request is let through, so queueing does not
+    count against it.
+    """
+
+    def __init__(self, seconds: float):
+        self.loop = asyncio.get_running_loop()
+        self.seconds = seconds
+        self.at: float | None = self.loop.time() + seconds
+        self.started = False
+        self._scope: asyncio.Timeout | None = None
+
+    def remaining(self) -> float:
+        return math.inf if self.at is None else self.at - self.loop.time()
+
+    def _queue_event(self, queued: bool) -> None:
+        if self.started:
+            return
+        if queued:
+            self.at = None
+        else:
+            self.started = True
+            self.at = self.loop.time() + self.seconds
+        if self._scope:
+            self._scope.reschedule(self.at)
+
+    @asynccontextmanager
+    async def attempt(self) -> AsyncIterator[None]:
+        """Bound one attempt by the deadline"""
+        async with asyncio.timeout_at(self.at) as scope:
+            self._scope = scope
+            token = queue_events.set(self._queue_event)
+            try:
+                yield
+            finally:
+                queue_events.reset(token)
+                self._scope = None
+
+
+class ResilientLLMClient(BaseLLMClient):
+    """
+    Wraps any BaseLLMClient with a per-call deadline, jittered exponential
+    backoff on retryable errors and the model's circuit breaker. While the
+    breaker is open, calls go to the fallback client if one is configured
+    and fail fast otherwise. Fallback responses are marked "fallback".
+    """
+
+    def __init__(self, client: BaseLLMClient, fallback: BaseLLMClient | None = None):
+        super().__init__(client.model_name)
+        self.client = client
+        self.fallback = fallback
+        self.breaker = get_breaker(client.model_name)
+        self.deadline = float(os.getenv("LLM_CALL_DEADLINE", "120"))
+        self.max_retries = int(os.getenv("LLM_MAX_RETRIES", "3"))
+        self.base_delay = float(os.getenv("LLM_RETRY_BASE_DELAY", "1"))
+        self.max_delay = float(os.getenv("LLM_RETRY_MAX_DELAY", "30"))
+
+    async def aclose(self) -> None:
+        # The fallback may be shared, so its owner closes it
+        await self.client.aclose()
+
+    async def count_tokens(self, text: str) -> int | None:
+        return await self.client.count_tokens(text)
+
+    def _retry_delay(self, exc: Exception, attempt: int, deadline: _Deadline) -> float:
+        """
+        Record a failed attempt and return how long to wait before the next
+        one. Re-raises `exc` when the call should not be retried.
+        """
+        if not is_retryable(exc):
+            # The request itself is bad; the model is fine
+            self.breaker.record_success()
+            raise exc
+        self.breaker.record_failure()
+
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        if (
+            attempt > self.max_retries
+            or self.breaker.state == "open"
+            or delay >= deadline.remaining()
+        ):
+            logger.warning(
+                "%s failed after %d attempts: %r", self.model_name, attempt, exc
+            )
+            raise exc
+        logger.info("Retrying %s in %.1fs after %r", self.model_name, delay, exc)
+        return delay
+
+    def _fallback_ready(self) -> bool:
+        return self.fallback is not None and self.breaker.state == "open"
+
+    async def generate_structured_response(
+        self, prompt: str, system_prompt: str
+    ) -> dict[str, Any]:
+        if not self.breaker.allow():
+            return await self._use_fallback(prompt, system_prompt)
+
+        deadline = _Deadline(self.deadline)
+        attempt = 0
+        while True:
+            try:
+                async with deadline.attempt():
+                    response = await self.client.generate_structured_response(
+                        prompt, system_prompt
+                    )
+            except Exception as exc:
+                attempt += 1
+                try:
+                    delay = self._retry_delay(exc, attempt, deadline)
+                except Exception:
+                    if self._fallback_ready():
+                        return await self._use_fallback(prompt, system_prompt)
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                self.breaker.record_cancelled()
+                raise
+
+            self.breaker.record_success()
+            return response
+
+    async def astream_response(
+        self, prompt: str, system_prompt: str
+    ) -> AsyncIterator[str]:
+        """
+        Stream with the same deadline and breaker. Only failures before the
+        first chunk are retried or sent to the fallback, since chunks that
+        were already yielded cannot be taken back.
+        """
+        if not self.breaker.allow():
+            async for chunk in self._stream_fallback(prompt, system_prompt):
+                yield chunk
+            return
+
+        deadline = _Deadline(self.deadline)
+        attempt = 0
+        while True:
+            stream = self.client.astream_response(prompt, system_prompt)
+            started = False
+            try:
+                while True:
+                    try:
+                        async with deadline.attempt():
+                            chunk = await anext(stream)
+                    except StopAsyncIteration:
+                        break
+                    started = True
+                    yield chunk
+            except Exception as exc:
+                if started:
+                    if is_retryable(exc):
+                        self.breaker.record_failure()
+                    raise
+                attempt += 1
+                try:
+                    delay = self._retry_delay(exc, attempt, deadline)
+                except Exception:
+                    if not self._fallback_ready():
+                        raise
+                    async for chunk in self._stream_fallback(prompt, system_prompt):
+                        yield chunk
+                    return
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled, or the caller stopped reading the stream
+                if started:
+                    self.breaker.record_success()
+                else:
+                    self.breaker.record_cancelled()
+                raise
+            finally:
+                await stream.aclose()
+
+            self.breaker.record_success()
+            return
+
+    async def _use_fallback(self, prompt: str, system_prompt: str) -> dict[str, Any]:
+        if not self.fallback:
+            raise CircuitOpenError(f"Circuit for {self.model_name} is open")
+        logger.warning(
+            "Circuit for %s is open, using %s",
+            self.model_name,
+            self.fallback.model_name,
+        )
+        response = await self.fallback.generate_structured_response(
+            prompt, system_prompt
+        )
+        return {**response, "fallback": self.fallback.model_name}
+
+    async def _stream_fallback(
+        self, prompt: str, system_prompt: str
+    ) -> AsyncIterator[str]:
+        if not self.fallback:
+            raise CircuitOpenError(f"Circuit for {self.model_name} is open")
+        logger.warning(
+            "Circuit for %s is open, streaming from %s",
+            self.model_name,
+            self.fallback.model_name,
+        )
+        async for chunk in self.fallback.astream_response(prompt, system_prompt):
+            yield chunk
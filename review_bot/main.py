@@ -2,13 +2,25 @@
 import asyncio
 import logging
 import os
+from contextlib import asynccontextmanager
 
+import httpx
 from fastapi import FastAPI, Request
 from pydantic import BaseModel
 
-from review_bot.services.github_service import GitHubService
+from review_bot.llm_clients.hedging import latency_stats
+from review_bot.llm_clients.limiter import limiter_stats
+from review_bot.llm_clients.resilience import breaker_stats
+from review_bot.services.async_memory_service import AsyncPostgresMemoryService
+from review_bot.services.cache_service import TieredCache
+from review_bot.services.diff_utils import merge_diffs
+from review_bot.services.github_graphql_service import create_github_service
+from review_bot.services.github_service import find_issue_refs
+from review_bot.services.job_queue import JobWorkerPool, PostgresJobQueue
 from review_bot.services.langgraph_service import ReviewWorkflow
 from review_bot.services.memory_service import PostgresMemoryService
+from review_bot.services.rate_limiter import Priority
+from review_bot.services.review_coalescer import ReviewCoalescer
 
 # Configure logging first
 logging.basicConfig(level=logging.INFO)
@@ -41,22 +53,35 @@ github_tool = None
 review_workflow = None
 memory_service = None
 
-github_tool = GitHubService()
+github_tool = create_github_service()
 logger.info("GitHub service initialized")
 
-review_workflow = ReviewWorkflow()
-logger.info("Review workflow initialized")
-
-# Try to initialize memory service, but don't crash if DB unavailable
+# Try to initialize memory service, but don't crash if DB unavailable.
+# Request handlers use the async service; the job queue and the LLM cache
+# run their (blocking) queries in threads on the sync one.
 memory_service = None
+review_store = None
 if os.getenv("DATABASE_URL") or os.getenv("DB_HOST"):
     memory_service = PostgresMemoryService()
+    review_store = AsyncPostgresMemoryService()
     logger.info("Memory service initialized")
 else:
     logger.warning("No database configuration found - memory service disabled")
 
+# LLM responses are cached in-process and, with a database, in Postgres
+llm_cache = TieredCache("llm", memory_service)
+review_workflow = ReviewWorkflow(
+    llm_cache=llm_cache, github_service=github_tool, review_store=review_store
+)
+logger.info("Review workflow initialized")
+
 
-async def process_review_workflow(project_id: int, pr_number: int):
+async def process_review_workflow(
+    project_id: int,
+    pr_number: int,
+    head_sha: str | None = None,
+    issue_refs: list[str] | None = None,
+):
     if not github_tool:
         logger.error("GitHub service not initialized")
         return
@@ -64,18 +89,97 @@ async def process_review_workflow(project_id: int, pr_number: int):
         logger.error("Review workflow not initialized")
         return
 
-    logger.info("STARTING review for PR #%d", pr_number)
+    logger.info("STARTING review for PR #%d (head %s)", pr_number, head_sha)
 
-    # --- 1. Use the new Tool to fetch the code diff ---
-    diff_text = github_tool.fetch_pr_diff(pr_number)
-    if not diff_text or diff_text.startswith("Error fetching"):
-        logger.error("Failed to fetch diff for PR #%d", pr_number)
+    # --- 1. Review only what changed since the last reviewed commit ---
+    previous_sha = None
+    if review_store and head_sha:
+        previous_sha = await review_store.load_last_reviewed_sha(project_id, pr_number)
+    if previous_sha and previous_sha == head_sha:
+        logger.info("PR #%d already reviewed at %s", pr_number, head_sha)
         return
+
+    diff = None
+    previous_diff = previous_review = None
+    if previous_sha:
+        diff = await github_tool.fetch_compare_diff(
+            pr_number, previous_sha, head_sha, issue_refs
+        )
+        if diff is not None:
+            previous_diff, previous_review = await review_store.load_review_context(
+                project_id, pr_number
+            )
+    incremental = diff is not None and previous_diff is not None
+
+    if incremental:
+        logger.info(
+            "Incremental review of PR #%d from %s to %s",
+            pr_number,
+            previous_sha,
+            head_sha,
+        )
+        if not diff.files:
+            logger.info("No reviewable changes since %s", previous_sha)
+            await review_store.save_review_context(
+                project_id,
+                pr_number,
+                previous_diff,
+                previous_review,
+                head_sha=head_sha,
+            )
+            return
+    else:
+        # --- Use the new Tool to fetch the code diff ---
+        try:
+            diff = await github_tool.fetch_pr_diff_model(pr_number, issue_refs)
+        except httpx.HTTPStatusError as exc:
+            logger.error("Failed to fetch diff for PR #%d", pr_number)
+            # Raise so the job queue retries with backoff
+            raise RuntimeError(
+                f"Error fetching PR diff: HTTP {exc.response.status_code}"
+            ) from exc
+        if not diff.files and diff.skipped:
+            # Nothing left to review once lockfiles etc. are set aside
+            logger.info(
+                "Skipping review of PR #%d, every changed file is skipped: %s",
+                pr_number,
+                ", ".join(diff.skipped),
+            )
+            return
+        if not diff.files:
+            logger.error("Failed to fetch diff for PR #%d", pr_number)
+            raise RuntimeError("Empty diff")
+    diff_text = diff.render()
     logger.info("Successfully fetched diff (Size: %d characters)", len(diff_text))
 
-    # --- 2. Run LangGraph workflow ---
-    logger.info("Starting LangGraph workflow for PR #%d", pr_number)
-    result = review_workflow.run_review(project_id, pr_number, diff_text)
+    # A retry edits the comment the failed attempt posted, and does not
+    # post again if that attempt got as far as posting the review
+    comment_id = posted_review = None
+    if review_store and head_sha:
+        posted = await review_store.load_review_comment(project_id, pr_number, head_sha)
+        if posted:
+            comment_id, posted_review = posted
+
+    if posted_review is not None:
+        logger.info(
+            "Review of %s already posted in comment %d, saving context only",
+            head_sha,
+            comment_id,
+        )
+        result = {"judge_output": posted_review}
+    else:
+        # --- 2. Run LangGraph workflow ---
+        logger.info("Starting LangGraph workflow for PR #%d", pr_number)
+        result = await review_workflow.run_review(
+            project_id,
+            pr_number,
+            diff_text,
+            previous_review=previous_review if incremental else None,
+            previous_head_sha=previous_sha if incremental else None,
+            diff=diff,
+            head_sha=head_sha,
+            comment_id=comment_id,
+        )
 
     logger.info("Workflow result keys: %s", list(result.keys()))
 
@@ -89,16 +193,118 @@ async def process_review_workflow(project_id: int, pr_number: int):
             len(final_review) if final_review else 0,
         )
 
-        if memory_service:
-            success = memory_service.save_review_context(
-                project_id, pr_number, diff_text, final_review
+        if review_store:
+            # Keep untouched files from the earlier diff for justification
+            context_diff = (
+                merge_diffs(previous_diff, diff_text) if incremental else diff_text
+            )
+            success = await review_store.save_review_context(
+                project_id,
+                pr_number,
+                context_diff,
+                final_review,
+                head_sha=head_sha,
             )
             logger.info("Saved review context: %s", success)
 
     logger.info("COMPLETED review for PR #%d", pr_number)
 
 
-app = FastAPI(title="AI Code Review Bot")
+async def run_review_job(payload: dict) -> None:
+    """Run a queued review unless a newer push to the PR superseded it"""
+    await review_coalescer.run(
+        (payload["repo_name"], payload["pr_number"]),
+        payload.get("head_sha"),
+        lambda: process_review_workflow(
+            payload["project_id"],
+            payload["pr_number"],
+            payload.get("head_sha"),
+            payload.get("issue_refs"),
+        ),
+    )
+
+
+async def run_feedback_job(payload: dict) -> None:
+    await process_human_feedback(**payload)
+
+
+JOB_HANDLERS = {"review": run_review_job, "feedback": run_feedback_job}
+
+# Durable job queue; without a database we fall back to in-process tasks
+job_workers = None
+if memory_service:
+    job_workers = JobWorkerPool(PostgresJobQueue(memory_service), JOB_HANDLERS)
+    logger.info("Job queue initialized")
+
+# Keep references so fallback tasks are not garbage collected mid-run
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _log_task_result(task: asyncio.Task) -> None:
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.error("Background job failed", exc_info=task.exception())
+
+
+async def submit_job(
+    job_type: str,
+    payload: dict,
+    dedupe_key: str | None = None,
+    priority: Priority = Priority.NORMAL,
+) -> None:
+    """Queue work durably when a database is available"""
+    if job_workers:
+        await job_workers.enqueue(job_type, payload, dedupe_key, priority)
+        return
+
+    task = asyncio.create_task(JOB_HANDLERS[job_type](payload))
+    _background_tasks.add(task)
+    task.add_done_callback(_log_task_result)
+
+
+def review_dedupe_key(repo_name: str, pr_number: int) -> str:
+    return f"review:{repo_name}:{pr_number}"
+
+
+async def submit_review(payload: dict) -> None:
+    await submit_job(
+        "review",
+        payload,
+        dedupe_key=review_dedupe_key(payload["repo_name"], payload["pr_number"]),
+    )
+
+
+async def queued_review_sha(key: tuple[str, int]) -> str | None:
+    """Head SHA of a review of the PR still waiting in the job queue"""
+    if not job_workers:
+        return None
+    payload = await job_workers.pending_payload(review_dedupe_key(*key))
+    return payload.get("head_sha") if payload else None
+
+
+# Debounce bursts of pushes per PR before they reach the queue
+review_coalescer = ReviewCoalescer(submit_review, queued_sha=queued_review_sha)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if review_store:
+        await review_store.open()
+    if job_workers:
+        job_workers.start()
+    yield
+    await review_coalescer.flush()
+    if job_workers:
+        await job_workers.stop()
+    await review_workflow.aclose()
+    await github_tool.aclose()
+    if review_store:
+        await review_store.close()
+    if memory_service:
+        memory_service.close()
+
+
+app = FastAPI(title="AI Code Review Bot", lifespan=lifespan)
 
 
 @app.post("/webhook/pull_request")
@@ -127,10 +333,24 @@ async def handle_pull_request(pr_event: GitHubPullRequest, request: Request):
 
     logger.info("Received PR Webhook: Repository %s, PR #%d", repo_name, pr_number)
 
-    # 2. Crucial: Respond immediately and process heavy work asynchronously
-    asyncio.create_task(
-        process_review_workflow(0, pr_number)
-    )  # Use 0 as dummy project_id
+    # 2. Crucial: Respond immediately and process heavy work asynchronously.
+    # Pushes wait out a quiet window so rapid commits coalesce into one review
+    head_sha = pr_event.pull_request.get("head", {}).get("sha")
+    review_coalescer.schedule(
+        (repo_name, pr_number),
+        head_sha,
+        {
+            "project_id": 0,  # Use 0 as dummy project_id
+            "pr_number": pr_number,
+            "head_sha": head_sha,
+            "repo_name": repo_name,
+            # Saves reading the PR back just to find its linked issues
+            "issue_refs": find_issue_refs(
+                pr_event.pull_request.get("title"), pr_event.pull_request.get("body")
+            ),
+        },
+        debounce=pr_event.action == "synchronize",
+    )
 
     return {
         "status": "accepted",
@@ -140,7 +360,7 @@ async def handle_pull_request(pr_event: GitHubPullRequest, request: Request):
 
 async def process_human_feedback(project_id: int, pr_number: int, human_comment: str):
     """Process human feedback on AI review"""
-    if not memory_service:
+    if not review_store:
         logger.error("Memory service not initialized")
         return
     if not review_workflow:
@@ -154,7 +374,7 @@ async def process_human_feedback(project_id: int, pr_number: int, human_comment:
     )
 
     # Load context from PostgreSQL
-    diff_text, ai_review = memory_service.load_review_context(project_id, pr_number)
+    diff_text, ai_review = await review_store.load_review_context(project_id, pr_number)
 
     if not diff_text:
         logger.warning(
@@ -163,7 +383,7 @@ async def process_human_feedback(project_id: int, pr_number: int, human_comment:
         return
 
     # Run justification workflow
-    result = review_workflow.run_justification(
+    result = await review_workflow.run_justification(
         project_id, pr_number, diff_text, ai_review, human_comment
     )
     if result.get("error_message"):
@@ -196,20 +416,25 @@ async def handle_comment(comment_event: GitHubComment, request: Request):
 
     logger.info("Received comment webhook: Repository %s, PR #%d", repo_name, pr_number)
 
-    # Process feedback asynchronously
-    asyncio.create_task(process_human_feedback(0, pr_number, comment_body))
+    # Process feedback asynchronously, ahead of queued reviews: a human is
+    # waiting for the reply
+    await submit_job(
+        "feedback",
+        {"project_id": 0, "pr_number": pr_number, "human_comment": comment_body},
+        priority=Priority.HIGH,
+    )
 
     return {"status": "accepted", "message": f"Processing feedback for PR #{pr_number}"}
 
 
 @app.get("/")
-def health_check():
+async def health_check():
     services_status = {
         "github_service": github_tool is not None,
         "review_workflow": review_workflow is not None,
-        "memory_service": memory_service is not None,
-        "database_connection": memory_service.health_check()
-        if memory_service
+        "memory_service": review_store is not None,
+        "database_connection": await review_store.health_check()
+        if review_store
         else False,
     }
 
@@ -220,3 +445,19 @@ def health_check():
         "service": "AI Code Review Bot",
         "services": services_status,
     }
+
+
+@app.get("/stats")
+async def stats():
+    return {
+        "github_http_pool": github_tool.pool_stats(),
+        "db_pool": memory_service.pool_stats() if memory_service else None,
+        "db_async_pool": review_store.pool_stats() if review_store else None,
+        "github_rate_limit": github_tool.rate_limit_stats(),
+        "llm_circuit_breakers": breaker_stats(),
+        "llm_latency": latency_stats(),
+        "llm_limits": limiter_stats(),
+        "llm_cache": llm_cache.stats(),
+        "llm_tokens": review_workflow.tokens.stats(),
+        "review_storage": await review_store.storage_stats() if review_store else None,
+    }
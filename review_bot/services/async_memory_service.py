@@ -0,0 +1,293 @@
+import asyncio
+import logging
+import os
+
+import psycopg
+import zstandard
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+
+from review_bot.services.memory_service import (
+    COLLECT_BLOBS,
+    SAVE_REVIEW,
+    SCHEMA,
+    STORAGE_STATS,
+    chunk_hash,
+    connection_params,
+    diff_chunks,
+    join_chunks,
+    storage_stats_row,
+)
+
+logger = logging.getLogger(__name__)
+
+# The review row and its diff chunks, in order, in one round trip
+LOAD_REVIEW = """
+    SELECT r.diff_text, r.diff_chunks, r.final_review_text,
+        ARRAY(
+            SELECT b.data
+            FROM unnest(r.diff_chunks) WITH ORDINALITY AS c(hash, position)
+            JOIN diff_blobs b ON b.hash = c.hash
+            ORDER BY c.position
+        ) AS chunk_data
+    FROM mr_reviews r
+    WHERE r.project_id = %s AND r.mr_iid = %s
+"""
+
+
+def _conninfo() -> str:
+    params = connection_params()
+    if isinstance(params, str):
+        return params
+    params = dict(params)
+    params["dbname"] = params.pop("database")
+    return make_conninfo(**params)
+
+
+class AsyncPostgresMemoryService:
+    """
+    PostgresMemoryService for the event loop, on psycopg 3 with an async
+    connection pool. The save and load queries are prepared on every
+    connection and a save's writes are sent as one pipeline. Same tables
+    and methods as the sync service, awaited, plus the review comment
+    bookkeeping of the request path; call open() before use.
+    """
+
+    def __init__(self):
+        self.pool = self._create_pool()
+        self.compressor = zstandard.ZstdCompressor(
+            level=int(os.getenv("DIFF_ZSTD_LEVEL", "9"))
+        )
+        self.decompressor = zstandard.ZstdDecompressor()
+        self.blob_gc_every = int(os.getenv("DIFF_BLOB_GC_EVERY", "100"))
+        self._saves = 0
+
+    @staticmethod
+    def _create_pool() -> AsyncConnectionPool:
+        # Sized separately from the sync pool; the two together make up the
+        # process's connection budget
+        return AsyncConnectionPool(
+            _conninfo(),
+            min_size=int(os.getenv("DB_ASYNC_POOL_MIN_SIZE", "1")),
+            max_size=int(os.getenv("DB_ASYNC_POOL_MAX_SIZE", "5")),
+            max_lifetime=float(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+            timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+            check=AsyncConnectionPool.check_connection,
+            open=False,
+        )
+
+    async def open(self) -> None:
+        """Open the pool and create the tables if needed"""
+        max_retries = 5
+
+        for attempt in range(max_retries):
+            try:
+                await self.pool.open(wait=True, timeout=10)
+                async with self.pool.connection() as conn:
+                    for statement in SCHEMA:
+                        await conn.execute(statement)
+            except (PoolTimeout, psycopg.OperationalError):
+                logger.warning("Database connection attempt %d failed", attempt + 1)
+                await self.pool.close()
+                if attempt < max_retries - 1:
+                    # A closed pool cannot be reopened
+                    self.pool = self._create_pool()
+                    await asyncio.sleep(2)
+                    continue
+                logger.error(
+                    "Failed to initialize schema after %d attempts", max_retries
+                )
+                raise
+            logger.info("Async memory service ready")
+            return
+
+    async def close(self) -> None:
+        await self.pool.close()
+
+    def pool_stats(self) -> dict:
+        stats = self.pool.get_stats()
+        in_use = stats.get("pool_size", 0) - stats.get("pool_available", 0)
+        return {**stats, "saturation": round(in_use / self.pool.max_size, 3)}
+
+    async def save_review_context(
+        self,
+        project_id: int,
+        mr_iid: int,
+        diff_text: str,
+        final_review_text: str,
+        review_comment_id: int | None = None,
+        head_sha: str | None = None,
+    ) -> bool:
+        """Save review context to database"""
+        chunks = diff_chunks(diff_text) if diff_text is not None else None
+        by_hash = {chunk_hash(chunk): chunk for chunk in chunks or []}
+        async with self.pool.connection() as conn:
+            async with conn.transaction():
+                # Locking the reused rows keeps the cleanup from deleting
+                # them before this transaction references them
+                cursor = await conn.execute(
+                    "SELECT hash FROM diff_blobs WHERE hash = ANY(%s) FOR SHARE",
+                    (list(by_hash),),
+                    prepare=True,
+                )
+                stored = {row[0] async for row in cursor}
+                missing = [
+                    (
+                        digest,
+                        self.compressor.compress(chunk.encode()),
+                        len(chunk.encode()),
+                    )
+                    for digest, chunk in by_hash.items()
+                    if digest not in stored
+                ]
+                # New chunks and the review row go out in one round trip.
+                # Chunks another save inserted since the select are locked
+                # by the no-op update, which DO NOTHING would not do
+                async with conn.pipeline(), conn.cursor() as cur:
+                    if missing:
+                        await cur.executemany(
+                            """
+                            INSERT INTO diff_blobs (hash, data, raw_size)
+                            VALUES (%s, %s, %s)
+                            ON CONFLICT (hash) DO UPDATE SET hash = EXCLUDED.hash
+                        """,
+                            missing,
+                        )
+                    await cur.execute(
+                        SAVE_REVIEW,
+                        (
+                            project_id,
+                            mr_iid,
+                            [chunk_hash(chunk) for chunk in chunks]
+                            if chunks is not None
+                            else None,
+                            final_review_text,
+                            review_comment_id,
+                            head_sha,
+                        ),
+                        prepare=True,
+                    )
+        logger.info(
+            "Saved review context for MR !%d (%d new diff chunks, %d reused)",
+            mr_iid,
+            len(missing),
+            len(stored),
+        )
+
+        self._saves += 1
+        if self._saves % self.blob_gc_every == 0:
+            try:
+                await self._collect_blobs()
+            except Exception:
+                logger.exception("Diff blob cleanup failed")
+        return True
+
+    async def _collect_blobs(self) -> None:
+        """Delete chunks no review references any more"""
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute(COLLECT_BLOBS)
+        if cursor.rowcount:
+            logger.info("Deleted %d unreferenced diff chunks", cursor.rowcount)
+
+    async def load_review_context(
+        self, project_id: int, mr_iid: int
+    ) -> tuple[str | None, str | None]:
+        """Load review context from database"""
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute(LOAD_REVIEW, (project_id, mr_iid), prepare=True)
+            result = await cursor.fetchone()
+        if not result:
+            return None, None
+
+        stored_text, hashes, final_review_text, chunk_data = result
+        if hashes is None:
+            return stored_text, final_review_text
+        if len(chunk_data) != len(hashes):
+            logger.error("Stored diff is missing chunks")
+            return None, final_review_text
+        return (
+            join_chunks(
+                [self.decompressor.decompress(data).decode() for data in chunk_data]
+            ),
+            final_review_text,
+        )
+
+    async def load_last_reviewed_sha(self, project_id: int, mr_iid: int) -> str | None:
+        """Load the head SHA the stored review was produced for"""
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute(
+                """
+                SELECT last_reviewed_sha
+                FROM mr_reviews
+                WHERE project_id = %s AND mr_iid = %s
+            """,
+                (project_id, mr_iid),
+                prepare=True,
+            )
+            result = await cursor.fetchone()
+        return result[0] if result else None
+
+    async def save_review_comment(
+        self,
+        project_id: int,
+        mr_iid: int,
+        head_sha: str,
+        comment_id: int,
+        review_text: str | None = None,
+    ) -> None:
+        """
+        Record the comment the review of head_sha is posted in, with the
+        review text once the final review is posted
+        """
+        async with self.pool.connection() as conn:
+            await conn.execute(
+                """
+                INSERT INTO review_comments
+                    (project_id, mr_iid, head_sha, comment_id, review_text)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (project_id, mr_iid)
+                DO UPDATE SET
+                    head_sha = EXCLUDED.head_sha,
+                    comment_id = EXCLUDED.comment_id,
+                    review_text = EXCLUDED.review_text,
+                    updated_at = NOW()
+            """,
+                (project_id, mr_iid, head_sha, comment_id, review_text),
+                prepare=True,
+            )
+
+    async def load_review_comment(
+        self, project_id: int, mr_iid: int, head_sha: str
+    ) -> tuple[int, str | None] | None:
+        """
+        (comment id, posted review text or None) of an earlier attempt at
+        reviewing head_sha
+        """
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute(
+                """
+                SELECT comment_id, review_text
+                FROM review_comments
+                WHERE project_id = %s AND mr_iid = %s AND head_sha = %s
+            """,
+                (project_id, mr_iid, head_sha),
+                prepare=True,
+            )
+            result = await cursor.fetchone()
+        return (result[0], result[1]) if result else None
+
+    async def storage_stats(self) -> dict:
+        """On-disk size of stored reviews and diff chunks"""
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute(STORAGE_STATS)
+            return storage_stats_row(await cursor.fetchone())
+
+    async def health_check(self) -> bool:
+        """Check if database connection is healthy"""
+        try:
+            async with self.pool.connection() as conn:
+                await conn.execute("SELECT 1")
+            return True
+        except psycopg.Error:
+            logger.exception("Database health check failed")
+            return False
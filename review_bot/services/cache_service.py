@@ -0,0 +1,214 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any
+
+from review_bot.services.memory_service import PostgresMemoryService
+
+logger = logging.getLogger(__name__)
+
+# Namespaces no cache reads any more; their rows are deleted at startup since
+# trimming only ever touches a cache's own namespace
+RETIRED_NAMESPACES = [
+    "review",  # per-shard reviewer results, superseded by the "llm" cache
+]
+
+
+def content_hash(*parts: str) -> str:
+    """Stable SHA-256 over the given strings, used as a cache key"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class LRUCache:
+    """Bounded in-process cache that evicts the least recently used entry"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, Any] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Any:
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class TieredCache:
+    """
+    Two-tier cache: an in-process LRU in front of a shared Postgres table.
+    Entries are namespaced so several caches can share the table and expire
+    after `ttl` seconds. Each namespace is trimmed to `max_rows` rows now and
+    then. Database errors are logged and treated as misses so caching never
+    fails a review.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        memory_service: PostgresMemoryService | None = None,
+        max_entries: int | None = None,
+        ttl: float | None = None,
+        max_rows: int | None = None,
+    ):
+        self.namespace = namespace
+        self.memory_service = memory_service
+        self.local = LRUCache(max_entries or int(os.getenv("CACHE_LRU_SIZE", "1024")))
+        self.ttl = ttl or float(os.getenv("CACHE_TTL_SECONDS", "604800"))
+        self.max_rows = max_rows or int(os.getenv("CACHE_MAX_ROWS", "10000"))
+        # Trim the table once every this many writes
+        self.evict_every = int(os.getenv("CACHE_EVICT_EVERY", "100"))
+        self._writes = 0
+        self.local_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        if memory_service:
+            self._init_schema()
+
+    def _init_schema(self):
+        """Initialize cache table"""
+        with self.memory_service._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS cache_entries (
+                        namespace TEXT,
+                        cache_key TEXT,
+                        value TEXT NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (namespace, cache_key)
+                    )
+                """)
+                cur.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_cache_entries_age
+                    ON cache_entries (namespace, created_at)
+                """)
+                cur.execute(
+                    "DELETE FROM cache_entries WHERE namespace = ANY(%s)",
+                    (RETIRED_NAMESPACES,),
+                )
+                if cur.rowcount:
+                    logger.info(
+                        "Deleted %d cache entries of retired namespaces",
+                        cur.rowcount,
+                    )
+                conn.commit()
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.local_hits + self.db_hits + self.misses
+        return {
+            "local_hits": self.local_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": round((lookups - self.misses) / lookups, 3) if lookups else 0.0,
+            "local_entries": len(self.local),
+        }
+
+    async def get(self, key: str) -> str | None:
+        entry = self.local.get(key)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl:
+            self.local_hits += 1
+            return entry[1]
+        if not self.memory_service:
+            self.misses += 1
+            return None
+
+        try:
+            value = await asyncio.to_thread(self._load, key)
+        except Exception:
+            logger.exception("Cache lookup failed for %s", self.namespace)
+            value = None
+        if value is None:
+            self.misses += 1
+            return None
+        self.db_hits += 1
+        self.local.set(key, (time.monotonic(), value))
+        return value
+
+    async def set(self, key: str, value: str) -> None:
+        self.local.set(key, (time.monotonic(), value))
+        if not self.memory_service:
+            return
+
+        self._writes += 1
+        try:
+            await asyncio.to_thread(self._store, key, value)
+            if self._writes % self.evict_every == 0:
+                await asyncio.to_thread(self._evict)
+        except Exception:
+            logger.exception("Cache write failed for %s", self.namespace)
+
+    def _load(self, key: str) -> str | None:
+        with self.memory_service._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT value FROM cache_entries
+                    WHERE namespace = %s AND cache_key = %s
+                    AND created_at > NOW() - %s * INTERVAL '1 second'
+                """,
+                    (self.namespace, key, self.ttl),
+                )
+                result = cur.fetchone()
+                return result[0] if result else None
+
+    def _store(self, key: str, value: str) -> None:
+        with self.memory_service._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO cache_entries (namespace, cache_key, value)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (namespace, cache_key)
+                    DO UPDATE SET value = EXCLUDED.value, created_at = NOW()
+                """,
+                    (self.namespace, key, value),
+                )
+                conn.commit()
+
+    def _evict(self) -> None:
+        """Drop expired rows, then the oldest rows beyond max_rows"""
+        with self.memory_service._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    DELETE FROM cache_entries
+                    WHERE namespace = %s
+                    AND created_at <= NOW() - %s * INTERVAL '1 second'
+                """,
+                    (self.namespace, self.ttl),
+                )
+                expired = cur.rowcount
+                cur.execute(
+                    """
+                    DELETE FROM cache_entries
+                    WHERE namespace = %s AND cache_key IN (
+                        SELECT cache_key FROM cache_entries
+                        WHERE namespace = %s
+                        ORDER BY created_at DESC
+                        OFFSET %s
+                    )
+                """,
+                    (self.namespace, self.namespace, self.max_rows),
+                )
+                conn.commit()
+                logger.info(
+                    "Evicted %d expired and %d excess %s cache entries",
+                    expired,
+                    cur.rowcount,
+                    self.namespace,
+                )
@@ -0,0 +1,194 @@
+import logging
+import os
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Any
+
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, connection
+from psycopg2.pool import PoolError
+
+logger = logging.getLogger(__name__)
+
+
+class PostgresConnectionPool:
+    """
+    Thread-safe psycopg2 connection pool shared by every database user.
+    Idle connections are pinged on checkout, replaced after max_lifetime
+    seconds, and callers wait up to `timeout` seconds for a connection once
+    max_size are in use. Created at startup and closed on shutdown.
+    """
+
+    def __init__(self, connection_params: str | dict):
+        self.connection_params = connection_params
+        self.min_size = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+        self.max_size = int(os.getenv("DB_POOL_MAX_SIZE", "5"))
+        self.max_lifetime = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))
+        self.timeout = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+        # Connections idle for less than this are trusted without a ping
+        self.ping_after = float(os.getenv("DB_POOL_PING_AFTER", "5"))
+
+        self._lock = threading.Condition()
+        # (connection, opened_at, returned_at), most recently returned last
+        self._idle: list[tuple[connection, float, float]] = []
+        self._size = 0
+        self._in_use = 0
+        self._closed = False
+
+        self.peak_in_use = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+        self.opened = 0
+        self.recycled = 0
+        self.ping_failures = 0
+
+        try:
+            for _ in range(self.min_size):
+                conn = self._connect()
+                self._idle.append((conn, time.monotonic(), time.monotonic()))
+                self._size += 1
+        except psycopg2.OperationalError as exc:
+            logger.warning("Could not pre-open database connections: %s", exc)
+        logger.info(
+            "Database pool ready (%d-%d connections)", self.min_size, self.max_size
+        )
+
+    def _connect(self) -> connection:
+        if isinstance(self.connection_params, str):
+            conn = psycopg2.connect(self.connection_params)
+        else:
+            conn = psycopg2.connect(**self.connection_params)
+        self.opened += 1
+        return conn
+
+    @staticmethod
+    def _discard(conn: connection) -> None:
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _ping(self, conn: connection) -> bool:
+        try:
+            # Outside a transaction, so the ping is a single round trip
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.autocommit = False
+            return True
+        except psycopg2.Error:
+            self.ping_failures += 1
+            return False
+
+    def _acquire(self) -> tuple[connection, float]:
+        deadline = time.monotonic() + self.timeout
+        with self._lock:
+            started = time.monotonic()
+            waited = False
+            while not self._closed and not self._idle and self._size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolError(
+                        f"No database connection free after {self.timeout:g}s"
+                    )
+                waited = True
+                self._lock.wait(remaining)
+            if self._closed:
+                raise PoolError("Database pool is closed")
+            if waited:
+                self.waits += 1
+                self.wait_seconds += time.monotonic() - started
+
+            entry = self._idle.pop() if self._idle else None
+            if entry is None:
+                # Reserve the slot before connecting outside the lock
+                self._size += 1
+            self._in_use += 1
+            self.checkouts += 1
+            self.peak_in_use = max(self.peak_in_use, self._in_use)
+
+        try:
+            if entry is not None:
+                conn, opened_at, returned_at = entry
+                now = time.monotonic()
+                if now - opened_at >= self.max_lifetime:
+                    self.recycled += 1
+                elif now - returned_at < self.ping_after or self._ping(conn):
+                    return conn, opened_at
+                self._discard(conn)
+            return self._connect(), time.monotonic()
+        except BaseException:
+            with self._lock:
+                self._size -= 1
+                self._in_use -= 1
+                self._lock.notify()
+            raise
+
+    def _release(self, conn: connection, opened_at: float, broken: bool) -> None:
+        if not broken and not conn.closed:
+            try:
+                if conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                broken = True
+
+        with self._lock:
+            self._in_use -= 1
+            if broken or conn.closed or self._closed:
+                self._size -= 1
+                self._discard(conn)
+            else:
+                self._idle.append((conn, opened_at, time.monotonic()))
+            self._lock.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[connection]:
+        """
+        Check out a connection for one transaction: committed when the
+        block exits normally, rolled back on an exception.
+        """
+        conn, opened_at = self._acquire()
+        broken = False
+        try:
+            with conn:
+                yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self._release(conn, opened_at, broken)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "peak_in_use": self.peak_in_use,
+                "saturation": round(self._in_use / self.max_size, 3),
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "wait_seconds": round(self.wait_seconds, 3),
+                "timeouts": self.timeouts,
+                "opened": self.opened,
+                "recycled": self.recycled,
+                "ping_failures": self.ping_failures,
+            }
+
+    def close(self) -> None:
+        """Close idle connections now and the rest as they are returned"""
+        with self._lock:
+            self._closed = True
+            for conn, _, _ in self._idle:
+                self._discard(conn)
+            self._size -= len(self._idle)
+            self._idle.clear()
+            self._lock.notify_all()
+        logger.info("Database pool closed")
@@ -0,0 +1,42 @@
+import os
+
+# context: keep only DIFF_CONTEXT_LINES unchanged lines around each change
+# whitespace: strip trailing whitespace, collapse hunks that change nothing else
+# renames: drop files that were renamed without changes
+# numbered: prefix added lines with their new line number for file:line
+COMPACTION_MODES = ("context", "whitespace", "renames", "numbered")
+
+NUMBERED_LEGEND = (
+    "Added lines in the diff are written as +<line number>|<code>, with the "
+    "line number in the new file; cite findings as file:line."
+)
+
+
+def compaction_modes() -> frozenset[str]:
+    """Modes enabled by DIFF_COMPACTION (comma-separated, "all" or "none")"""
+    value = os.getenv("DIFF_COMPACTION", "all").strip().lower()
+    if value == "all":
+        return frozenset(COMPACTION_MODES)
+    return frozenset(
+        mode.strip() for mode in value.split(",") if mode.strip() in COMPACTION_MODES
+    )
+
+
+def is_reviewable(file_data: dict, modes: frozenset[str]) -> bool:
+    """Whether a GitHub file entry carries changes worth a prompt section"""
+    if "patch" not in file_data:
+        return False
+    if "renames" in modes and file_data.get("status") == "renamed":
+        return bool(file_data.get("changes")) and bool(file_data["patch"])
+    return True
+
+
+def whitespace_only(lines: list[str]) -> bool:
+    """
+    Whether a hunk's removed and added lines, taken in order, differ only
+    in trailing whitespace. Indentation and whitespace inside a line are
+    never ignored: they matter in Python, YAML and string literals.
+    """
+    removed = [line[1:].rstrip() for line in lines if line[:1] == "-"]
+    added = [line[1:].rstrip() for line in lines if line[:1] == "+"]
+    return bool(removed) and removed == added
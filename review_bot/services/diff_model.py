@@ -0,0 +1,287 @@
+import os
+import re
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+
+from review_bot.services.diff_compaction import whitespace_only
+from review_bot.services.diff_utils import format_file_section, join_diff, split_diff
+
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@(.*)$")
+
+_LANGUAGES = {
+    ".py": "python",
+    ".js": "javascript",
+    ".jsx": "javascript",
+    ".ts": "typescript",
+    ".tsx": "typescript",
+    ".go": "go",
+    ".rs": "rust",
+    ".java": "java",
+    ".kt": "kotlin",
+    ".rb": "ruby",
+    ".php": "php",
+    ".c": "c",
+    ".h": "c",
+    ".cc": "cpp",
+    ".cpp": "cpp",
+    ".hpp": "cpp",
+    ".cs": "csharp",
+    ".swift": "swift",
+    ".scala": "scala",
+    ".sh": "shell",
+    ".sql": "sql",
+    ".html": "html",
+    ".css": "css",
+    ".scss": "css",
+    ".md": "markdown",
+    ".json": "json",
+    ".yml": "yaml",
+    ".yaml": "yaml",
+    ".toml": "toml",
+}
+
+
+def detect_language(filename: str) -> str | None:
+    return _LANGUAGES.get(os.path.splitext(filename)[1].lower())
+
+
+def _ranges(numbers: Iterable[int]) -> list[tuple[int, int]]:
+    """Collapse ascending line numbers into inclusive (first, last) ranges"""
+    ranges: list[tuple[int, int]] = []
+    for number in numbers:
+        if ranges and number == ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], number)
+        else:
+            ranges.append((number, number))
+    return ranges
+
+
+@dataclass(slots=True)
+class Hunk:
+    """One @@ hunk; lines keep their unified-diff marker"""
+
+    old_start: int
+    new_start: int
+    header: str
+    lines: list[str] = field(default_factory=list)
+
+    def numbered(self) -> Iterator[tuple[int | None, int | None, str]]:
+        """(old line number, new line number, line) for every line"""
+        old_no, new_no = self.old_start, self.new_start
+        for line in self.lines:
+            marker = line[:1]
+            if marker == "+":
+                yield None, new_no, line
+                new_no += 1
+            elif marker == "-":
+                yield old_no, None, line
+                old_no += 1
+            elif marker == "\\":
+                yield None, None, line
+            else:
+                yield old_no, new_no, line
+                old_no += 1
+                new_no += 1
+
+    @property
+    def added(self) -> list[tuple[int, int]]:
+        """New-file line ranges added by this hunk"""
+        return _ranges(new for old, new, _ in self.numbered() if old is None and new)
+
+    @property
+    def removed(self) -> list[tuple[int, int]]:
+        """Old-file line ranges removed by this hunk"""
+        return _ranges(old for old, new, _ in self.numbered() if new is None and old)
+
+    @property
+    def context(self) -> list[tuple[int, int]]:
+        """New-file line ranges shown unchanged"""
+        return _ranges(new for old, new, _ in self.numbered() if old and new)
+
+    def render(self, modes: frozenset[str], context_lines: int) -> str:
+        """
+        Prompt text for this hunk under the given compaction modes (see
+        diff_compaction). Changed lines are kept unless the hunk only
+        changes trailing whitespace.
+        """
+        if not modes - {"renames"}:
+            return "\n".join([self.header, *self.lines])
+
+        rows = list(self.numbered())
+        suffix = _HUNK_HEADER.match(self.header)[5]
+        if "whitespace" in modes:
+            rows = [(old, new, line.rstrip()) for old, new, line in rows]
+            if whitespace_only([line for _, _, line in rows]):
+                return (
+                    f"@@ -{self.old_start} +{self.new_start} @@"
+                    " (trailing whitespace changes only)"
+                )
+
+        keep = range(len(rows))
+        if "context" in modes:
+            changed = [
+                index
+                for index, (old, new, _) in enumerate(rows)
+                if old is None or new is None
+            ]
+            keep = sorted(
+                {
+                    index
+                    for position in changed
+                    for index in range(
+                        max(0, position - context_lines),
+                        min(len(rows), position + context_lines + 1),
+                    )
+                }
+            )
+
+        # Split at dropped context so every piece gets an accurate header
+        groups: list[list[int]] = []
+        for index in keep:
+            if groups and index == groups[-1][-1] + 1:
+                groups[-1].append(index)
+            else:
+                groups.append([index])
+
+        out: list[str] = []
+        for group_number, group in enumerate(groups):
+            piece = [rows[index] for index in group]
+            numbered_rows = [(old, new) for old, new, _ in piece if old or new]
+            old_first = next((old for old, _ in numbered_rows if old), self.old_start)
+            new_first = next((new for _, new in numbered_rows if new), self.new_start)
+            old_count = sum(1 for old, _ in numbered_rows if old)
+            new_count = sum(1 for _, new in numbered_rows if new)
+            out.append(
+                f"@@ -{old_first},{old_count} +{new_first},{new_count} @@"
+                + (suffix if group_number == 0 else "")
+            )
+            for old, new, line in piece:
+                # Other lines are located by the hunk header and these numbers
+                if "numbered" in modes and old is None and new:
+                    out.append(f"+{new}|{line[1:]}")
+                else:
+                    out.append(line)
+        return "\n".join(out)
+
+
+@dataclass(slots=True)
+class FileDiff:
+    """A changed file. raw_patch holds patches that are not @@ hunks."""
+
+    filename: str
+    status: str = "modified"
+    previous_filename: str | None = None
+    language: str | None = None
+    hunks: list[Hunk] = field(default_factory=list)
+    raw_patch: str | None = None
+
+    @property
+    def additions(self) -> int:
+        return sum(1 for hunk in self.hunks for line in hunk.lines if line[:1] == "+")
+
+    @property
+    def deletions(self) -> int:
+        return sum(1 for hunk in self.hunks for line in hunk.lines if line[:1] == "-")
+
+    def render_hunks(self, modes: frozenset[str], context_lines: int) -> list[str]:
+        if self.raw_patch is not None:
+            return [self.raw_patch]
+        return [hunk.render(modes, context_lines) for hunk in self.hunks]
+
+    def render(self, modes: frozenset[str], context_lines: int) -> str:
+        return format_file_section(
+            self.filename, "\n".join(self.render_hunks(modes, context_lines))
+        )
+
+
+@dataclass(slots=True)
+class PRDiff:
+    """
+    The files of a PR plus linked issue context. Prompt text is rendered
+    on first use with the compaction modes given here and then reused.
+    """
+
+    files: list[FileDiff] = field(default_factory=list)
+    issue_context: str | None = None
+    modes: frozenset[str] = frozenset()
+    context_lines: int = 1
+    # Files left out of the review, with the reason, and the one-line
+    # stand-ins the judge sees for them; never part of files
+    skipped: dict[str, str] = field(default_factory=dict)
+    skipped_stubs: list[FileDiff] = field(default_factory=list)
+    _text: str | None = field(default=None, repr=False)
+    _sections: dict[str, str] = field(default_factory=dict, repr=False)
+
+    def render_hunks(self, file: FileDiff) -> list[str]:
+        return file.render_hunks(self.modes, self.context_lines)
+
+    def render_file(self, file: FileDiff) -> str:
+        if file.filename not in self._sections:
+            self._sections[file.filename] = file.render(self.modes, self.context_lines)
+        return self._sections[file.filename]
+
+    def render_skipped(self) -> str:
+        return join_diff(
+            None,
+            {
+                file.filename: file.render(self.modes, self.context_lines)
+                for file in self.skipped_stubs
+            },
+        )
+
+    def render(self) -> str:
+        if self._text is None:
+            self._text = join_diff(
+                self.issue_context,
+                {file.filename: self.render_file(file) for file in self.files},
+            )
+        return self._text
+
+
+def parse_patch(patch: str) -> list[Hunk] | None:
+    """Single pass over a unified diff patch; None if it has no @@ hunks"""
+    hunks: list[Hunk] = []
+    for line in patch.rstrip("\n").split("\n"):
+        match = _HUNK_HEADER.match(line)
+        if match:
+            hunks.append(Hunk(int(match[1]), int(match[3]), line))
+        elif hunks:
+            hunks[-1].lines.append(line)
+        else:
+            return None
+    return hunks or None
+
+
+def parse_file(file_data: dict) -> FileDiff:
+    """Build a FileDiff from a GitHub pulls/files or compare file entry"""
+    patch = file_data.get("patch", "")
+    hunks = parse_patch(patch)
+    return FileDiff(
+        filename=file_data["filename"],
+        status=file_data.get("status", "modified"),
+        previous_filename=file_data.get("previous_filename"),
+        language=detect_language(file_data["filename"]),
+        hunks=hunks or [],
+        raw_patch=None if hunks else patch,
+    )
+
+
+def parse_diff_text(diff_text: str) -> PRDiff:
+    """
+    Parse prompt diff text (as stored or rendered earlier) back into a
+    PRDiff. It renders verbatim, since any compaction was already applied.
+    """
+    issue_context, sections = split_diff(diff_text)
+    files = []
+    for filename, section in sections.items():
+        patch = section.split("\n", 1)[1] if "\n" in section else ""
+        hunks = parse_patch(patch)
+        files.append(
+            FileDiff(
+                filename,
+                language=detect_language(filename),
+                hunks=hunks or [],
+                raw_patch=None if hunks else patch.rstrip("\n"),
+            )
+        )
+    return PRDiff(files, issue_context)
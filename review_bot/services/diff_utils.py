@@ -0,0 +1,52 @@
+import re
+
+ISSUES_HEADER = "=== LINKED ISSUES ==="
+CHANGES_HEADER = "=== CODE CHANGES ==="
+
+_FILE_BANNER = re.compile(r"^--- File: (.+) ---$", re.MULTILINE)
+
+
+def format_file_section(filename: str, patch: str) -> str:
+    """Render one file's patch the way it is shown to the reviewers"""
+    return f"--- File: {filename} ---\n{patch}\n"
+
+
+def join_diff(issue_context: str | None, sections: dict[str, str]) -> str:
+    """Assemble the prompt diff text from issue context and file sections"""
+    diff_content = "\n".join(sections.values())
+    if issue_context:
+        return f"{ISSUES_HEADER}\n{issue_context}\n\n{CHANGES_HEADER}\n{diff_content}"
+    return diff_content
+
+
+def split_diff(diff_text: str) -> tuple[str | None, dict[str, str]]:
+    """
+    Inverse of join_diff: returns the linked issue context (if any) and the
+    file sections keyed by filename, in their original order.
+    """
+    issue_context = None
+    if diff_text.startswith(ISSUES_HEADER):
+        head, _, diff_text = diff_text.partition(f"\n\n{CHANGES_HEADER}\n")
+        issue_context = head[len(ISSUES_HEADER) + 1 :]
+
+    sections: dict[str, str] = {}
+    banners = list(_FILE_BANNER.finditer(diff_text))
+    for index, banner in enumerate(banners):
+        end = banners[index + 1].start() if index + 1 < len(banners) else None
+        section = diff_text[banner.start() : end]
+        # join_diff separates sections with an extra newline
+        if end is not None:
+            section = section[:-1]
+        sections[banner.group(1)] = section
+    return issue_context, sections
+
+
+def merge_diffs(previous_text: str, delta_text: str) -> str:
+    """
+    Overlay an incremental diff on a previously stored one: files touched by
+    the delta take its sections, untouched files keep their earlier sections.
+    """
+    previous_issues, sections = split_diff(previous_text)
+    delta_issues, delta_sections = split_diff(delta_text)
+    sections.update(delta_sections)
+    return join_diff(delta_issues or previous_issues, sections)
@@ -0,0 +1,196 @@
+import os
+import re
+from fnmatch import fnmatchcase
+
+from review_bot.services.diff_model import FileDiff, detect_language
+
+# Files whose diffs cost tokens without being worth a review, by reason
+DEFAULT_SKIP_GLOBS = {
+    "lockfile": (
+        "package-lock.json",
+        "npm-shrinkwrap.json",
+        "yarn.lock",
+        "pnpm-lock.yaml",
+        "bun.lockb",
+        "poetry.lock",
+        "Pipfile.lock",
+        "uv.lock",
+        "pdm.lock",
+        "Cargo.lock",
+        "go.sum",
+        "composer.lock",
+        "Gemfile.lock",
+        "Podfile.lock",
+        "pubspec.lock",
+        "mix.lock",
+        "flake.lock",
+    ),
+    "vendored": (
+        "vendor/*",
+        "node_modules/*",
+        "third_party/*",
+        "bower_components/*",
+    ),
+    "generated": (
+        "*_pb2.py",
+        "*_pb2.pyi",
+        "*_pb2_grpc.py",
+        "*.pb.go",
+        "*.pb.cc",
+        "*.pb.h",
+        "*.generated.*",
+        "*.g.dart",
+        "*.snap",
+        "__snapshots__/*",
+        "*.min.js",
+        "*.min.css",
+        "*.map",
+        "dist/*",
+    ),
+}
+
+# Markers code generators leave near the top of their output
+_GENERATED_MARKER = re.compile(
+    r"@generated|do not edit|code generated|auto-?generated", re.IGNORECASE
+)
+_STARTS_AT_TOP = re.compile(r"^@@ -\d+(?:,\d+)? \+1[, ]")
+_COMMENT = re.compile(r"^\s*(?:#|//|/\*|\*|<!--|--|;)")
+# Minifiers emit these; other known languages are never treated as minified
+_MINIFIABLE = (None, "javascript", "css", "html", "json")
+
+
+def _globs(name: str) -> list[str]:
+    return [glob.strip() for glob in os.getenv(name, "").split(",") if glob.strip()]
+
+
+def _matches(path: str, pattern: str) -> bool:
+    """
+    gitattributes-style match: patterns without a slash match the file name
+    in any directory, others match the path (leading slash anchors it at
+    the root). Unlike git, "*" also matches across directories.
+    """
+    if "/" not in pattern.rstrip("/"):
+        return fnmatchcase(path.rsplit("/", 1)[-1], pattern)
+    if pattern.startswith("/"):
+        return fnmatchcase(path, pattern[1:])
+    return fnmatchcase(path, pattern) or fnmatchcase(path, f"*/{pattern}")
+
+
+def parse_gitattributes(text: str) -> list[tuple[str, str | None]]:
+    """
+    (pattern, reason) rules from the linguist attributes in a .gitattributes
+    file; reason None means the files are explicitly marked for review.
+    """
+    rules: list[tuple[str, str | None]] = []
+    for line in text.splitlines():
+        parts = line.split()
+        if not parts or parts[0].startswith("#"):
+            continue
+        pattern, attributes = parts[0], parts[1:]
+        for attribute in attributes:
+            name, _, value = attribute.lstrip("-!").partition("=")
+            if name not in ("linguist-generated", "linguist-vendored"):
+                continue
+            unset = attribute[0] in "-!" or value.lower() == "false"
+            rules.append((pattern, None if unset else name.removeprefix("linguist-")))
+    return rules
+
+
+class FileClassifier:
+    """
+    Decides which changed files are left out of the prompts: lockfiles,
+    vendored and generated code (by glob, the repository's .gitattributes
+    linguist attributes, or generator markers), minified code and files
+    GitHub sends without a patch (binary or too large).
+
+    DIFF_REVIEW_GLOBS always wins; .gitattributes rules win over the
+    default and DIFF_SKIP_GLOBS globs.
+    """
+
+    def __init__(self, gitattributes: str = ""):
+        self.review_globs = _globs("DIFF_REVIEW_GLOBS")
+        self.skip_globs = [
+            (glob, reason)
+            for reason, globs in DEFAULT_SKIP_GLOBS.items()
+            for glob in globs
+        ] + [(glob, "skip rule") for glob in _globs("DIFF_SKIP_GLOBS")]
+        self.attributes = parse_gitattributes(gitattributes)
+        # Added lines this long on average are treated as minified
+        self.minified_line_length = int(os.getenv("DIFF_MINIFIED_LINE_LENGTH", "300"))
+        self.minified_min_lines = int(os.getenv("DIFF_MINIFIED_MIN_LINES", "3"))
+
+    def classify(self, file_data: dict) -> str | None:
+        """Reason to skip a GitHub file entry, or None to review it"""
+        path = file_data["filename"]
+        if any(_matches(path, glob) for glob in self.review_globs):
+            return None
+
+        # Like git, the last matching .gitattributes line wins
+        for pattern, reason in reversed(self.attributes):
+            if _matches(path, pattern):
+                return reason and f"{reason} per .gitattributes"
+
+        for glob, reason in self.skip_globs:
+            if _matches(path, glob):
+                return reason
+
+        patch = file_data.get("patch")
+        if patch is None:
+            # Pure renames carry no patch either and are handled later
+            if file_data.get("status") == "renamed":
+                return None
+            return "binary or too large"
+
+        if _STARTS_AT_TOP.match(patch) and any(
+            _GENERATED_MARKER.search(line) for line in _leading_comments(patch)
+        ):
+            return "generated"
+
+        added = [line for line in patch.split("\n") if line.startswith("+")]
+        if (
+            detect_language(path) in _MINIFIABLE
+            and len(added) >= self.minified_min_lines
+            and sum(map(len, added)) / len(added) > self.minified_line_length
+        ):
+            return "minified"
+        return None
+
+
+def _leading_comments(patch: str) -> list[str]:
+    """
+    The comment lines a patch starting at line 1 opens the new file with;
+    generator markers are only looked for there.
+    """
+    comments = []
+    for line in patch.split("\n", 40)[1:40]:
+        if line[:1] == "-":
+            continue
+        text = line[1:]
+        if _COMMENT.match(text):
+            comments.append(text)
+        elif text.strip():
+            break
+    return comments
+
+
+def skipped_file(file_data: dict, reason: str) -> FileDiff:
+    """One-line stand-in for a skipped file, so the judge knows it changed"""
+    filename = file_data["filename"]
+    return FileDiff(
+        filename,
+        status=file_data.get("status", "modified"),
+        previous_filename=file_data.get("previous_filename"),
+        language=detect_language(filename),
+        raw_patch=(
+            f"(not reviewed, {reason}: +{file_data.get('additions', 0)} "
+            f"-{file_data.get('deletions', 0)} lines)"
+        ),
+    )
+
+
+def skipped_note(skipped: dict[str, str]) -> str:
+    """Footer for the review comment listing the files left out"""
+    if not skipped:
+        return ""
+    files = ", ".join(f"`{name}` ({reason})" for name, reason in skipped.items())
+    return f"\n\n---\n_Not reviewed: {files}_"
@@ -0,0 +1,195 @@
+# review_bot/services/github_graphql_service.py
+import asyncio
+import logging
+import os
+
+from review_bot.services.github_service import GitHubService, find_issue_refs
+from review_bot.services.rate_limiter import Priority
+
+logger = logging.getLogger(__name__)
+
+ISSUE_FIELDS = """
+    number
+    title
+    body
+    state
+    labels(first: 20) { nodes { name } }
+"""
+
+# A #123 reference may point at an issue or a pull request
+REF_FIELDS = f"""
+    ... on Issue {{ {ISSUE_FIELDS} }}
+    ... on PullRequest {{ {ISSUE_FIELDS} }}
+"""
+
+
+def _ref_lookups(issue_ids: list[str]) -> str:
+    """Aliased repository fields resolving each referenced number"""
+    return "\n".join(
+        f"i{issue_id}: issueOrPullRequest(number: {int(issue_id)}) {{ {REF_FIELDS} }}"
+        for issue_id in issue_ids
+    )
+
+
+def pr_context_query(issue_refs: list[str] | None) -> str:
+    """
+    The issues a PR closes plus the ones its title and body reference, in
+    one query. Without known references the title and body are requested
+    so they can be resolved in a follow-up query.
+    """
+    return f"""
+query($owner: String!, $name: String!, $number: Int!) {{
+  repository(owner: $owner, name: $name) {{
+    pullRequest(number: $number) {{
+      {"title body" if issue_refs is None else ""}
+      closingIssuesReferences(first: 25) {{ nodes {{ {ISSUE_FIELDS} }} }}
+    }}
+    {_ref_lookups(issue_refs or [])}
+  }}
+}}
+"""
+
+
+class GitHubGraphQLError(Exception):
+    """Raised when a GraphQL response carries errors or no data."""
+
+
+class GitHubGraphQLService(GitHubService):
+    """
+    GitHub backend that gathers linked issues through the GraphQL API. When
+    the PR's #123 references are known (from the webhook payload), a single
+    query returns every issue the PR closes or mentions; otherwise the
+    title and body come back with the closing issues and the mentions are
+    resolved in a second query. GraphQL does not expose patch bodies, so
+    files come from the paginated REST endpoint, fetched concurrently with
+    the query. On GraphQL failures the REST enrichment is used.
+    """
+
+    def __init__(self, github_token: str | None = None):
+        super().__init__(github_token)
+        self.graphql_url = f"{self.base_url}/graphql"
+
+    async def _graphql(
+        self, query: str, variables: dict, allow_partial: bool = False
+    ) -> dict:
+        """Run a GraphQL query and return its data."""
+        response = await self._request(
+            "POST",
+            self.graphql_url,
+            Priority.LOW,
+            json={"query": query, "variables": variables},
+        )
+        response.raise_for_status()
+        payload = response.json()
+        if not payload.get("data") or (payload.get("errors") and not allow_partial):
+            raise GitHubGraphQLError(str(payload.get("errors")))
+        return payload["data"]
+
+    @staticmethod
+    def _to_rest_issue(node: dict) -> dict:
+        """Map a GraphQL issue node onto the REST fields _format_issue reads."""
+        return {
+            "title": node["title"],
+            "body": node.get("body"),
+            "state": node["state"].lower(),
+            "labels": node.get("labels", {}).get("nodes", []),
+        }
+
+    async def fetch_issue_details(
+        self, pr_number: int, issue_refs: list[str] | None = None
+    ) -> str:
+        """Fetch linked issue details for context in as few round-trips as possible."""
+        try:
+            # Numbers that are neither issues nor PRs resolve to null
+            data = await self._graphql(
+                pr_context_query(issue_refs),
+                {"owner": self.repo_owner, "name": self.repo_name, "number": pr_number},
+                allow_partial=True,
+            )
+            pr_data = data["repository"]["pullRequest"]
+            if pr_data is None:
+                raise GitHubGraphQLError(f"PR #{pr_number} not found")
+        except Exception as exc:
+            logger.warning("GraphQL PR query failed, using REST: %s", exc)
+            return await super().fetch_issue_details(pr_number, issue_refs)
+
+        issues = {
+            str(node["number"]): self._to_rest_issue(node)
+            for node in pr_data["closingIssuesReferences"]["nodes"]
+        }
+        if issue_refs is None:
+            issue_refs = find_issue_refs(pr_data.get("title"), pr_data.get("body"))
+            missing = [ref for ref in issue_refs if ref not in issues]
+            if missing:
+                issues.update(await self._fetch_issues_batch(missing))
+        else:
+            issues.update(
+                (issue_id, self._to_rest_issue(node))
+                for issue_id in issue_refs
+                if (node := data["repository"].get(f"i{issue_id}"))
+            )
+        if not issue_refs and not issues:
+            return "No linked issues found"
+
+        issue_ids = list(dict.fromkeys([*issue_refs, *issues]))
+        issue_details = [
+            self._format_issue(issue_id, issues[issue_id])
+            for issue_id in issue_ids
+            if issue_id in issues
+        ]
+        for issue_id in issue_ids:
+            if issue_id not in issues:
+                logger.warning("Could not fetch issue #%s", issue_id)
+
+        return (
+            "\n\n".join(issue_details)
+            if issue_details
+            else "No accessible issues found"
+        )
+
+    async def _fetch_issues_batch(self, issue_ids: list[str]) -> dict[str, dict]:
+        """Resolve several issue numbers with one aliased GraphQL query."""
+        query = f"""
+query($owner: String!, $name: String!) {{
+  repository(owner: $owner, name: $name) {{
+    {_ref_lookups(issue_ids)}
+  }}
+}}
+"""
+        try:
+            data = await self._graphql(
+                query,
+                {"owner": self.repo_owner, "name": self.repo_name},
+                allow_partial=True,
+            )
+        except Exception as exc:
+            logger.warning("GraphQL issue batch failed, using REST: %s", exc)
+        else:
+            return {
+                issue_id: self._to_rest_issue(node)
+                for issue_id in issue_ids
+                if (node := data["repository"].get(f"i{issue_id}"))
+            }
+
+        semaphore = asyncio.Semaphore(self.issue_concurrency)
+
+        async def fetch(issue_id: str) -> dict | None:
+            async with semaphore:
+                return await self._fetch_issue(issue_id)
+
+        return {
+            issue_id: issue_data
+            for issue_id, issue_data in zip(
+                issue_ids,
+                await asyncio.gather(*(fetch(issue_id) for issue_id in issue_ids)),
+                strict=True,
+            )
+            if issue_data is not None
+        }
+
+
+def create_github_service() -> GitHubService:
+    """Build the GitHub backend selected by GITHUB_BACKEND (rest or graphql)."""
+    if os.getenv("GITHUB_BACKEND", "rest").lower() == "graphql":
+        return GitHubGraphQLService()
+    return GitHubService()
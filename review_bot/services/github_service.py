@@ -1,7 +1,26 @@
 # review_bot/services/github_service.py
+import asyncio
 import os
+import re
+import time
+from collections.abc import AsyncIterator
 
-import requests
+import httpx
+
+from review_bot.http_pool import PooledHTTPClient
+from review_bot.services.cache_service import LRUCache
+from review_bot.services.diff_compaction import compaction_modes, is_reviewable
+from review_bot.services.diff_model import PRDiff, parse_file
+from review_bot.services.file_filter import FileClassifier, skipped_file
+from review_bot.services.rate_limiter import GitHubRateLimiter, Priority
+
+# GitHub's compare endpoint lists at most this many changed files
+COMPARE_MAX_FILES = 300
+
+
+def find_issue_refs(*texts: str | None) -> list[str]:
+    """Issue numbers referenced as #123 (closes #123, etc.), first mention first"""
+    return list(dict.fromkeys(re.findall(r"#(\d+)", " ".join(t or "" for t in texts))))
 
 
 class GitHubService:
@@ -16,6 +35,22 @@ class GitHubService:
         self.repo_owner = os.environ.get("GITHUB_OWNER", "sfdnas-adm")
         self.repo_name = os.environ.get("GITHUB_REPO", "-Agentic-AI_Multi-User")
         self.base_url = "https://api.github.com"
+        # GitHub serves at most 3000 files per PR, 100 per page
+        self.files_per_page = 100
+        self.max_file_pages = 30
+        self.page_concurrency = int(os.getenv("GITHUB_PAGE_CONCURRENCY", "8"))
+        self.issue_concurrency = int(os.getenv("GITHUB_ISSUE_CONCURRENCY", "5"))
+        # Issue id -> (fetched_at, etag, issue data); revalidated after the TTL
+        self.issue_cache_ttl = float(os.getenv("GITHUB_ISSUE_CACHE_TTL", "300"))
+        self.issue_cache = LRUCache(int(os.getenv("GITHUB_ISSUE_CACHE_SIZE", "512")))
+        # Patches are compacted before they reach the prompts
+        self.compaction = compaction_modes()
+        self.context_lines = int(os.getenv("DIFF_CONTEXT_LINES", "1"))
+        # Lockfiles, vendored, generated and binary files: summarize, drop or off
+        self.skipped_files = os.getenv("DIFF_SKIPPED_FILES", "summarize").lower()
+        # (fetched_at, text) of the default branch's .gitattributes
+        self.gitattributes_ttl = float(os.getenv("GITHUB_GITATTRIBUTES_TTL", "300"))
+        self._gitattributes: tuple[float, str] | None = None
 
         if not self.github_token:
             raise ValueError("GITHUB_TOKEN must be set in the environment.")
@@ -37,7 +72,42 @@ class GitHubService:
             "Accept": "application/vnd.github.v3+json",
         }
 
-    def fetch_pr_diff(self, pr_number: int) -> str:
+        # One keep-alive connection pool shared by every GitHub call
+        self.http = PooledHTTPClient("github", headers=self.headers)
+        # Every call is paced and prioritized against the API quota
+        self.rate_limiter = GitHubRateLimiter()
+
+    async def aclose(self) -> None:
+        """Close the pooled GitHub connections."""
+        await self.http.aclose()
+
+    def pool_stats(self) -> dict:
+        """Connection pool statistics for the GitHub client."""
+        return self.http.stats()
+
+    def rate_limit_stats(self) -> dict:
+        """Quota and scheduling statistics for GitHub calls."""
+        return self.rate_limiter.stats()
+
+    async def _request(
+        self, method: str, url: str, priority: Priority, **kwargs
+    ) -> httpx.Response:
+        """
+        Send a GitHub API request through the rate-limit scheduler. Requests
+        rejected by a rate limit are retried once the limit has passed.
+        """
+        resource = self.rate_limiter.resource(url)
+        for _ in range(self.rate_limiter.max_retries):
+            await self.rate_limiter.acquire(priority, resource)
+            response = await self.http.request(method, url, **kwargs)
+            if self.rate_limiter.observe(response) is None:
+                return response
+        await self.rate_limiter.acquire(priority, resource)
+        response = await self.http.request(method, url, **kwargs)
+        self.rate_limiter.observe(response)
+        return response
+
+    async def fetch_pr_diff(self, pr_number: int) -> str:
         """
         Fetches the complete code diff (changes) for a Pull Request.
         """
@@ -45,39 +115,247 @@ class GitHubService:
 
         logger = logging.getLogger(__name__)
 
-        # Get PR diff directly
-        diff_url = f"{self.base_url}/repos/{self.repo_owner}/{self.repo_name}/pulls/{pr_number}/files"
-        diff_response = requests.get(diff_url, headers=self.headers)
-
-        if diff_response.status_code != 200:
+        try:
+            return (await self.fetch_pr_diff_model(pr_number)).render()
+        except httpx.HTTPStatusError as exc:
             logger.error(
-                "GitHub API error %d for PR #%d", diff_response.status_code, pr_number
+                "GitHub API error %d for PR #%d",
+                exc.response.status_code,
+                pr_number,
             )
-            return f"Error fetching PR diff: HTTP {diff_response.status_code}"
+            return f"Error fetching PR diff: HTTP {exc.response.status_code}"
 
-        files_data = diff_response.json()
+    async def fetch_pr_diff_model(
+        self, pr_number: int, issue_refs: list[str] | None = None
+    ) -> PRDiff:
+        """
+        Fetches the changed files of a Pull Request as a parsed diff.
+        issue_refs are the issues the PR mentions, when the caller knows
+        them (see fetch_issue_details). Raises httpx.HTTPStatusError when
+        GitHub refuses the request.
+        """
+        return await self._build_diff(
+            pr_number, self._iter_pr_files(pr_number), issue_refs
+        )
 
-        # Process diff for LLM
-        full_diff_text = []
-        for file_data in files_data:
-            if "patch" in file_data:
-                full_diff_text.append(
-                    f"--- File: {file_data['filename']} ---\n{file_data['patch']}\n"
+    async def _iter_pr_files(self, pr_number: int) -> AsyncIterator[dict]:
+        """
+        Yields the changed files of a Pull Request page by page. The first
+        page tells us the page count via its Link header; the remaining pages
+        are then fetched concurrently and yielded in order as they arrive.
+        """
+        files_url = f"{self.base_url}/repos/{self.repo_owner}/{self.repo_name}/pulls/{pr_number}/files"
+        semaphore = asyncio.Semaphore(self.page_concurrency)
+
+        async def fetch_page(page: int) -> list[dict]:
+            async with semaphore:
+                response = await self._request(
+                    "GET",
+                    files_url,
+                    Priority.NORMAL,
+                    params={"per_page": self.files_per_page, "page": page},
                 )
+            response.raise_for_status()
+            return response.json()
+
+        first_page = await self._request(
+            "GET",
+            files_url,
+            Priority.NORMAL,
+            params={"per_page": self.files_per_page, "page": 1},
+        )
+        first_page.raise_for_status()
 
-        diff_content = "\n".join(full_diff_text)
+        last_url = first_page.links.get("last", {}).get("url")
+        last_page = int(httpx.URL(last_url).params.get("page", 1)) if last_url else 1
+        remaining = [
+            asyncio.create_task(fetch_page(page))
+            for page in range(2, min(last_page, self.max_file_pages) + 1)
+        ]
+
+        try:
+            for file_data in first_page.json():
+                yield file_data
+            for page in remaining:
+                for file_data in await page:
+                    yield file_data
+        finally:
+            for page in remaining:
+                page.cancel()
+
+    async def fetch_compare_diff(
+        self,
+        pr_number: int,
+        base_sha: str,
+        head_sha: str,
+        issue_refs: list[str] | None = None,
+    ) -> PRDiff | None:
+        """
+        Fetches only the changes between two commits of a Pull Request.
+        Returns None when the range cannot be reviewed incrementally (after
+        a force push, when it merges in other commits such as the base
+        branch, or when GitHub truncates the file list), so callers fall
+        back to the full diff.
+        """
+        import logging
+
+        logger = logging.getLogger(__name__)
+
+        compare_url = f"{self.base_url}/repos/{self.repo_owner}/{self.repo_name}/compare/{base_sha}...{head_sha}"
+        compare_response = await self._request("GET", compare_url, Priority.NORMAL)
+
+        if compare_response.status_code != 200:
+            logger.warning(
+                "GitHub compare API error %d for PR #%d",
+                compare_response.status_code,
+                pr_number,
+            )
+            return None
+
+        compare_data = compare_response.json()
+        if compare_data.get("status") != "ahead":
+            logger.info(
+                "Commit %s is %s of %s, falling back to a full review",
+                head_sha,
+                compare_data.get("status"),
+                base_sha,
+            )
+            return None
+
+        # A merge brings in changes the PR did not make (and moves its merge
+        # base when the base branch is merged in); the diff against the base
+        # is the only accurate view then
+        commits = compare_data.get("commits", [])
+        if compare_data.get("total_commits", len(commits)) > len(commits) or any(
+            len(commit.get("parents", [])) > 1 for commit in commits
+        ):
+            logger.info(
+                "Commits since %s include merges, falling back to a full review",
+                base_sha,
+            )
+            return None
+
+        files = compare_data.get("files", [])
+        if len(files) >= COMPARE_MAX_FILES:
+            logger.info(
+                "Compare of %s...%s may be truncated at %d files, falling back "
+                "to a full review",
+                base_sha,
+                head_sha,
+                len(files),
+            )
+            return None
+
+        async def iter_files() -> AsyncIterator[dict]:
+            for file_data in files:
+                yield file_data
+
+        return await self._build_diff(pr_number, iter_files(), issue_refs)
+
+    async def _build_diff(
+        self,
+        pr_number: int,
+        files: AsyncIterator[dict],
+        issue_refs: list[str] | None = None,
+    ) -> PRDiff:
+        """Parse file patches as they stream in and attach linked issue context"""
+        import logging
+
+        logger = logging.getLogger(__name__)
+
+        # Linked issues are fetched while the file pages stream in
+        issue_task = asyncio.create_task(
+            self.fetch_issue_details(pr_number, issue_refs)
+        )
+        attributes_task = (
+            asyncio.create_task(self.fetch_gitattributes())
+            if self.skipped_files != "off"
+            else None
+        )
+        classifier = None
+        diff = PRDiff(modes=self.compaction, context_lines=self.context_lines)
+        try:
+            async for file_data in files:
+                if attributes_task and classifier is None:
+                    classifier = FileClassifier(await attributes_task)
+                reason = classifier and classifier.classify(file_data)
+                if reason:
+                    diff.skipped[file_data["filename"]] = reason
+                    if self.skipped_files == "summarize":
+                        diff.skipped_stubs.append(skipped_file(file_data, reason))
+                elif is_reviewable(file_data, self.compaction):
+                    diff.files.append(parse_file(file_data))
+        except BaseException:
+            issue_task.cancel()
+            if attributes_task:
+                attributes_task.cancel()
+            raise
+        if attributes_task and classifier is None:
+            attributes_task.cancel()
+
+        if diff.skipped:
+            logger.info(
+                "Skipped %d files of PR #%d: %s",
+                len(diff.skipped),
+                pr_number,
+                ", ".join(f"{name} ({why})" for name, why in diff.skipped.items()),
+            )
 
         # Add issue context
-        issue_context = self.fetch_issue_details(pr_number)
+        issue_context = await issue_task
         if issue_context and "No linked issues" not in issue_context:
-            return f"=== LINKED ISSUES ===\n{issue_context}\n\n=== CODE CHANGES ===\n{diff_content}"
+            diff.issue_context = issue_context
 
-        return diff_content
+        return diff
 
-    def post_review_comment(self, pr_number: int, comment_body: str) -> bool:
+    async def fetch_gitattributes(self) -> str:
+        """
+        The repository's .gitattributes on the default branch (empty if there
+        is none), cached for gitattributes_ttl seconds.
+        """
+        import logging
+
+        logger = logging.getLogger(__name__)
+
+        if (
+            self._gitattributes
+            and time.monotonic() - self._gitattributes[0] < self.gitattributes_ttl
+        ):
+            return self._gitattributes[1]
+
+        url = f"{self.base_url}/repos/{self.repo_owner}/{self.repo_name}/contents/.gitattributes"
+        try:
+            response = await self._request(
+                "GET",
+                url,
+                Priority.LOW,
+                headers={"Accept": "application/vnd.github.raw+json"},
+            )
+        except httpx.HTTPError as exc:
+            logger.warning("Could not fetch .gitattributes: %r", exc)
+            return ""
+        if response.status_code == 200:
+            text = response.text
+        elif response.status_code == 404:
+            text = ""
+        else:
+            logger.warning(
+                "GitHub API error %d fetching .gitattributes", response.status_code
+            )
+            return ""
+
+        self._gitattributes = (time.monotonic(), text)
+        return text
+
+    async def post_review_comment(self, pr_number: int, comment_body: str) -> bool:
         """
         Posts the final synthesized review as a comment on the Pull Request.
         """
+        await self.create_comment(pr_number, comment_body)
+        return True
+
+    async def create_comment(self, pr_number: int, comment_body: str) -> int:
+        """Posts a comment on the Pull Request and returns its id."""
         import logging
 
         logger = logging.getLogger(__name__)
@@ -85,53 +363,113 @@ class GitHubService:
         comment_url = f"{self.base_url}/repos/{self.repo_owner}/{self.repo_name}/issues/{pr_number}/comments"
         comment_data = {"body": comment_body}
 
-        response = requests.post(comment_url, headers=self.headers, json=comment_data)
+        response = await self._request(
+            "POST", comment_url, Priority.HIGH, json=comment_data
+        )
         response.raise_for_status()
 
         logger.info("Posted review comment to PR #%d", pr_number)
+        return response.json()["id"]
+
+    async def update_comment(
+        self, comment_id: int, comment_body: str, priority: Priority = Priority.HIGH
+    ) -> bool:
+        """Replaces the body of an existing comment."""
+        comment_url = f"{self.base_url}/repos/{self.repo_owner}/{self.repo_name}/issues/comments/{comment_id}"
+        response = await self._request(
+            "PATCH", comment_url, priority, json={"body": comment_body}
+        )
+        response.raise_for_status()
         return True
 
-    def fetch_issue_details(self, pr_number: int) -> str:
-        """Fetch linked issue details for context."""
+    async def delete_comment(self, comment_id: int) -> bool:
+        """Deletes a comment; True if it was deleted or already gone."""
+        comment_url = f"{self.base_url}/repos/{self.repo_owner}/{self.repo_name}/issues/comments/{comment_id}"
+        response = await self._request("DELETE", comment_url, Priority.HIGH)
+        if response.status_code != 404:
+            response.raise_for_status()
+        return True
+
+    async def fetch_issue_details(
+        self, pr_number: int, issue_refs: list[str] | None = None
+    ) -> str:
+        """
+        Fetch linked issue details for context. issue_refs are the #123
+        references in the PR title and body (find_issue_refs); they are
+        read from the PR when not given.
+        """
         import logging
-        import re
 
         logger = logging.getLogger(__name__)
 
-        # Get PR details
-        pr_url = f"{self.base_url}/repos/{self.repo_owner}/{self.repo_name}/pulls/{pr_number}"
-        pr_response = requests.get(pr_url, headers=self.headers)
-        pr_response.raise_for_status()
-        pr_data = pr_response.json()
-
-        # Get PR description and title
-        description = pr_data.get("body") or ""
-        title = pr_data.get("title") or ""
-
-        # Look for issue references (#123, closes #123, etc.)
-        issue_refs = re.findall(r"#(\d+)", f"{title} {description}")
+        if issue_refs is None:
+            # Get PR description and title
+            pr_url = f"{self.base_url}/repos/{self.repo_owner}/{self.repo_name}/pulls/{pr_number}"
+            pr_response = await self._request("GET", pr_url, Priority.LOW)
+            pr_response.raise_for_status()
+            pr_data = pr_response.json()
+            issue_refs = find_issue_refs(pr_data.get("title"), pr_data.get("body"))
 
         if not issue_refs:
             return "No linked issues found"
 
+        issue_ids = issue_refs
+        semaphore = asyncio.Semaphore(self.issue_concurrency)
+
+        async def fetch(issue_id: str) -> dict | None:
+            async with semaphore:
+                return await self._fetch_issue(issue_id)
+
+        issues = await asyncio.gather(*(fetch(issue_id) for issue_id in issue_ids))
+
         issue_details = []
-        for issue_id in set(issue_refs):  # Remove duplicates
-            issue_url = f"{self.base_url}/repos/{self.repo_owner}/{self.repo_name}/issues/{issue_id}"
-            issue_response = requests.get(issue_url, headers=self.headers)
-            if issue_response.status_code == 200:
-                issue_data = issue_response.json()
-                labels = [label["name"] for label in issue_data.get("labels", [])]
-                issue_details.append(
-                    f"Issue #{issue_id}: {issue_data['title']}\n"
-                    f"Description: {issue_data.get('body') or 'No description'}\n"
-                    f"Labels: {', '.join(labels) if labels else 'None'}\n"
-                    f"State: {issue_data['state']}"
-                )
-            else:
+        for issue_id, issue_data in zip(issue_ids, issues, strict=True):
+            if issue_data is None:
                 logger.warning("Could not fetch issue #%s", issue_id)
+                continue
+            issue_details.append(self._format_issue(issue_id, issue_data))
 
         return (
             "\n\n".join(issue_details)
             if issue_details
             else "No accessible issues found"
         )
+
+    @staticmethod
+    def _format_issue(issue_id: str, issue_data: dict) -> str:
+        """Render an issue (REST shape) as prompt context."""
+        labels = [label["name"] for label in issue_data.get("labels", [])]
+        return (
+            f"Issue #{issue_id}: {issue_data['title']}\n"
+            f"Description: {issue_data.get('body') or 'No description'}\n"
+            f"Labels: {', '.join(labels) if labels else 'None'}\n"
+            f"State: {issue_data['state']}"
+        )
+
+    async def _fetch_issue(self, issue_id: str) -> dict | None:
+        """
+        Fetch one issue through the TTL cache. Stale entries are revalidated
+        with If-None-Match; a 304 does not count against the rate limit.
+        """
+        cached = self.issue_cache.get(issue_id)
+        if cached and time.monotonic() - cached[0] < self.issue_cache_ttl:
+            return cached[2]
+
+        headers = {"If-None-Match": cached[1]} if cached and cached[1] else {}
+        issue_url = f"{self.base_url}/repos/{self.repo_owner}/{self.repo_name}/issues/{issue_id}"
+        issue_response = await self._request(
+            "GET", issue_url, Priority.LOW, headers=headers
+        )
+
+        if issue_response.status_code == 304 and cached:
+            self.issue_cache.set(issue_id, (time.monotonic(), cached[1], cached[2]))
+            return cached[2]
+        if issue_response.status_code != 200:
+            return None
+
+        issue_data = issue_response.json()
+        self.issue_cache.set(
+            issue_id,
+            (time.monotonic(), issue_response.headers.get("ETag"), issue_data),
+        )
+        return issue_data
@@ -0,0 +1,354 @@
+import asyncio
+import json
+import logging
+import os
+import random
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from psycopg2.extras import RealDictCursor
+
+from review_bot.services.memory_service import PostgresMemoryService
+from review_bot.services.rate_limiter import Priority
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[dict[str, Any]], Awaitable[None]]
+
+
+class PostgresJobQueue:
+    """Durable job table living in the same database as the review memory"""
+
+    def __init__(self, memory_service: PostgresMemoryService):
+        self.memory_service = memory_service
+        self.visibility_timeout = int(os.getenv("JOB_VISIBILITY_TIMEOUT", "600"))
+        self.max_attempts = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+        self.retry_base_delay = float(os.getenv("JOB_RETRY_BASE_DELAY", "30"))
+        self.retry_max_delay = float(os.getenv("JOB_RETRY_MAX_DELAY", "1800"))
+        self._init_schema()
+
+    def _init_schema(self):
+        """Initialize job table"""
+        with self.memory_service._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS review_jobs (
+                        id BIGSERIAL PRIMARY KEY,
+                        job_type TEXT NOT NULL,
+                        payload JSONB NOT NULL,
+                        dedupe_key TEXT,
+                        status TEXT NOT NULL DEFAULT 'pending',
+                        priority INTEGER NOT NULL DEFAULT 1,
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        max_attempts INTEGER NOT NULL,
+                        run_after TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                        locked_until TIMESTAMP,
+                        last_error TEXT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                # Tables created before jobs had a priority
+                cur.execute("""
+                    ALTER TABLE review_jobs
+                    ADD COLUMN IF NOT EXISTS priority INTEGER NOT NULL DEFAULT 1
+                """)
+                cur.execute("DROP INDEX IF EXISTS review_jobs_ready_idx")
+                cur.execute("""
+                    CREATE INDEX IF NOT EXISTS review_jobs_claim_idx
+                    ON review_jobs (status, priority, run_after)
+                """)
+                # At most one pending job per key, e.g. one review per PR
+                cur.execute("""
+                    CREATE UNIQUE INDEX IF NOT EXISTS review_jobs_pending_dedupe_idx
+                    ON review_jobs (dedupe_key) WHERE status = 'pending'
+                """)
+                conn.commit()
+        logger.info("Job queue schema initialized")
+
+    def enqueue(
+        self,
+        job_type: str,
+        payload: dict[str, Any],
+        dedupe_key: str | None = None,
+        priority: Priority = Priority.NORMAL,
+    ) -> int:
+        """
+        Insert a new pending job and return its id. If a pending job with the
+        same dedupe_key exists, its payload is replaced instead.
+        """
+        with self.memory_service._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO review_jobs
+                        (job_type, payload, dedupe_key, max_attempts, priority)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (dedupe_key) WHERE status = 'pending'
+                    DO UPDATE SET payload = EXCLUDED.payload, updated_at = NOW()
+                    RETURNING id
+                """,
+                    (
+                        job_type,
+                        json.dumps(payload),
+                        dedupe_key,
+                        self.max_attempts,
+                        int(priority),
+                    ),
+                )
+                job_id = cur.fetchone()[0]
+                conn.commit()
+        logger.info("Enqueued %s job %d", job_type, job_id)
+        return job_id
+
+    def pending_payload(self, dedupe_key: str) -> dict[str, Any] | None:
+        """Payload of the pending job with this dedupe_key, if there is one"""
+        with self.memory_service._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT payload FROM review_jobs
+                    WHERE dedupe_key = %s AND status = 'pending'
+                """,
+                    (dedupe_key,),
+                )
+                row = cur.fetchone()
+        return row[0] if row else None
+
+    def claim(self, max_priority: Priority = Priority.LOW) -> dict[str, Any] | None:
+        """
+        Claim the next ready job, or a running job whose visibility timeout
+        expired because its worker died, highest priority first and only up
+        to max_priority. Concurrent workers skip rows that another
+        transaction has already locked.
+        """
+        with self.memory_service._get_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(
+                    """
+                    UPDATE review_jobs
+                    SET status = 'running',
+                        attempts = attempts + 1,
+                        locked_until = NOW() + make_interval(secs => %s),
+                        updated_at = NOW()
+                    WHERE id = (
+                        SELECT id FROM review_jobs
+                        WHERE ((status = 'pending' AND run_after <= NOW())
+                           OR (status = 'running' AND locked_until < NOW()))
+                          AND priority <= %s
+                        ORDER BY priority, run_after, id
+                        FOR UPDATE SKIP LOCKED
+                        LIMIT 1
+                    )
+                    RETURNING id, job_type, payload, attempts, max_attempts
+                """,
+                    (self.visibility_timeout, int(max_priority)),
+                )
+                job = cur.fetchone()
+                conn.commit()
+        return dict(job) if job else None
+
+    def extend(self, job_id: int) -> None:
+        """Push the visibility timeout of a running job forward"""
+        with self.memory_service._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE review_jobs
+                    SET locked_until = NOW() + make_interval(secs => %s),
+                        updated_at = NOW()
+                    WHERE id = %s AND status = 'running'
+                """,
+                    (self.visibility_timeout, job_id),
+                )
+                conn.commit()
+
+    def complete(self, job_id: int) -> None:
+        """Mark a job as done"""
+        with self.memory_service._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE review_jobs
+                    SET status = 'done', locked_until = NULL, updated_at = NOW()
+                    WHERE id = %s
+                """,
+                    (job_id,),
+                )
+                conn.commit()
+
+    def fail(self, job_id: int, attempts: int, max_attempts: int, error: str) -> None:
+        """Reschedule a failed job with jittered exponential backoff"""
+        if attempts >= max_attempts:
+            status, delay = "failed", 0.0
+        else:
+            status = "pending"
+            delay = min(
+                self.retry_base_delay * 2 ** (attempts - 1), self.retry_max_delay
+            )
+            delay *= random.uniform(0.5, 1.0)
+
+        with self.memory_service._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE review_jobs
+                    SET status = CASE
+                            WHEN %s = 'pending' AND EXISTS (
+                                SELECT 1 FROM review_jobs newer
+                                WHERE newer.dedupe_key = review_jobs.dedupe_key
+                                  AND newer.status = 'pending'
+                            ) THEN 'superseded'
+                            ELSE %s
+                        END,
+                        run_after = NOW() + make_interval(secs => %s),
+                        locked_until = NULL,
+                        last_error = %s,
+                        updated_at = NOW()
+                    WHERE id = %s
+                """,
+                    (status, status, delay, error[:2000], job_id),
+                )
+                conn.commit()
+
+        if status == "failed":
+            logger.error("Job %d failed permanently: %s", job_id, error)
+        else:
+            logger.warning(
+                "Job %d attempt %d failed, retrying in %.0fs: %s",
+                job_id,
+                attempts,
+                delay,
+                error,
+            )
+
+
+class JobWorkerPool:
+    """
+    Fixed pool of worker coroutines draining a PostgresJobQueue. Besides
+    the regular workers, priority_workers only take high-priority jobs, so
+    those start even while every regular worker is busy.
+    """
+
+    def __init__(
+        self,
+        queue: PostgresJobQueue,
+        handlers: dict[str, JobHandler],
+        concurrency: int | None = None,
+    ):
+        self.queue = queue
+        self.handlers = handlers
+        self.concurrency = concurrency or int(os.getenv("REVIEW_WORKERS", "4"))
+        self.priority_workers = int(os.getenv("JOB_PRIORITY_WORKERS", "1"))
+        self.poll_interval = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+        self._wakeup = asyncio.Event()
+        self._workers: list[asyncio.Task] = []
+
+    async def enqueue(
+        self,
+        job_type: str,
+        payload: dict[str, Any],
+        dedupe_key: str | None = None,
+        priority: Priority = Priority.NORMAL,
+    ) -> int:
+        """Persist a job and wake an idle worker"""
+        job_id = await asyncio.to_thread(
+            self.queue.enqueue, job_type, payload, dedupe_key, priority
+        )
+        self._wakeup.set()
+        return job_id
+
+    async def pending_payload(self, dedupe_key: str) -> dict[str, Any] | None:
+        return await asyncio.to_thread(self.queue.pending_payload, dedupe_key)
+
+    def start(self) -> None:
+        """Start the worker coroutines"""
+        for index in range(self.concurrency + self.priority_workers):
+            max_priority = Priority.LOW if index < self.concurrency else Priority.HIGH
+            self._workers.append(
+                asyncio.create_task(
+                    self._worker(index, max_priority), name=f"review-worker-{index}"
+                )
+            )
+        logger.info(
+            "Started %d job workers (%d for high-priority jobs only)",
+            self.concurrency + self.priority_workers,
+            self.priority_workers,
+        )
+
+    async def stop(self) -> None:
+        """Cancel the workers; interrupted jobs are retried after their timeout"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+        logger.info("Stopped job workers")
+
+    async def _worker(self, index: int, max_priority: Priority) -> None:
+        while True:
+            try:
+                job = await asyncio.to_thread(self.queue.claim, max_priority)
+            except Exception:
+                logger.exception("Worker %d could not claim a job", index)
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except TimeoutError:
+                    pass
+                continue
+
+            await self._run_job(job)
+
+    async def _run_job(self, job: dict[str, Any]) -> None:
+        job_id = job["id"]
+        if job["attempts"] > job["max_attempts"]:
+            # Worker died mid-run on the last attempt
+            await asyncio.to_thread(
+                self.queue.fail,
+                job_id,
+                job["attempts"],
+                job["max_attempts"],
+                "Visibility timeout expired on final attempt",
+            )
+            return
+
+        handler = self.handlers.get(job["job_type"])
+        if handler is None:
+            await asyncio.to_thread(
+                self.queue.fail,
+                job_id,
+                job["max_attempts"],
+                job["max_attempts"],
+                f"No handler for job type {job['job_type']}",
+            )
+            return
+
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            await handler(job["payload"])
+        except Exception as exc:
+            logger.exception("Job %d raised", job_id)
+            await asyncio.to_thread(
+                self.queue.fail,
+                job_id,
+                job["attempts"],
+                job["max_attempts"],
+                f"{type(exc).__name__}: {exc}",
+            )
+        else:
+            await asyncio.to_thread(self.queue.complete, job_id)
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, job_id: int) -> None:
+        """Keep a long-running job invisible to other workers"""
+        interval = max(self.queue.visibility_timeout / 3, 1)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.queue.extend, job_id)
+            except Exception:
+                logger.exception("Failed to extend visibility of job %d", job_id)
@@ -1,34 +1,121 @@
+import asyncio
 import logging
 import os
+import time
 from typing import Any
 
+import httpx
 from langgraph.graph import END, START, StateGraph
 
-from review_bot.llm_clients.base_client import GeminiClient
+from review_bot.llm_clients.base_client import BaseLLMClient, GeminiClient
+from review_bot.llm_clients.caching import CachedLLMClient
+from review_bot.llm_clients.hedging import HedgedLLMClient
+from review_bot.llm_clients.limiter import RateLimitedLLMClient, llm_priority
+from review_bot.llm_clients.resilience import ResilientLLMClient
+from review_bot.services.async_memory_service import AsyncPostgresMemoryService
+from review_bot.services.cache_service import TieredCache
+from review_bot.services.diff_compaction import NUMBERED_LEGEND, compaction_modes
+from review_bot.services.diff_model import PRDiff, parse_diff_text
+from review_bot.services.file_filter import skipped_note
 from review_bot.services.github_service import GitHubService
+from review_bot.services.rate_limiter import Priority
 from review_bot.services.review_service import MRReviewState
+from review_bot.services.sharding import (
+    estimate_tokens,
+    reduce_findings,
+    shard_diff,
+    summarize_diff,
+)
+from review_bot.services.token_budget import TokenAccountant
 
 logger = logging.getLogger(__name__)
 
+STREAM_PLACEHOLDER = "_Review in progress..._"
+STREAM_IN_PROGRESS = "\n\n_Review in progress..._"
+STREAM_INTERRUPTED = "\n\n_Review interrupted; it will be retried._"
+
 
 class ReviewWorkflow:
-    def __init__(self):
-        self.github_service = GitHubService()
+    def __init__(
+        self,
+        llm_cache: TieredCache | None = None,
+        github_service: GitHubService | None = None,
+        review_store: AsyncPostgresMemoryService | None = None,
+    ):
+        # Share the caller's GitHub connection pool when one is given
+        self.github_service = github_service or GitHubService()
+        # Remembers which comment a review is posted in across job retries
+        self.review_store = review_store
+        # LLM responses keyed by model, params, system prompt and prompt
+        self.llm_cache = llm_cache
+        self.shard_tokens = int(os.getenv("REVIEW_SHARD_TOKENS", "6000"))
+        self.shard_concurrency = int(os.getenv("REVIEW_SHARD_CONCURRENCY", "8"))
+        self.judge_diff_tokens = int(os.getenv("JUDGE_DIFF_TOKENS", "20000"))
+        # Explains the line-numbered diff format to the models
+        self.diff_legend = (
+            f"{NUMBERED_LEGEND}\n\n" if "numbered" in compaction_modes() else ""
+        )
+        # Per-node prompt budgets and estimated vs. actual token usage
+        self.tokens = TokenAccountant()
+        # Stream the judge's review into a comment that updates in place
+        self.judge_streaming = os.getenv("JUDGE_STREAMING", "false").lower() == "true"
+        self.judge_stream_interval = float(os.getenv("JUDGE_STREAM_INTERVAL", "3"))
+
+        # Calls go to the fallback model while a model's circuit is open
+        fallback_model = os.getenv("LLM_FALLBACK_MODEL")
+        self.fallback_client = (
+            ResilientLLMClient(RateLimitedLLMClient(GeminiClient(fallback_model)))
+            if fallback_model
+            else None
+        )
 
         # Initialize all models with Gemini for cloud deployment
-        self.reviewer_a_client = GeminiClient(
+        self.reviewer_a_client = self._create_client(
             os.getenv("REVIEWER_A_MODEL", "gemini-1.5-pro")
         )
-        self.reviewer_b_client = GeminiClient(
+        self.reviewer_b_client = self._create_client(
             os.getenv("REVIEWER_B_MODEL", "gemini-1.5-pro")
         )
-        self.judge_client = GeminiClient(os.getenv("JUDGE_MODEL", "gemini-1.5-pro"))
+        self.judge_client = self._create_client(
+            os.getenv("JUDGE_MODEL", "gemini-1.5-pro")
+        )
 
         self.graph = self._build_graph()
 
         # Load prompts
         self.prompts = self._load_prompts()
 
+    def _create_client(self, model_name: str) -> BaseLLMClient:
+        """
+        Rate-limited Gemini client with optional hedging, behind the
+        resilience layer, behind the response cache. Each concrete client
+        has its own limiter, so retries, hedges and fallback calls are all
+        counted against the model that serves them.
+        """
+        client: BaseLLMClient = RateLimitedLLMClient(GeminiClient(model_name))
+        if os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true":
+            hedge_model = os.getenv("LLM_HEDGE_MODEL")
+            client = HedgedLLMClient(
+                client,
+                RateLimitedLLMClient(GeminiClient(hedge_model))
+                if hedge_model
+                else None,
+            )
+        client = ResilientLLMClient(client, fallback=self.fallback_client)
+        # Cache hits skip the queue entirely
+        return CachedLLMClient(client, self.llm_cache) if self.llm_cache else client
+
+    async def aclose(self) -> None:
+        """Close the LLM clients' network resources"""
+        for client in (
+            self.reviewer_a_client,
+            self.reviewer_b_client,
+            self.judge_client,
+            self.fallback_client,
+        ):
+            if client:
+                await client.aclose()
+
     def _load_prompts(self) -> dict[str, str]:
         """Load all prompt templates"""
         prompts = {}
@@ -51,7 +138,64 @@ class ReviewWorkflow:
 
         return prompts
 
-    def reviewer_a_node(self, state: MRReviewState) -> MRReviewState:
+    def _reviewer_header(self, state: MRReviewState) -> str:
+        """
+        Reviewer prompt header, flagging incremental diffs as such. It names
+        no commit, so identical shards hit the response cache across
+        re-reviews, rebases and force-pushes.
+        """
+        if state.get("previous_head_sha"):
+            return f"{self.diff_legend}Code changes since the last reviewed commit:\n\n"
+        return f"{self.diff_legend}Code diff to review:\n\n"
+
+    async def _review_shard(
+        self, client: BaseLLMClient, prompt_key: str, header: str, text: str
+    ) -> str:
+        """Review a single shard"""
+        system_prompt = self.prompts.get(prompt_key, "")
+        text = await self.tokens.fit_diff(
+            client, "reviewer", text, system_prompt + header
+        )
+        response = await client.generate_structured_response(
+            prompt=header + text, system_prompt=system_prompt
+        )
+        if not isinstance(response, dict):
+            return ""
+        self.tokens.record(
+            "reviewer", client.model_name, system_prompt + header + text, response
+        )
+        return response.get("response", "")
+
+    async def _review_files(
+        self, client: BaseLLMClient, prompt_key: str, state: MRReviewState
+    ) -> str:
+        """
+        Map-reduce review: shard the diff by file and hunk, review shards in
+        parallel with bounded concurrency and merge their findings.
+        """
+        header = self._reviewer_header(state)
+        shards = shard_diff(state["diff"], self.shard_tokens)
+        if not shards:
+            return await self._review_shard(
+                client, prompt_key, header, state["diff_text"]
+            )
+        logger.info("Reviewing %d shards with %s", len(shards), client.model_name)
+
+        semaphore = asyncio.Semaphore(self.shard_concurrency)
+
+        async def review(text: str) -> str:
+            async with semaphore:
+                return await self._review_shard(client, prompt_key, header, text)
+
+        results = await asyncio.gather(*(review(shard.text) for shard in shards))
+        return reduce_findings(
+            [
+                (shard.label, result)
+                for shard, result in zip(shards, results, strict=True)
+            ]
+        )
+
+    async def reviewer_a_node(self, state: MRReviewState) -> dict[str, Any]:
         """Security and performance reviewer"""
         logger.info("=== REVIEWER A (Security/Performance) ===")
         logger.info("Input diff size: %d characters", len(state["diff_text"]))
@@ -59,16 +203,12 @@ class ReviewWorkflow:
             "System prompt: %s", self.prompts.get("reviewer_a", "NO PROMPT")[:200]
         )
 
-        response = self.reviewer_a_client.generate_structured_response(
-            prompt=f"Code diff to review:\n\n{state['diff_text']}",
-            system_prompt=self.prompts.get("reviewer_a", ""),
-        )
+        response = await self._review_files(self.reviewer_a_client, "reviewer_a", state)
 
-        logger.info("Reviewer A output: %s", str(response)[:500])
-        state["review_a_output"] = str(response)
-        return state
+        logger.info("Reviewer A output: %s", response[:500])
+        return {"review_a_output": response}
 
-    def reviewer_b_node(self, state: MRReviewState) -> MRReviewState:
+    async def reviewer_b_node(self, state: MRReviewState) -> dict[str, Any]:
         """Readability and maintainability reviewer"""
         logger.info("=== REVIEWER B (Code Quality) ===")
         logger.info("Input diff size: %d characters", len(state["diff_text"]))
@@ -76,23 +216,45 @@ class ReviewWorkflow:
             "System prompt: %s", self.prompts.get("reviewer_b", "NO PROMPT")[:200]
         )
 
-        response = self.reviewer_b_client.generate_structured_response(
-            prompt=f"Code diff to review:\n\n{state['diff_text']}",
-            system_prompt=self.prompts.get("reviewer_b", ""),
-        )
+        response = await self._review_files(self.reviewer_b_client, "reviewer_b", state)
 
-        logger.info("Reviewer B output: %s", str(response)[:500])
-        state["review_b_output"] = str(response)
-        return state
+        logger.info("Reviewer B output: %s", response[:500])
+        return {"review_b_output": response}
 
-    def judge_node(self, state: MRReviewState) -> MRReviewState:
+    async def judge_node(self, state: MRReviewState) -> dict[str, Any]:
         """Synthesize reviews and post final comment"""
         logger.info("=== JUDGE (Synthesis) ===")
 
-        judge_input = f"""
-Original Code Diff:
-{state["diff_text"]}
+        # The reviewers saw every shard; past a budget the judge only gets
+        # an overview of the diff next to their merged findings
+        diff_text = state["diff_text"]
+        if estimate_tokens(diff_text) > self.judge_diff_tokens:
+            diff_text = summarize_diff(state["diff"])
+
+        # Skipped files reach the judge only as one-line stand-ins
+        skipped = state["diff"].render_skipped()
+        if skipped:
+            skipped = f"\nFiles Left Out of the Review:\n{skipped}\n"
+
+        def build_input(diff_text: str) -> str:
+            if state.get("previous_review"):
+                return f"""
+{self.diff_legend}Code Changes Since Last Reviewed Commit {state["previous_head_sha"]}:
+{diff_text}
+{skipped}
+Previous Review (files not in the changes above are unchanged since):
+{state["previous_review"]}
+
+Security/Performance Review of the New Changes:
+{state.get("review_a_output", "No output")}
 
+Readability/Maintainability Review of the New Changes:
+{state.get("review_b_output", "No output")}
+"""
+            return f"""
+{self.diff_legend}Original Code Diff:
+{diff_text}
+{skipped}
 Security/Performance Review:
 {state.get("review_a_output", "No output")}
 
@@ -100,30 +262,138 @@ Readability/Maintainability Review:
 {state.get("review_b_output", "No output")}
 """
 
+        # The reviews are the judge's main input, so only the diff is trimmed
+        system_prompt = self.prompts.get("judge", "")
+        diff_text = await self.tokens.fit_diff(
+            self.judge_client, "judge", diff_text, system_prompt + build_input("")
+        )
+        judge_input = build_input(diff_text)
+
         logger.info("Judge input size: %d characters", len(judge_input))
         logger.info("System prompt: %s", self.prompts.get("judge", "NO PROMPT")[:200])
 
-        response = self.judge_client.generate_structured_response(
-            prompt=judge_input, system_prompt=self.prompts.get("judge", "")
+        # Tell the PR which files the review left out
+        footer = skipped_note(state["diff"].skipped)
+
+        if self.judge_streaming:
+            final_review = await self._stream_judge(state, judge_input, footer)
+            # Streams report no usage, so only the estimate is recorded
+            self.tokens.record(
+                "judge", self.judge_client.model_name, system_prompt + judge_input, {}
+            )
+            logger.info("Judge output: %s", final_review[:500])
+            return {"judge_output": final_review}
+
+        response = await self.judge_client.generate_structured_response(
+            prompt=judge_input, system_prompt=system_prompt
+        )
+        self.tokens.record(
+            "judge", self.judge_client.model_name, system_prompt + judge_input, response
         )
 
-        final_review = response if isinstance(response, str) else str(response)
+        final_review = response.get("response", "") + footer
         logger.info("Judge output: %s", final_review[:500])
-        state["judge_output"] = final_review
 
-        # Post the review
-        success = self.github_service.post_review_comment(state["mr_iid"], final_review)
-        logger.info("Posted review comment: %s", success)
+        # Post the review, over what an interrupted earlier attempt left
+        comment_id = await self._write_comment(
+            state, state.get("comment_id"), final_review, final=True
+        )
+        logger.info("Posted review comment %d", comment_id)
+
+        return {"judge_output": final_review}
 
-        return state
+    async def _write_comment(
+        self,
+        state: MRReviewState,
+        comment_id: int | None,
+        body: str,
+        final: bool = False,
+    ) -> int:
+        """
+        Write body into comment_id, or into a new comment if there is none
+        (or it was deleted), and return the comment's id. New comments and
+        final reviews are recorded before returning, so a retried job edits
+        the comment and does not post a finished review again.
+        """
+        created = False
+        if comment_id:
+            try:
+                await self.github_service.update_comment(comment_id, body)
+            except httpx.HTTPStatusError as exc:
+                if exc.response.status_code != 404:
+                    raise
+                comment_id = None
+        if not comment_id:
+            comment_id = await self.github_service.create_comment(state["mr_iid"], body)
+            created = True
+        if self.review_store and state.get("head_sha") and (created or final):
+            await self.review_store.save_review_comment(
+                state["project_id"],
+                state["mr_iid"],
+                state["head_sha"],
+                comment_id,
+                body if final else None,
+            )
+        return comment_id
+
+    async def _stream_judge(
+        self, state: MRReviewState, judge_input: str, footer: str = ""
+    ) -> str:
+        """
+        Stream the judge's review into a PR comment that is created up front
+        and updated in place every judge_stream_interval seconds. A retry
+        streams into the comment of the attempt it replaces.
+        """
+        comment_id = await self._write_comment(
+            state, state.get("comment_id"), STREAM_PLACEHOLDER
+        )
+        chunks: list[str] = []
+        last_update = time.monotonic()
+        try:
+            async for chunk in self.judge_client.astream_response(
+                judge_input, self.prompts.get("judge", "")
+            ):
+                chunks.append(chunk)
+                if time.monotonic() - last_update >= self.judge_stream_interval:
+                    # Interim updates yield to other GitHub calls
+                    await self.github_service.update_comment(
+                        comment_id,
+                        "".join(chunks) + STREAM_IN_PROGRESS,
+                        Priority.NORMAL,
+                    )
+                    last_update = time.monotonic()
+        except Exception:
+            try:
+                await self.github_service.update_comment(
+                    comment_id, "".join(chunks) + STREAM_INTERRUPTED
+                )
+            except Exception:
+                logger.exception("Could not mark comment %d interrupted", comment_id)
+            raise
+        except BaseException:
+            # Cancelled, e.g. superseded by a newer push: a half-written
+            # review would otherwise stay on the PR
+            try:
+                await self.github_service.delete_comment(comment_id)
+            except Exception:
+                logger.exception("Could not delete comment %d", comment_id)
+            raise
+
+        final_review = "".join(chunks) + footer
+        comment_id = await self._write_comment(
+            state, comment_id, final_review, final=True
+        )
+        logger.info("Streamed review into comment %d", comment_id)
+        return final_review
 
-    def justify_node(self, state: MRReviewState) -> MRReviewState:
+    async def justify_node(self, state: MRReviewState) -> dict[str, Any]:
         """Handle human feedback and justify/correct review"""
         logger.info("=== JUSTIFY (Human Feedback) ===")
 
-        justify_input = f"""
-Original Code Diff:
-{state["diff_text"]}
+        def build_input(diff_text: str) -> str:
+            return f"""
+{self.diff_legend}Original Code Diff:
+{diff_text}
 
 Original AI Review:
 {state.get("original_review", "")}
@@ -132,23 +402,37 @@ Human Feedback:
 {state.get("human_comment", "")}
 """
 
+        system_prompt = self.prompts.get("justify", "")
+        diff_text = await self.tokens.fit_diff(
+            self.judge_client,
+            "justify",
+            state["diff_text"],
+            system_prompt + build_input(""),
+        )
+        justify_input = build_input(diff_text)
+
         logger.info("Justify input size: %d characters", len(justify_input))
 
-        response = self.judge_client.generate_structured_response(
-            prompt=justify_input, system_prompt=self.prompts.get("justify", "")
+        response = await self.judge_client.generate_structured_response(
+            prompt=justify_input, system_prompt=system_prompt
+        )
+        self.tokens.record(
+            "justify",
+            self.judge_client.model_name,
+            system_prompt + justify_input,
+            response,
         )
 
-        justified_review = response if isinstance(response, str) else str(response)
+        justified_review = response.get("response", "")
         logger.info("Justify output: %s", justified_review[:500])
-        state["justified_review_text"] = justified_review
 
         # Post justification as reply
-        success = self.github_service.post_review_comment(
+        success = await self.github_service.post_review_comment(
             state["mr_iid"], justified_review
         )
         logger.info("Posted justification comment: %s", success)
 
-        return state
+        return {"justified_review_text": justified_review}
 
     def _build_graph(self) -> StateGraph:
         """Build the LangGraph workflow"""
@@ -160,10 +444,11 @@ Human Feedback:
         graph.add_node("judge", self.judge_node)
         graph.add_node("justify", self.justify_node)
 
-        # Sequential review flow to avoid concurrent updates
+        # Fan out to both reviewers in the same step; they write separate
+        # state keys, and the judge joins once both have finished
         graph.add_edge(START, "reviewer_a")
-        graph.add_edge("reviewer_a", "reviewer_b")
-        graph.add_edge("reviewer_b", "judge")
+        graph.add_edge(START, "reviewer_b")
+        graph.add_edge(["reviewer_a", "reviewer_b"], "judge")
         graph.add_edge("judge", END)
 
         # Justification flow (separate entry point)
@@ -171,10 +456,22 @@ Human Feedback:
 
         return graph.compile()
 
-    def run_review(
-        self, project_id: int, mr_iid: int, diff_text: str
+    async def run_review(
+        self,
+        project_id: int,
+        mr_iid: int,
+        diff_text: str,
+        previous_review: str | None = None,
+        previous_head_sha: str | None = None,
+        diff: PRDiff | None = None,
+        head_sha: str | None = None,
+        comment_id: int | None = None,
     ) -> dict[str, Any]:
-        """Run the main review workflow"""
+        """
+        Run the main review workflow. `diff` is diff_text already parsed;
+        it is parsed from the text when not given. `comment_id` is the
+        comment an earlier attempt at reviewing head_sha posted in.
+        """
         logger.info("=== STARTING REVIEW WORKFLOW ===")
         logger.info(
             "Project ID: %d, MR: %d, Diff size: %d", project_id, mr_iid, len(diff_text)
@@ -182,23 +479,28 @@ Human Feedback:
 
         initial_state = MRReviewState(
             diff_text=diff_text,
+            diff=diff if diff is not None else parse_diff_text(diff_text),
             project_id=project_id,
             mr_iid=mr_iid,
             review_a_output=None,
             review_b_output=None,
             judge_output=None,
             error_message=[],
+            head_sha=head_sha,
+            comment_id=comment_id,
+            previous_review=previous_review,
+            previous_head_sha=previous_head_sha,
             original_review=None,
             human_comment=None,
             justified_review_text=None,
         )
 
         logger.info("Invoking LangGraph workflow...")
-        result = self.graph.invoke(initial_state)
+        result = await self.graph.ainvoke(initial_state)
         logger.info("=== WORKFLOW COMPLETED ===")
         return result
 
-    def run_justification(
+    async def run_justification(
         self,
         project_id: int,
         mr_iid: int,
@@ -209,12 +511,17 @@ Human Feedback:
         """Run justification workflow for human feedback"""
         initial_state = MRReviewState(
             diff_text=diff_text,
+            diff=parse_diff_text(diff_text),
             project_id=project_id,
             mr_iid=mr_iid,
             review_a_output=None,
             review_b_output=None,
             judge_output=None,
             error_message=[],
+            head_sha=None,
+            comment_id=None,
+            previous_review=None,
+            previous_head_sha=None,
             original_review=original_review,
             human_comment=human_comment,
             justified_review_text=None,
@@ -227,5 +534,7 @@ Human Feedback:
         justify_graph.add_edge("justify", END)
 
         compiled_justify_graph = justify_graph.compile()
-        result = compiled_justify_graph.invoke(initial_state)
+        # A human is waiting on the reply, so it jumps the LLM queues
+        with llm_priority(Priority.HIGH):
+            result = await compiled_justify_graph.ainvoke(initial_state)
         return result
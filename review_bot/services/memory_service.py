@@ -1,35 +1,188 @@
+import hashlib
 import logging
 import os
 
 import psycopg2
-from psycopg2.extras import RealDictCursor
+import zstandard
+from psycopg2.extras import RealDictCursor, execute_values
+
+from review_bot.services.db_pool import PostgresConnectionPool
+from review_bot.services.diff_utils import CHANGES_HEADER, ISSUES_HEADER, split_diff
 
 logger = logging.getLogger(__name__)
 
 
+def diff_chunks(diff_text: str) -> list[str]:
+    """
+    Split prompt diff text into content-addressable chunks: the linked issue
+    header, then one chunk per file section. The text is chunks[0] plus the
+    other chunks joined by newlines. Text that does not split cleanly is
+    kept as a single chunk.
+    """
+    issue_context, sections = split_diff(diff_text)
+    head = (
+        f"{ISSUES_HEADER}\n{issue_context}\n\n{CHANGES_HEADER}\n"
+        if issue_context
+        else ""
+    )
+    chunks = [head, *sections.values()]
+    if join_chunks(chunks) != diff_text:
+        return [diff_text]
+    return chunks
+
+
+def join_chunks(chunks: list[str]) -> str:
+    return chunks[0] + "\n".join(chunks[1:])
+
+
+def chunk_hash(chunk: str) -> str:
+    return hashlib.sha256(chunk.encode()).hexdigest()
+
+
+def connection_params() -> str | dict:
+    """Connection settings from the environment"""
+    # Use DATABASE_URL for Railway, fallback to individual vars
+    database_url = os.getenv("DATABASE_URL")
+    if database_url:
+        return database_url
+    return {
+        "host": os.getenv("DB_HOST", "localhost"),
+        "database": os.getenv("DB_NAME", "reviewbot"),
+        "user": os.getenv("DB_USER", "postgres"),
+        "password": os.getenv("DB_PASSWORD", "postgres"),
+        "port": os.getenv("DB_PORT", "5432"),
+        "connect_timeout": 10,
+    }
+
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS mr_reviews (
+        mr_iid INTEGER,
+        project_id INTEGER,
+        diff_text TEXT,
+        final_review_text TEXT,
+        review_comment_id INTEGER,
+        last_reviewed_sha TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (project_id, mr_iid)
+    )
+    """,
+    # Tables created before incremental reviews lack this column
+    """
+    ALTER TABLE mr_reviews
+    ADD COLUMN IF NOT EXISTS last_reviewed_sha TEXT
+    """,
+    # Diff chunks by content hash; rows written before this keep their
+    # diff in diff_text
+    """
+    CREATE TABLE IF NOT EXISTS diff_blobs (
+        hash TEXT PRIMARY KEY,
+        data BYTEA NOT NULL,
+        raw_size INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    ALTER TABLE mr_reviews
+    ADD COLUMN IF NOT EXISTS diff_chunks TEXT[]
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_mr_reviews_diff_chunks
+    ON mr_reviews USING GIN (diff_chunks)
+    """,
+    # The comment a PR's review for a head SHA is posted in, so a retried
+    # job edits it instead of posting another. review_text is set once the
+    # final review is posted, and then a retry does not post it again.
+    """
+    CREATE TABLE IF NOT EXISTS review_comments (
+        project_id INTEGER,
+        mr_iid INTEGER,
+        head_sha TEXT NOT NULL,
+        comment_id BIGINT NOT NULL,
+        review_text TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (project_id, mr_iid)
+    )
+    """,
+]
+
+SAVE_REVIEW = """
+    INSERT INTO mr_reviews (project_id, mr_iid, diff_text, diff_chunks, final_review_text, review_comment_id, last_reviewed_sha)
+    VALUES (%s, %s, NULL, %s, %s, %s, %s)
+    ON CONFLICT (project_id, mr_iid)
+    DO UPDATE SET
+        diff_text = NULL,
+        diff_chunks = EXCLUDED.diff_chunks,
+        final_review_text = EXCLUDED.final_review_text,
+        review_comment_id = EXCLUDED.review_comment_id,
+        last_reviewed_sha = EXCLUDED.last_reviewed_sha
+"""
+
+# Deletes chunks no review references; rows locked by a save are skipped
+COLLECT_BLOBS = """
+    DELETE FROM diff_blobs WHERE hash IN (
+        SELECT hash FROM diff_blobs b
+        WHERE NOT EXISTS (
+            SELECT 1 FROM mr_reviews r
+            WHERE r.diff_chunks @> ARRAY[b.hash]
+        )
+        FOR UPDATE SKIP LOCKED
+    )
+"""
+
+STORAGE_STATS = """
+    SELECT pg_total_relation_size('mr_reviews'),
+           pg_total_relation_size('diff_blobs'),
+           COUNT(*), COALESCE(SUM(raw_size), 0),
+           COALESCE(SUM(octet_length(data)), 0)
+    FROM diff_blobs
+"""
+
+
+def storage_stats_row(row: tuple) -> dict:
+    reviews_bytes, blobs_bytes, chunks, raw, compressed = row
+    return {
+        "mr_reviews_bytes": reviews_bytes,
+        "diff_blobs_bytes": blobs_bytes,
+        "diff_chunks": chunks,
+        "diff_raw_bytes": int(raw),
+        "diff_compressed_bytes": int(compressed),
+    }
+
+
 class PostgresMemoryService:
+    """
+    Blocking psycopg2 implementation, used from threads (job queue, cache)
+    and scripts. AsyncPostgresMemoryService serves the request path.
+    """
+
     def __init__(self):
-        # Use DATABASE_URL for Railway, fallback to individual vars
-        database_url = os.getenv("DATABASE_URL")
-        if database_url:
-            self.connection_params = database_url
-        else:
-            self.connection_params = {
-                "host": os.getenv("DB_HOST", "localhost"),
-                "database": os.getenv("DB_NAME", "reviewbot"),
-                "user": os.getenv("DB_USER", "postgres"),
-                "password": os.getenv("DB_PASSWORD", "postgres"),
-                "port": os.getenv("DB_PORT", "5432"),
-                "connect_timeout": 10,
-            }
+        self.connection_params = connection_params()
+        # Diffs are stored as zstd-compressed chunks shared between reviews
+        self.compressor = zstandard.ZstdCompressor(
+            level=int(os.getenv("DIFF_ZSTD_LEVEL", "9"))
+        )
+        self.decompressor = zstandard.ZstdDecompressor()
+        # Drop unreferenced chunks once every this many saves
+        self.blob_gc_every = int(os.getenv("DIFF_BLOB_GC_EVERY", "100"))
+        self._saves = 0
+        # One pool for the service and everything built on it (cache, queue)
+        self.pool = PostgresConnectionPool(self.connection_params)
         self._init_schema()
 
     def _get_connection(self):
-        """Get database connection"""
-        if isinstance(self.connection_params, str):
-            return psycopg2.connect(self.connection_params)
-        else:
-            return psycopg2.connect(**self.connection_params)
+        """
+        Check out a pooled connection for one transaction; use as a context
+        manager (commits on success, rolls back on error)
+        """
+        return self.pool.connection()
+
+    def pool_stats(self) -> dict:
+        return self.pool.stats()
+
+    def close(self) -> None:
+        self.pool.close()
 
     def _init_schema(self):
         """Initialize database schema"""
@@ -38,32 +191,23 @@ class PostgresMemoryService:
         max_retries = 5
 
         for attempt in range(max_retries):
-            conn = self._get_connection()
-            if conn:
-                with conn.cursor() as cur:
-                    cur.execute("""
-                        CREATE TABLE IF NOT EXISTS mr_reviews (
-                            mr_iid INTEGER,
-                            project_id INTEGER,
-                            diff_text TEXT,
-                            final_review_text TEXT,
-                            review_comment_id INTEGER,
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            PRIMARY KEY (project_id, mr_iid)
-                        )
-                    """)
-                    conn.commit()
-                conn.close()
-                logger.info("Database schema initialized")
-                return
-            else:
+            try:
+                with self._get_connection() as conn:
+                    with conn.cursor() as cur:
+                        for statement in SCHEMA:
+                            cur.execute(statement)
+                        conn.commit()
+            except psycopg2.OperationalError:
                 logger.warning("Database connection attempt %d failed", attempt + 1)
                 if attempt < max_retries - 1:
                     time.sleep(2)
-                else:
-                    logger.error(
-                        "Failed to initialize schema after %d attempts", max_retries
-                    )
+                    continue
+                logger.error(
+                    "Failed to initialize schema after %d attempts", max_retries
+                )
+                raise
+            logger.info("Database schema initialized")
+            return
 
     def save_review_context(
         self,
@@ -72,32 +216,94 @@ class PostgresMemoryService:
         diff_text: str,
         final_review_text: str,
         review_comment_id: int | None = None,
+        head_sha: str | None = None,
     ) -> bool:
         """Save review context to database"""
+        chunks = diff_chunks(diff_text) if diff_text is not None else None
         with self._get_connection() as conn:
             with conn.cursor() as cur:
+                if chunks is not None:
+                    self._store_chunks(cur, chunks)
                 cur.execute(
-                    """
-                    INSERT INTO mr_reviews (project_id, mr_iid, diff_text, final_review_text, review_comment_id)
-                    VALUES (%s, %s, %s, %s, %s)
-                    ON CONFLICT (project_id, mr_iid)
-                    DO UPDATE SET
-                        diff_text = EXCLUDED.diff_text,
-                        final_review_text = EXCLUDED.final_review_text,
-                        review_comment_id = EXCLUDED.review_comment_id
-                """,
+                    SAVE_REVIEW,
                     (
                         project_id,
                         mr_iid,
-                        diff_text,
+                        [chunk_hash(chunk) for chunk in chunks]
+                        if chunks is not None
+                        else None,
                         final_review_text,
                         review_comment_id,
+                        head_sha,
                     ),
                 )
                 conn.commit()
         logger.info("Saved review context for MR !%d", mr_iid)
+
+        self._saves += 1
+        if self._saves % self.blob_gc_every == 0:
+            try:
+                self._collect_blobs()
+            except Exception:
+                logger.exception("Diff blob cleanup failed")
         return True
 
+    def _store_chunks(self, cur, chunks: list[str]) -> None:
+        """Insert the chunks that are not stored yet, compressing only those"""
+        by_hash = {chunk_hash(chunk): chunk for chunk in chunks}
+        # Locking the reused rows keeps _collect_blobs from deleting them
+        # before this transaction references them
+        cur.execute(
+            "SELECT hash FROM diff_blobs WHERE hash = ANY(%s) FOR SHARE",
+            (list(by_hash),),
+        )
+        stored = {row[0] for row in cur.fetchall()}
+        missing = [
+            (digest, self.compressor.compress(chunk.encode()), len(chunk.encode()))
+            for digest, chunk in by_hash.items()
+            if digest not in stored
+        ]
+        if missing:
+            # A chunk another save inserted since the select is locked by
+            # the no-op update, which DO NOTHING would leave unlocked
+            execute_values(
+                cur,
+                """
+                INSERT INTO diff_blobs (hash, data, raw_size) VALUES %s
+                ON CONFLICT (hash) DO UPDATE SET hash = EXCLUDED.hash
+            """,
+                missing,
+            )
+        logger.info(
+            "Stored %d new diff chunks (%d bytes compressed), reused %d",
+            len(missing),
+            sum(len(data) for _, data, _ in missing),
+            len(stored),
+        )
+
+    def _load_chunks(self, cur, hashes: list[str]) -> str | None:
+        cur.execute("SELECT hash, data FROM diff_blobs WHERE hash = ANY(%s)", (hashes,))
+        blobs = {row[0]: row[1] for row in cur.fetchall()}
+        if any(digest not in blobs for digest in hashes):
+            logger.error("Stored diff is missing chunks")
+            return None
+        return join_chunks(
+            [
+                self.decompressor.decompress(bytes(blobs[digest])).decode()
+                for digest in hashes
+            ]
+        )
+
+    def _collect_blobs(self) -> None:
+        """Delete chunks no review references any more"""
+        with self._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(COLLECT_BLOBS)
+                deleted = cur.rowcount
+                conn.commit()
+        if deleted:
+            logger.info("Deleted %d unreferenced diff chunks", deleted)
+
     def load_review_context(
         self, project_id: int, mr_iid: int
     ) -> tuple[str | None, str | None]:
@@ -106,7 +312,7 @@ class PostgresMemoryService:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
                 cur.execute(
                     """
-                    SELECT diff_text, final_review_text
+                    SELECT diff_text, diff_chunks, final_review_text
                     FROM mr_reviews
                     WHERE project_id = %s AND mr_iid = %s
                 """,
@@ -114,16 +320,44 @@ class PostgresMemoryService:
                 )
 
                 result = cur.fetchone()
-                if result:
-                    return result["diff_text"], result["final_review_text"]
-                return None, None
+                if not result:
+                    return None, None
+                diff_text = result["diff_text"]
+                if result["diff_chunks"] is not None:
+                    with conn.cursor() as blob_cur:
+                        diff_text = self._load_chunks(blob_cur, result["diff_chunks"])
+                return diff_text, result["final_review_text"]
+
+    def storage_stats(self) -> dict:
+        """On-disk size of stored reviews and diff chunks"""
+        with self._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(STORAGE_STATS)
+                return storage_stats_row(cur.fetchone())
+
+    def load_last_reviewed_sha(self, project_id: int, mr_iid: int) -> str | None:
+        """Load the head SHA the stored review was produced for"""
+        with self._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT last_reviewed_sha
+                    FROM mr_reviews
+                    WHERE project_id = %s AND mr_iid = %s
+                """,
+                    (project_id, mr_iid),
+                )
+
+                result = cur.fetchone()
+                return result[0] if result else None
 
     def health_check(self) -> bool:
         """Check if database connection is healthy"""
-        conn = self._get_connection()
-        if conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT 1")
-            conn.close()
+        try:
+            with self._get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
             return True
-        return False
+        except psycopg2.Error:
+            logger.exception("Database health check failed")
+            return False
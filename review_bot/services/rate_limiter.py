@@ -0,0 +1,272 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from enum import IntEnum
+from typing import Any
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Lower values are served first"""
+
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
+
+class PriorityTokenBucket:
+    """
+    Token bucket whose waiters are served strictly in priority order (FIFO
+    within a priority). A request larger than the bucket is admitted once
+    the bucket is full and leaves it in debt. Priorities can be paused until
+    a deadline; pausing a priority also pauses every lower one.
+    """
+
+    def __init__(self, name: str, rate: float, capacity: float):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = dict.fromkeys(Priority, 0.0)
+        self._waiters: list[tuple[int, int, float]] = []
+        self._seq = itertools.count()
+        self._cond = asyncio.Condition()
+        self.granted = 0
+        self.total_wait = 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def pause(self, until: float, from_priority: Priority = Priority.HIGH) -> None:
+        """Hold back from_priority and every lower priority until `until`"""
+        for priority in Priority:
+            if priority >= from_priority:
+                self._paused_until[priority] = max(self._paused_until[priority], until)
+
+    def drain_to(self, tokens: float) -> None:
+        """Lower the available tokens, e.g. to match a server-reported quota"""
+        self._refill()
+        self.tokens = min(self.tokens, tokens)
+
+    async def acquire(self, priority: Priority, amount: float = 1.0) -> None:
+        entry = (int(priority), next(self._seq), amount)
+        needed = min(amount, self.capacity)
+        started = time.monotonic()
+
+        async with self._cond:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    self._refill()
+                    now = time.monotonic()
+                    paused_for = self._paused_until[priority] - now
+                    if self._waiters[0] is entry:
+                        if paused_for <= 0 and self.tokens >= needed:
+                            break
+                        timeout = (
+                            paused_for
+                            if paused_for > 0
+                            else (needed - self.tokens) / self.rate
+                        )
+                    else:
+                        timeout = None
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), timeout)
+                    except TimeoutError:
+                        pass
+            except BaseException:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+                raise
+
+            heapq.heappop(self._waiters)
+            self.tokens -= amount
+            self.granted += 1
+            self.total_wait += time.monotonic() - started
+            # The next waiter may already be admissible
+            self._cond.notify_all()
+
+    def stats(self) -> dict[str, Any]:
+        self._refill()
+        now = time.monotonic()
+        return {
+            "tokens": round(self.tokens, 2),
+            "capacity": self.capacity,
+            "waiting": len(self._waiters),
+            "granted": self.granted,
+            "avg_wait_seconds": round(self.total_wait / self.granted, 3)
+            if self.granted
+            else 0.0,
+            "paused_seconds": {
+                priority.name: round(until - now, 1)
+                for priority, until in self._paused_until.items()
+                if until > now
+            },
+        }
+
+
+class PrioritySemaphore:
+    """Semaphore whose waiters are admitted in priority order"""
+
+    def __init__(self, value: int):
+        self.limit = value
+        self.value = value
+        self._waiters: list[tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._cond = asyncio.Condition()
+
+    async def acquire(self, priority: Priority) -> None:
+        entry = (int(priority), next(self._seq))
+        async with self._cond:
+            heapq.heappush(self._waiters, entry)
+            try:
+                await self._cond.wait_for(
+                    lambda: self._waiters[0] is entry and self.value > 0
+                )
+            except BaseException:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._waiters)
+            self.value -= 1
+            self._cond.notify_all()
+
+    async def release(self) -> None:
+        async with self._cond:
+            self.value += 1
+            self._cond.notify_all()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "in_flight": self.limit - self.value,
+            "limit": self.limit,
+            "queued": len(self._waiters),
+        }
+
+
+# Quotas GitHub counts separately, by X-RateLimit-Resource, and the
+# setting for each one's hourly limit
+RESOURCE_QUOTAS = {
+    "core": "GITHUB_RATE_LIMIT_PER_HOUR",
+    "graphql": "GITHUB_GRAPHQL_RATE_LIMIT_PER_HOUR",
+}
+
+
+class GitHubRateLimiter:
+    """
+    Central scheduler for GitHub API calls. Paces requests with a token
+    bucket per quota (REST and GraphQL are counted separately) sized to
+    the hourly limit, tracks X-RateLimit-* headers, keeps a reserve of
+    quota for high-priority calls and pauses (rather than fails) when
+    GitHub reports a primary or secondary rate limit.
+    """
+
+    def __init__(self):
+        self.reserve = int(os.getenv("GITHUB_RATE_LIMIT_RESERVE", "100"))
+        self.max_retries = int(os.getenv("GITHUB_RATE_LIMIT_RETRIES", "5"))
+        burst = float(os.getenv("GITHUB_RATE_LIMIT_BURST", "100"))
+        self.buckets = {
+            resource: PriorityTokenBucket(
+                f"github_{resource}",
+                rate=float(os.getenv(setting, "5000")) / 3600,
+                capacity=burst,
+            )
+            for resource, setting in RESOURCE_QUOTAS.items()
+        }
+        self.remaining: dict[str, int] = {}
+        self.reset_at: dict[str, float] = {}
+        self.rate_limited = 0
+
+    @staticmethod
+    def resource(url: str | httpx.URL) -> str:
+        """The quota a request to url counts against"""
+        return "graphql" if httpx.URL(url).path.endswith("/graphql") else "core"
+
+    async def acquire(self, priority: Priority, resource: str = "core") -> None:
+        await self.buckets[resource].acquire(priority)
+
+    def observe(self, response: httpx.Response) -> float | None:
+        """
+        Update quota tracking from a response. Returns the number of seconds
+        to wait before retrying if the response is a rate-limit rejection.
+        """
+        headers = response.headers
+        resource = headers.get(
+            "X-RateLimit-Resource", self.resource(response.request.url)
+        )
+        bucket = self.buckets.get(resource)
+        if bucket is None:
+            # A quota this service does not pace, e.g. search
+            return None
+
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+        if remaining is not None:
+            self.remaining[resource] = int(remaining)
+            bucket.drain_to(self.remaining[resource])
+        if reset is not None:
+            self.reset_at[resource] = float(reset)
+        now = time.monotonic()
+        reset_at = self.reset_at.get(resource)
+        until_reset = max(reset_at - time.time(), 1.0) if reset_at else 60.0
+
+        if response.status_code in (403, 429):
+            retry_after = headers.get("Retry-After")
+            if retry_after is not None:
+                delay = float(retry_after)
+            elif remaining == "0":
+                delay = until_reset
+            elif "rate limit" in response.text.lower():
+                # Secondary limits without Retry-After: back off a minute
+                delay = 60.0
+            else:
+                return None
+            self.rate_limited += 1
+            # An exhausted quota holds back its own calls; secondary limits
+            # apply to the whole API
+            for paused in [bucket] if remaining == "0" else self.buckets.values():
+                paused.pause(now + delay)
+            logger.warning(
+                "GitHub %s rate limit hit, pausing for %.0fs", resource, delay
+            )
+            return delay
+
+        left = self.remaining.get(resource)
+        if left is not None and left <= self.reserve:
+            # Keep what is left for comment posting
+            bucket.pause(now + until_reset, from_priority=Priority.NORMAL)
+            logger.warning(
+                "GitHub %s quota low (%d left), holding back bulk calls for %.0fs",
+                resource,
+                left,
+                until_reset,
+            )
+        return None
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "rate_limited": self.rate_limited,
+            **{
+                resource: {
+                    "remaining": self.remaining.get(resource),
+                    "reset_in_seconds": round(self.reset_at[resource] - time.time())
+                    if resource in self.reset_at
+                    else None,
+                    **bucket.stats(),
+                }
+                for resource, bucket in self.buckets.items()
+            },
+        }
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import os
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+ReviewKey = tuple[str, int]
+
+
+class ReviewCoalescer:
+    """
+    Debounces review requests per (repo, PR) so a burst of pushes results in
+    a single review of the latest head SHA. Reviews of a SHA that has since
+    been superseded are cancelled while in flight, and skipped before they
+    start if a newer head is waiting out its quiet window here or, through
+    `queued_sha`, is queued for any worker.
+    """
+
+    def __init__(
+        self,
+        submit: Callable[[dict[str, Any]], Awaitable[None]],
+        quiet_window: float | None = None,
+        queued_sha: Callable[[ReviewKey], Awaitable[str | None]] | None = None,
+    ):
+        self.submit = submit
+        self.quiet_window = (
+            quiet_window
+            if quiet_window is not None
+            else float(os.getenv("REVIEW_QUIET_WINDOW", "30"))
+        )
+        # Head SHA of the newest queued review of a PR, if any
+        self.queued_sha = queued_sha
+        # Head SHAs still in their quiet window; dropped once submitted
+        self._debounced_sha: dict[ReviewKey, str] = {}
+        self._timers: dict[ReviewKey, asyncio.Task] = {}
+        self._payloads: dict[ReviewKey, dict[str, Any]] = {}
+        self._running: dict[ReviewKey, tuple[str | None, asyncio.Task]] = {}
+
+    def schedule(
+        self,
+        key: ReviewKey,
+        head_sha: str | None,
+        payload: dict[str, Any],
+        debounce: bool = True,
+    ) -> None:
+        """Record a new head for the PR and (re)start its quiet window"""
+        if head_sha:
+            self._debounced_sha[key] = head_sha
+
+        pending = self._timers.pop(key, None)
+        if pending:
+            pending.cancel()
+            logger.info("Coalesced review request for %s#%d", *key)
+
+        running = self._running.get(key)
+        if running and head_sha and running[0] != head_sha:
+            logger.info("Cancelling in-flight review of %s for %s#%d", running[0], *key)
+            running[1].cancel()
+
+        delay = self.quiet_window if debounce else 0.0
+        self._payloads[key] = payload
+        self._timers[key] = asyncio.create_task(self._fire(key, payload, delay))
+
+    async def _fire(self, key: ReviewKey, payload: dict[str, Any], delay: float):
+        await asyncio.sleep(delay)
+        self._timers.pop(key, None)
+        self._payloads.pop(key, None)
+        self._debounced_sha.pop(key, None)
+        try:
+            await self.submit(payload)
+        except Exception:
+            logger.exception("Failed to submit review for %s#%d", *key)
+
+    async def flush(self) -> None:
+        """Submit every debounced request now, e.g. before shutdown"""
+        for key, timer in list(self._timers.items()):
+            timer.cancel()
+            payload = self._payloads.pop(key)
+            self._debounced_sha.pop(key, None)
+            try:
+                await self.submit(payload)
+            except Exception:
+                logger.exception("Failed to submit review for %s#%d", *key)
+        self._timers.clear()
+
+    async def is_latest(self, key: ReviewKey, head_sha: str | None) -> bool:
+        """Whether no newer head of the PR is debouncing or queued"""
+        if not head_sha:
+            return True
+        newer = self._debounced_sha.get(key)
+        if newer is None and self.queued_sha:
+            newer = await self.queued_sha(key)
+        return newer is None or newer == head_sha
+
+    async def run(
+        self,
+        key: ReviewKey,
+        head_sha: str | None,
+        review: Callable[[], Awaitable[None]],
+    ) -> bool:
+        """
+        Run a review unless it is already stale. Returns False when the
+        review was skipped or cancelled because a newer head arrived.
+        """
+        if not await self.is_latest(key, head_sha):
+            logger.info("Skipping superseded review of %s for %s#%d", head_sha, *key)
+            return False
+
+        task = asyncio.create_task(review())
+        self._running[key] = (head_sha, task)
+        try:
+            await asyncio.wait({task})
+        finally:
+            if not task.done():
+                task.cancel()
+            if self._running.get(key, (None, None))[1] is task:
+                del self._running[key]
+
+        if task.cancelled():
+            logger.info("Review of %s for %s#%d was superseded", head_sha, *key)
+            return False
+
+        task.result()
+        return True
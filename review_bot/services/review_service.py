@@ -1,18 +1,34 @@
+import operator
 from typing import Annotated, TypedDict
 
-from langgraph.graph.message import add_messages
+from review_bot.services.diff_model import PRDiff
+
+
+def keep_latest(current: str | None, update: str | None) -> str | None:
+    """Reducer that keeps the newest non-None value written to a key"""
+    return update if update is not None else current
 
 
 class MRReviewState(TypedDict):
     """State for the MR review workflow"""
 
     diff_text: str
+    # The same diff parsed into files and hunks, for sharding and summaries
+    diff: PRDiff
     project_id: int
     mr_iid: int
-    review_a_output: str | None
-    review_b_output: str | None
+    # Each reviewer writes only its own key, so both can run in the same step
+    review_a_output: Annotated[str | None, keep_latest]
+    review_b_output: Annotated[str | None, keep_latest]
     judge_output: str | None
-    error_message: Annotated[list, add_messages]
+    error_message: Annotated[list[str], operator.add]
+    # Head commit under review, and the comment an earlier attempt at
+    # reviewing it posted in (edited rather than posting another)
+    head_sha: str | None
+    comment_id: int | None
+    # For incremental re-reviews of new pushes
+    previous_review: str | None
+    previous_head_sha: str | None
     # For feedback loop
     original_review: str | None
     human_comment: str | None
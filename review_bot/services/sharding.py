@@ -0,0 +1,158 @@
+import json
+import logging
+import re
+from dataclasses import dataclass
+
+from review_bot.services.diff_model import PRDiff
+from review_bot.services.diff_utils import format_file_section
+
+logger = logging.getLogger(__name__)
+
+_JSON_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (about four characters per token)"""
+    return len(text) // 4 + 1
+
+
+@dataclass(slots=True)
+class DiffShard:
+    """A token-budgeted slice of the diff: one file, or some hunks of one"""
+
+    filename: str
+    text: str
+    part: int = 1
+    parts: int = 1
+
+    @property
+    def label(self) -> str:
+        if self.parts == 1:
+            return self.filename
+        return f"{self.filename} (part {self.part}/{self.parts})"
+
+
+def _split_oversized_hunk(hunk: str, budget: int) -> list[str]:
+    """Cut a single hunk by lines, repeating its header on every piece"""
+    header, _, body = hunk.partition("\n")
+    pieces, current, size = [], [], estimate_tokens(header)
+    for line in body.split("\n"):
+        line_tokens = estimate_tokens(line)
+        if current and size + line_tokens > budget:
+            pieces.append("\n".join([header, *current]))
+            current, size = [], estimate_tokens(header)
+        current.append(line)
+        size += line_tokens
+    pieces.append("\n".join([header, *current]))
+    return pieces
+
+
+def shard_diff(diff: PRDiff, token_budget: int) -> list[DiffShard]:
+    """
+    Split a diff into shards of at most token_budget (estimated) tokens.
+    Each file is its own shard; files over budget are split at hunk
+    boundaries, and single hunks over budget at line boundaries.
+    """
+    shards: list[DiffShard] = []
+
+    for file in diff.files:
+        section = diff.render_file(file)
+        if estimate_tokens(section) <= token_budget:
+            shards.append(DiffShard(file.filename, section))
+            continue
+
+        groups: list[list[str]] = [[]]
+        size = 0
+        for hunk in diff.render_hunks(file):
+            for piece in (
+                _split_oversized_hunk(hunk, token_budget)
+                if estimate_tokens(hunk) > token_budget
+                else [hunk]
+            ):
+                piece_tokens = estimate_tokens(piece)
+                if groups[-1] and size + piece_tokens > token_budget:
+                    groups.append([])
+                    size = 0
+                groups[-1].append(piece)
+                size += piece_tokens
+
+        for index, group in enumerate(groups, start=1):
+            shards.append(
+                DiffShard(
+                    file.filename,
+                    format_file_section(file.filename, "\n".join(group)),
+                    part=index,
+                    parts=len(groups),
+                )
+            )
+
+    return shards
+
+
+def summarize_diff(diff: PRDiff) -> str:
+    """File-level overview of a diff, used when the diff is too big to inline"""
+    lines = [
+        f"- {file.filename}: +{file.additions} -{file.deletions}" for file in diff.files
+    ]
+    summary = "Changed files (full diff omitted for size):\n" + "\n".join(lines)
+    if diff.issue_context:
+        return f"Linked Issues:\n{diff.issue_context}\n\n{summary}"
+    return summary
+
+
+def _parse_findings(output: str) -> dict | None:
+    text = _JSON_FENCE.sub("", output.strip())
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end == -1:
+        return None
+    try:
+        findings = json.loads(text[start : end + 1])
+    except json.JSONDecodeError:
+        return None
+    return findings if isinstance(findings, dict) else None
+
+
+def reduce_findings(results: list[tuple[str, str]]) -> str:
+    """
+    Merge per-shard reviewer outputs into a single JSON report. Issue lists
+    are concatenated, scores are averaged and summaries are kept per shard.
+    Outputs that are not valid JSON are passed through verbatim.
+    """
+    if len(results) == 1:
+        return results[0][1]
+
+    merged: dict[str, list] = {}
+    scores: list[float] = []
+    summaries: list[str] = []
+    unparsed: list[str] = []
+
+    for label, output in results:
+        findings = _parse_findings(output)
+        if findings is None:
+            unparsed.append(f"{label}:\n{output}")
+            continue
+
+        for key, value in findings.items():
+            if isinstance(value, list):
+                merged.setdefault(key, []).extend(value)
+            elif key == "overall_score":
+                try:
+                    scores.append(float(value))
+                except (TypeError, ValueError):
+                    pass
+            elif key == "summary" and value:
+                summaries.append(f"{label}: {value}")
+
+    if len(unparsed) == len(results):
+        return "\n\n".join(unparsed)
+
+    report: dict = dict(merged)
+    if scores:
+        report["overall_score"] = str(round(sum(scores) / len(scores), 1))
+    report["summary"] = "\n".join(summaries)
+
+    reduced = json.dumps(report, indent=2)
+    if unparsed:
+        logger.warning("%d shard outputs were not valid JSON", len(unparsed))
+        reduced += "\n\nAdditional findings:\n\n" + "\n\n".join(unparsed)
+    return reduced
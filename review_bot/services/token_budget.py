@@ -0,0 +1,179 @@
+import logging
+import math
+import os
+from collections.abc import Callable
+from typing import Any
+
+from review_bot.llm_clients.base_client import BaseLLMClient
+from review_bot.services.cache_service import LRUCache, content_hash
+from review_bot.services.diff_utils import format_file_section, join_diff, split_diff
+from review_bot.services.sharding import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+TRUNCATED = "\n(truncated to fit the token budget)"
+
+
+def _strip_context(section: str) -> str:
+    """Drop unchanged context lines, keeping the banner, hunk headers and edits"""
+    banner, _, patch = section.partition("\n")
+    kept = [line for line in patch.split("\n") if not line.startswith(" ")]
+    return "\n".join([banner, *kept])
+
+
+def _omit_patch(filename: str, section: str) -> str:
+    patch_lines = section.split("\n")[1:]
+    added = sum(1 for line in patch_lines if line.startswith("+"))
+    removed = sum(1 for line in patch_lines if line.startswith("-"))
+    return format_file_section(
+        filename, f"(patch omitted for size: +{added} -{removed} lines)"
+    )
+
+
+def trim_diff(diff_text: str, budget: int, count: Callable[[str], int]) -> str:
+    """
+    Trim a prompt diff to at most `budget` tokens, dropping the least useful
+    context first: unchanged context lines, then whole patches (largest
+    first, leaving a one-line stub), and the linked issue text last.
+    """
+    if count(diff_text) <= budget:
+        return diff_text
+
+    issue_context, sections = split_diff(diff_text)
+
+    def fits() -> bool:
+        return count(join_diff(issue_context, sections)) <= budget
+
+    sections = {name: _strip_context(section) for name, section in sections.items()}
+    if sections and fits():
+        return join_diff(issue_context, sections)
+
+    for name in sorted(sections, key=lambda name: -len(sections[name])):
+        stub = _omit_patch(name, sections[name])
+        if len(stub) < len(sections[name]):
+            sections[name] = stub
+            if fits():
+                return join_diff(issue_context, sections)
+
+    # Nothing structured left to drop: cut the text from the end, so the
+    # changes go before the issue text
+    text = join_diff(issue_context, sections) if sections else diff_text
+    room = budget - count(TRUNCATED)
+    if count(text) > budget:
+        keep = max(0, math.floor(len(text) * room / count(text)))
+        text = text[:keep] + TRUNCATED
+    return text
+
+
+class TokenAccountant:
+    """
+    Counts prompt tokens per model and keeps each node's prompt within its
+    budget. Estimates use the character heuristic scaled by a per-model
+    ratio learned from the usage the provider reports, and prompts near
+    the budget are counted exactly with the model's count API (cached).
+    Estimated and actual usage are recorded per node.
+    """
+
+    def __init__(self):
+        self.budgets = {
+            "reviewer": int(os.getenv("REVIEWER_PROMPT_TOKENS", "30000")),
+            "judge": int(os.getenv("JUDGE_PROMPT_TOKENS", "100000")),
+            "justify": int(os.getenv("JUSTIFY_PROMPT_TOKENS", "100000")),
+        }
+        # Prompts estimated above this share of the budget are counted exactly
+        self.exact_above = float(os.getenv("TOKEN_COUNT_EXACT_ABOVE", "0.8"))
+        self.ratios: dict[str, float] = {}
+        self.counts = LRUCache(int(os.getenv("TOKEN_COUNT_CACHE_SIZE", "1024")))
+        self.usage: dict[str, dict[str, int]] = {}
+
+    def estimate(self, model_name: str, text: str) -> int:
+        return math.ceil(estimate_tokens(text) * self.ratios.get(model_name, 1.0))
+
+    async def count(self, client: BaseLLMClient, text: str) -> int:
+        """Exact count from the model's tokenizer, or the estimate"""
+        key = content_hash(client.model_name, text)
+        cached = self.counts.get(key)
+        if cached is not None:
+            return cached
+        try:
+            tokens = await client.count_tokens(text)
+        except Exception as exc:
+            logger.warning("Token count failed for %s: %s", client.model_name, exc)
+            tokens = None
+        if tokens is None:
+            return self.estimate(client.model_name, text)
+        self.counts.set(key, tokens)
+        return tokens
+
+    async def fit_diff(
+        self, client: BaseLLMClient, node: str, diff_text: str, fixed_text: str
+    ) -> str:
+        """
+        Trim diff_text so that it plus fixed_text (system prompt and the
+        rest of the node's input) fits the node's budget.
+        """
+        budget = self.budgets[node]
+
+        def estimate(text: str) -> int:
+            return self.estimate(client.model_name, text)
+
+        fixed_tokens = estimate(fixed_text)
+        trimmed = trim_diff(diff_text, budget - fixed_tokens, estimate)
+        if fixed_tokens + estimate(trimmed) > budget * self.exact_above:
+            exact = await self.count(client, fixed_text + trimmed)
+            if exact > budget:
+                # Shrink the estimate-based budget by how far estimates ran low
+                scale = exact / (fixed_tokens + estimate(trimmed))
+                trimmed = trim_diff(
+                    trimmed, int(budget / scale) - fixed_tokens, estimate
+                )
+
+        if trimmed != diff_text:
+            logger.warning(
+                "Trimmed %s input from %d to %d estimated tokens (budget %d)",
+                node,
+                fixed_tokens + estimate(diff_text),
+                fixed_tokens + estimate(trimmed),
+                budget,
+            )
+        return trimmed
+
+    def record(
+        self, node: str, model_name: str, prompt_text: str, response: dict[str, Any]
+    ) -> None:
+        """Record estimated vs. reported prompt tokens and calibrate the ratio"""
+        estimated = self.estimate(model_name, prompt_text)
+        usage = self.usage.setdefault(
+            node,
+            {"calls": 0, "estimated_tokens": 0, "actual_tokens": 0, "reported": 0},
+        )
+        usage["calls"] += 1
+        usage["estimated_tokens"] += estimated
+
+        actual = (response.get("usage") or {}).get("prompt_tokens")
+        # Fallback usage was counted by another model's tokenizer
+        if not actual or response.get("fallback"):
+            return
+        usage["reported"] += 1
+        usage["actual_tokens"] += actual
+        if abs(actual - estimated) > estimated * 0.2:
+            logger.info(
+                "%s prompt estimated at %d tokens, %s reported %d",
+                node,
+                estimated,
+                model_name,
+                actual,
+            )
+        # Smooth the heuristic-to-tokenizer ratio towards what was billed
+        observed = actual / estimate_tokens(prompt_text)
+        previous = self.ratios.get(model_name)
+        self.ratios[model_name] = (
+            observed if previous is None else 0.9 * previous + 0.1 * observed
+        )
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "budgets": self.budgets,
+            "ratios": {name: round(ratio, 3) for name, ratio in self.ratios.items()},
+            "usage": self.usage,
+        }
@@ -0,0 +1,22 @@
+import os
+
+import pytest
+
+
+@pytest.fixture
+def memory_service(monkeypatch):
+    """
+    PostgresMemoryService on the database in TEST_DATABASE_URL; tests using
+    it are skipped when that is not set. Job and review tables are emptied
+    first, so point it at a throwaway database.
+    """
+    url = os.getenv("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL not set")
+    monkeypatch.setenv("DATABASE_URL", url)
+
+    from review_bot.services.memory_service import PostgresMemoryService
+
+    service = PostgresMemoryService()
+    yield service
+    service.close()
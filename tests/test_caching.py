@@ -0,0 +1,73 @@
+import asyncio
+
+from review_bot.llm_clients.base_client import BaseLLMClient
+from review_bot.llm_clients.caching import CachedLLMClient
+from review_bot.services.cache_service import TieredCache
+
+
+class ScriptedClient(BaseLLMClient):
+    def __init__(self, *responses):
+        super().__init__("scripted-test-model")
+        self.responses = list(responses)
+        self.calls = 0
+
+    async def generate_structured_response(self, prompt, system_prompt):
+        self.calls += 1
+        return self.responses.pop(0)
+
+
+def run_twice(client):
+    cached = CachedLLMClient(client, TieredCache("test"))
+
+    async def calls():
+        first = await cached.generate_structured_response("p", "s")
+        second = await cached.generate_structured_response("p", "s")
+        return first, second
+
+    return asyncio.run(calls())
+
+
+def test_responses_are_cached():
+    client = ScriptedClient({"response": "LGTM"})
+    first, second = run_twice(client)
+    assert second == {"response": "LGTM", "cached": True}
+    assert client.calls == 1
+
+
+def test_empty_and_error_responses_are_not_cached():
+    for bad in ("", "  \n", "Error: Empty response from Gemini API"):
+        client = ScriptedClient({"response": bad}, {"response": "LGTM"})
+        _, second = run_twice(client)
+        assert second == {"response": "LGTM"}
+        assert client.calls == 2
+
+
+def test_fallback_responses_are_not_cached():
+    client = ScriptedClient(
+        {"response": "other model", "fallback": "m2"}, {"response": "LGTM"}
+    )
+    _, second = run_twice(client)
+    assert second == {"response": "LGTM"}
+
+
+def test_retired_namespaces_are_purged(memory_service):
+    with memory_service._get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    namespace TEXT,
+                    cache_key TEXT,
+                    value TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (namespace, cache_key)
+                )
+            """)
+            cur.execute(
+                "INSERT INTO cache_entries VALUES ('review', 'k', 'v'), "
+                "('llm', 'k', 'v') ON CONFLICT DO NOTHING"
+            )
+    TieredCache("llm", memory_service)
+    with memory_service._get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT namespace FROM cache_entries WHERE cache_key = 'k'")
+            assert [row[0] for row in cur.fetchall()] == ["llm"]
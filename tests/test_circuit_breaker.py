@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from review_bot.llm_clients import resilience
+from review_bot.llm_clients.base_client import BaseLLMClient
+from review_bot.llm_clients.resilience import CircuitBreaker, ResilientLLMClient
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_opens_after_threshold(clock):
+    breaker = CircuitBreaker("m", failure_threshold=2, reset_timeout=10)
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_success_resets_failures(clock):
+    breaker = CircuitBreaker("m", failure_threshold=2, reset_timeout=10)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_half_open_probe(clock):
+    breaker = CircuitBreaker("m", failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock[0] += 10
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    # Only the one probe goes through
+    assert not breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.stats()["times_opened"] == 2
+
+    clock[0] += 10
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_cancelled_probe_reopens(clock):
+    breaker = CircuitBreaker("m", failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock[0] += 10
+    assert breaker.allow()
+    clock[0] += 3
+    breaker.record_cancelled()
+    assert breaker.state == "open"
+    assert breaker.opened_at == clock[0]
+    assert not breaker.allow()
+    clock[0] += 10
+    assert breaker.allow()
+
+
+def test_cancel_when_closed_is_ignored(clock):
+    breaker = CircuitBreaker("m", failure_threshold=1, reset_timeout=10)
+    breaker.record_cancelled()
+    assert breaker.state == "closed"
+
+
+class SlowClient(BaseLLMClient):
+    async def generate_structured_response(self, prompt, system_prompt):
+        await asyncio.sleep(60)
+
+    async def astream_response(self, prompt, system_prompt):
+        await asyncio.sleep(60)
+        yield ""
+
+
+def test_cancelled_call_does_not_leave_breaker_half_open():
+    client = ResilientLLMClient(SlowClient("slow-test-model"))
+    client.breaker.state = "open"
+    client.breaker.opened_at = -1e9
+
+    async def cancel_probe():
+        task = asyncio.create_task(client.generate_structured_response("p", "s"))
+        await asyncio.sleep(0.01)
+        assert client.breaker.state == "half_open"
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_probe())
+    assert client.breaker.state == "open"
@@ -0,0 +1,66 @@
+import asyncio
+
+import httpx
+import pytest
+
+from review_bot.services.github_service import COMPARE_MAX_FILES, GitHubService
+
+PATCH = "@@ -1 +1 @@\n-a\n+b"
+
+
+def commit(*parents):
+    return {"sha": "c", "parents": [{"sha": sha} for sha in parents]}
+
+
+def compare(commits, files, status="ahead", total_commits=None):
+    return {
+        "status": status,
+        "total_commits": len(commits) if total_commits is None else total_commits,
+        "commits": commits,
+        "files": files,
+    }
+
+
+def fetch(monkeypatch, data):
+    monkeypatch.setenv("GITHUB_TOKEN", "x" * 20)
+    monkeypatch.setenv("DIFF_SKIPPED_FILES", "off")
+
+    def handler(request):
+        if "/compare/" in request.url.path:
+            return httpx.Response(200, json=data)
+        # No linked issues
+        return httpx.Response(200, json={"title": "", "body": ""})
+
+    async def run():
+        github = GitHubService()
+        github.http.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        return await github.fetch_compare_diff(1, "old", "new")
+
+    return asyncio.run(run())
+
+
+def test_linear_commits_are_reviewed_incrementally(monkeypatch):
+    data = compare([commit("old"), commit("c")], [{"filename": "a.py", "patch": PATCH}])
+    diff = fetch(monkeypatch, data)
+    assert [file.filename for file in diff.files] == ["a.py"]
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        compare([], [], status="diverged"),
+        # The base branch was merged in
+        compare([commit("old", "main")], [{"filename": "a.py", "patch": PATCH}]),
+        # Commit list truncated, merges cannot be ruled out
+        compare([commit("old")], [], total_commits=300),
+        compare(
+            [commit("old")],
+            [
+                {"filename": f"f{i}.py", "patch": PATCH}
+                for i in range(COMPARE_MAX_FILES)
+            ],
+        ),
+    ],
+)
+def test_falls_back_to_full_review(monkeypatch, data):
+    assert fetch(monkeypatch, data) is None
@@ -0,0 +1,191 @@
+import threading
+
+import psycopg2
+import pytest
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+from psycopg2.pool import PoolError
+
+from review_bot.services import db_pool
+from review_bot.services.db_pool import PostgresConnectionPool
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query):
+        if self.conn.dead:
+            raise psycopg2.OperationalError("server closed the connection")
+        self.conn.queries.append(query)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.dead = False
+        self.autocommit = False
+        self.queries = []
+        self.info = type("Info", (), {"transaction_status": TRANSACTION_STATUS_IDLE})()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.info.transaction_status = TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    opened = []
+
+    def connect(*args, **kwargs):
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    monkeypatch.setattr(db_pool.psycopg2, "connect", connect)
+    monkeypatch.setenv("DB_POOL_MIN_SIZE", "1")
+    monkeypatch.setenv("DB_POOL_MAX_SIZE", "2")
+    monkeypatch.setenv("DB_POOL_TIMEOUT", "0.1")
+    return opened
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(db_pool.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_connections_are_reused(connections):
+    pool = PostgresConnectionPool("dsn")
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+    assert first is second
+    assert len(connections) == 1
+    assert pool.stats()["checkouts"] == 2
+
+
+def test_checkout_times_out_when_all_are_in_use(connections):
+    pool = PostgresConnectionPool("dsn")
+    with pool.connection(), pool.connection():
+        with pytest.raises(PoolError):
+            with pool.connection():
+                pass
+    stats = pool.stats()
+    assert stats["timeouts"] == 1
+    assert stats["in_use"] == 0 and stats["size"] == 2
+
+
+def test_waiter_gets_the_returned_connection(connections, monkeypatch):
+    monkeypatch.setenv("DB_POOL_MAX_SIZE", "1")
+    monkeypatch.setenv("DB_POOL_TIMEOUT", "5")
+    pool = PostgresConnectionPool("dsn")
+    checked_out = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with pool.connection():
+            checked_out.set()
+            release.wait()
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    checked_out.wait()
+    threading.Timer(0.05, release.set).start()
+    with pool.connection() as conn:
+        assert conn is connections[0]
+    holder.join()
+    assert pool.stats()["waits"] == 1
+
+
+def test_connections_are_recycled_after_max_lifetime(connections, clock, monkeypatch):
+    monkeypatch.setenv("DB_POOL_MAX_LIFETIME", "60")
+    pool = PostgresConnectionPool("dsn")
+    clock[0] += 61
+    with pool.connection() as conn:
+        assert conn is connections[1]
+    assert connections[0].closed
+    assert pool.stats()["recycled"] == 1 and pool.stats()["size"] == 1
+
+
+def test_idle_connection_failing_its_ping_is_replaced(connections, clock):
+    pool = PostgresConnectionPool("dsn")
+    connections[0].dead = True
+    clock[0] += pool.ping_after
+    with pool.connection() as conn:
+        assert conn is connections[1]
+    assert connections[0].closed
+    assert pool.stats()["ping_failures"] == 1
+
+
+def test_recently_used_connection_is_not_pinged(connections, clock):
+    pool = PostgresConnectionPool("dsn")
+    with pool.connection():
+        pass
+    assert connections[0].queries == []
+
+
+def test_broken_connection_is_discarded(connections):
+    pool = PostgresConnectionPool("dsn")
+    with pytest.raises(psycopg2.OperationalError):
+        with pool.connection():
+            raise psycopg2.OperationalError("connection reset")
+    assert connections[0].closed
+    assert pool.stats()["size"] == 0
+    with pool.connection() as conn:
+        assert conn is connections[1]
+
+
+def test_open_transaction_is_rolled_back_on_return(connections):
+    pool = PostgresConnectionPool("dsn")
+    with pool.connection() as conn:
+        conn.info.transaction_status = TRANSACTION_STATUS_INTRANS
+    assert conn.info.transaction_status == TRANSACTION_STATUS_IDLE
+    assert pool.stats()["idle"] == 1
+
+
+def test_failed_connect_frees_the_slot(connections, monkeypatch):
+    monkeypatch.setenv("DB_POOL_MIN_SIZE", "0")
+    pool = PostgresConnectionPool("dsn")
+
+    def refuse(*args, **kwargs):
+        raise psycopg2.OperationalError("connection refused")
+
+    monkeypatch.setattr(db_pool.psycopg2, "connect", refuse)
+    with pytest.raises(psycopg2.OperationalError):
+        with pool.connection():
+            pass
+    assert pool.stats()["size"] == 0 and pool.stats()["in_use"] == 0
+
+
+def test_close_with_connections_checked_out(connections):
+    pool = PostgresConnectionPool("dsn")
+    with pool.connection() as busy:
+        with pool.connection():
+            pass
+        pool.close()
+        # The idle one is closed now, the busy one once it is returned
+        assert connections[1].closed
+        assert not busy.closed
+        with pytest.raises(PoolError):
+            with pool.connection():
+                pass
+    assert busy.closed
+    assert pool.stats()["size"] == 0
@@ -0,0 +1,36 @@
+from review_bot.services.diff_utils import format_file_section, join_diff
+from review_bot.services.memory_service import chunk_hash, diff_chunks, join_chunks
+
+SECTIONS = {
+    "a.py": format_file_section("a.py", "@@ -1 +1 @@\n-a\n+b"),
+    "b.py": format_file_section("b.py", "@@ -3 +3 @@\n-c\n+d"),
+}
+
+
+def test_chunks_round_trip():
+    diff_text = join_diff(None, SECTIONS)
+    chunks = diff_chunks(diff_text)
+    assert chunks[0] == ""
+    assert len(chunks) == 3
+    assert join_chunks(chunks) == diff_text
+
+
+def test_issue_context_is_its_own_chunk():
+    diff_text = join_diff("#1: Crash on load", SECTIONS)
+    chunks = diff_chunks(diff_text)
+    assert "#1: Crash on load" in chunks[0]
+    assert chunks[1:] == diff_chunks(join_diff(None, SECTIONS))[1:]
+    assert join_chunks(chunks) == diff_text
+
+
+def test_unchanged_file_keeps_its_hash():
+    edited = dict(SECTIONS, **{"b.py": format_file_section("b.py", "+e")})
+    before = diff_chunks(join_diff(None, SECTIONS))
+    after = diff_chunks(join_diff(None, edited))
+    assert chunk_hash(before[1]) == chunk_hash(after[1])
+    assert chunk_hash(before[2]) != chunk_hash(after[2])
+
+
+def test_unsplittable_text_is_one_chunk():
+    assert diff_chunks("no file banners here") == ["no file banners here"]
+    assert join_chunks(["no file banners here"]) == "no file banners here"
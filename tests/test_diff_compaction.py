@@ -0,0 +1,45 @@
+from review_bot.services.diff_compaction import whitespace_only
+from review_bot.services.diff_model import parse_patch
+
+ALL_MODES = frozenset({"context", "whitespace", "renames", "numbered"})
+
+
+def test_trailing_whitespace_only():
+    assert whitespace_only(["-x = 1  ", "+x = 1", " y = 2"])
+    assert whitespace_only(["-a\t", "-b ", "+a", "+b"])
+
+
+def test_no_changes_is_not_whitespace_only():
+    assert not whitespace_only([" unchanged"])
+    assert not whitespace_only([])
+
+
+def test_reordered_lines_are_a_change():
+    assert not whitespace_only(["-a", "-b", "+b", "+a"])
+
+
+def test_indentation_change_is_a_change():
+    # commit() moved out of the loop
+    assert not whitespace_only(["-        db.commit()", "+    db.commit()"])
+    assert not whitespace_only(["-  key: value", "+    key: value"])
+
+
+def test_whitespace_inside_a_line_is_a_change():
+    assert not whitespace_only(['-msg = "a  b"', '+msg = "a b"'])
+    assert not whitespace_only(["-a", "+a", "+"])
+
+
+def test_render_collapses_trailing_whitespace_hunk():
+    (hunk,) = parse_patch("@@ -3,2 +3,2 @@\n-x = 1  \n+x = 1\n y = 2")
+    assert hunk.render(ALL_MODES, 1) == (
+        "@@ -3 +3 @@ (trailing whitespace changes only)"
+    )
+
+
+def test_render_keeps_dedented_line():
+    patch = (
+        "@@ -1,3 +1,3 @@\n for row in rows:\n     db.add(row)\n-    db.commit()\n"
+        "+db.commit()"
+    )
+    (hunk,) = parse_patch(patch)
+    assert "+3|db.commit()" in hunk.render(ALL_MODES, 1)
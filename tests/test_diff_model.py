@@ -0,0 +1,60 @@
+from review_bot.services.diff_model import parse_patch
+
+PATCH = "@@ -10,7 +10,8 @@ def load(path):\n a\n b\n c\n-old\n+new\n+extra\n d\n e\n f"
+
+
+def test_not_a_hunk_patch():
+    assert parse_patch("Binary files differ") is None
+    assert parse_patch("") is None
+
+
+def test_parse_tracks_line_numbers():
+    (hunk,) = parse_patch(PATCH)
+    assert (hunk.old_start, hunk.new_start) == (10, 10)
+    assert hunk.added == [(13, 14)]
+    assert hunk.removed == [(13, 13)]
+    assert hunk.context == [(10, 12), (15, 17)]
+
+
+def test_render_without_modes_round_trips():
+    assert "\n".join(h.render(frozenset(), 3) for h in parse_patch(PATCH)) == PATCH
+    assert parse_patch(PATCH + "\n")[0].render(frozenset({"renames"}), 3) == PATCH
+
+
+def test_render_numbers_added_lines():
+    (hunk,) = parse_patch(PATCH)
+    lines = hunk.render(frozenset({"numbered"}), 3).split("\n")
+    assert lines[0] == "@@ -10,7 +10,8 @@ def load(path):"
+    assert "+13|new" in lines and "+14|extra" in lines
+    assert "-old" in lines and " a" in lines
+
+
+def test_render_trims_context():
+    (hunk,) = parse_patch(PATCH)
+    assert hunk.render(frozenset({"context"}), 1).split("\n") == [
+        "@@ -12,3 +12,4 @@ def load(path):",
+        " c",
+        "-old",
+        "+new",
+        "+extra",
+        " d",
+    ]
+
+
+def test_render_splits_at_dropped_context():
+    patch = "@@ -1,5 +1,5 @@\n-a\n+A\n b\n c\n d\n-e\n+E"
+    (hunk,) = parse_patch(patch)
+    assert hunk.render(frozenset({"context"}), 0).split("\n") == [
+        "@@ -1,1 +1,1 @@",
+        "-a",
+        "+A",
+        "@@ -5,1 +5,1 @@",
+        "-e",
+        "+E",
+    ]
+
+
+def test_multiple_hunks():
+    hunks = parse_patch("@@ -1 +1 @@\n-a\n+b\n@@ -9,2 +9,2 @@\n x\n-y\n+z")
+    assert [(h.old_start, h.new_start) for h in hunks] == [(1, 1), (9, 9)]
+    assert hunks[1].added == [(10, 10)]
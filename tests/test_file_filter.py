@@ -0,0 +1,96 @@
+import pytest
+
+from review_bot.services.file_filter import FileClassifier, parse_gitattributes
+
+
+def entry(filename, patch=None, status="modified"):
+    data = {"filename": filename, "status": status}
+    if patch is not None:
+        data["patch"] = patch
+    return data
+
+
+def added(*lines):
+    return f"@@ -0,0 +1,{len(lines)} @@\n" + "\n".join(f"+{line}" for line in lines)
+
+
+@pytest.fixture
+def classifier(monkeypatch):
+    for name in ("DIFF_REVIEW_GLOBS", "DIFF_SKIP_GLOBS"):
+        monkeypatch.delenv(name, raising=False)
+    return FileClassifier()
+
+
+def test_lockfiles_and_vendored(classifier):
+    assert classifier.classify(entry("web/package-lock.json", "")) == "lockfile"
+    assert classifier.classify(entry("vendor/lib/a.go", "")) == "vendored"
+    assert classifier.classify(entry("api/user_pb2.py", "")) == "generated"
+
+
+def test_missing_patch(classifier):
+    assert classifier.classify(entry("logo.png")) == "binary or too large"
+    assert classifier.classify(entry("b.py", status="renamed")) is None
+
+
+def test_review_globs_win(monkeypatch):
+    monkeypatch.setenv("DIFF_REVIEW_GLOBS", "vendor/ours/*")
+    classifier = FileClassifier()
+    assert classifier.classify(entry("vendor/ours/a.go", "")) is None
+
+
+def test_gitattributes_rules():
+    classifier = FileClassifier(
+        "gen/** linguist-generated\ngen/keep.py -linguist-generated\n"
+    )
+    assert (
+        classifier.classify(entry("gen/api.py", "")) == "generated per .gitattributes"
+    )
+    assert classifier.classify(entry("gen/keep.py", "")) is None
+
+
+def test_generator_marker_in_leading_comments(classifier):
+    patch = added("# Code generated by protoc. DO NOT EDIT.", "x = 1")
+    assert classifier.classify(entry("api/client.py", patch)) == "generated"
+    patch = added("#!/usr/bin/env python", "", "# @generated", "x = 1")
+    assert classifier.classify(entry("tool.py", patch)) == "generated"
+
+
+def test_marker_outside_leading_comments_is_ignored(classifier):
+    patch = added('"""Do not edit secrets here"""', "SECRET = None")
+    assert classifier.classify(entry("app/settings.py", patch)) is None
+    patch = added("import os", "# do not edit below")
+    assert classifier.classify(entry("app/config.py", patch)) is None
+
+
+def test_removed_lines_are_not_scanned(classifier):
+    patch = "@@ -1,2 +1,1 @@\n-# @generated\n-x = 1\n+x = 2"
+    assert classifier.classify(entry("app/models.py", patch)) is None
+
+
+def test_minified(classifier):
+    long_line = "a" * 600
+    assert classifier.classify(entry("static/app.js", added(*[long_line] * 3))) == (
+        "minified"
+    )
+    # A single long line, or long lines in a source language, are reviewed
+    assert classifier.classify(entry("static/app.js", added(long_line))) is None
+    assert classifier.classify(entry("app/db.py", added(*[long_line] * 3))) is None
+
+
+def test_parse_gitattributes():
+    text = (
+        "# comment\n"
+        "*.pb.go linguist-generated=true\n"
+        "docs/* linguist-documentation\n"
+        "vendor/** linguist-vendored\n"
+        "vendor/ours/** -linguist-vendored\n"
+        "api/*.go linguist-generated=false\n"
+        "lib/** !linguist-generated\n"
+    )
+    assert parse_gitattributes(text) == [
+        ("*.pb.go", "generated"),
+        ("vendor/**", "vendored"),
+        ("vendor/ours/**", None),
+        ("api/*.go", None),
+        ("lib/**", None),
+    ]
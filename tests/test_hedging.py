@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+from review_bot.llm_clients.base_client import BaseLLMClient
+from review_bot.llm_clients.hedging import HedgedLLMClient, LatencyTracker
+
+
+class FlakyClient(BaseLLMClient):
+    def __init__(self, model_name, fail):
+        super().__init__(model_name)
+        self.fail = fail
+
+    async def generate_structured_response(self, prompt, system_prompt):
+        if self.fail:
+            raise TimeoutError("boom")
+        return {"response": "ok"}
+
+
+def test_percentile():
+    tracker = LatencyTracker(window=100)
+    for seconds in range(1, 101):
+        tracker.record(float(seconds))
+    assert tracker.percentile(50) == 51.0
+    assert tracker.percentile(99) == 100.0
+    assert LatencyTracker(window=10).percentile(50) is None
+
+
+def test_only_successful_calls_are_recorded():
+    failing = HedgedLLMClient(FlakyClient("hedge-test-failing", fail=True))
+    with pytest.raises(TimeoutError):
+        asyncio.run(failing.generate_structured_response("p", "s"))
+    assert len(failing.tracker.samples) == 0
+
+    working = HedgedLLMClient(FlakyClient("hedge-test-working", fail=False))
+    asyncio.run(working.generate_structured_response("p", "s"))
+    assert len(working.tracker.samples) == 1
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from review_bot.services.job_queue import JobWorkerPool, PostgresJobQueue
+from review_bot.services.rate_limiter import Priority
+
+
+@pytest.fixture
+def queue(memory_service):
+    queue = PostgresJobQueue(memory_service)
+    with memory_service._get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("TRUNCATE review_jobs")
+    return queue
+
+
+def job_row(queue, job_id):
+    with queue.memory_service._get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT status, attempts, last_error FROM review_jobs WHERE id = %s",
+                (job_id,),
+            )
+            return cur.fetchone()
+
+
+def expire(queue, job_id):
+    with queue.memory_service._get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "UPDATE review_jobs SET locked_until = NOW() - INTERVAL '1 second' "
+                "WHERE id = %s",
+                (job_id,),
+            )
+
+
+def test_running_job_is_invisible_until_its_timeout_expires(queue):
+    job_id = queue.enqueue("review", {"pr": 1})
+    assert queue.claim()["id"] == job_id
+    assert queue.claim() is None
+
+    expire(queue, job_id)
+    reclaimed = queue.claim()
+    assert reclaimed["id"] == job_id
+    assert reclaimed["attempts"] == 2
+
+
+def test_failed_job_is_retried_later(queue):
+    job_id = queue.enqueue("review", {"pr": 1})
+    job = queue.claim()
+    queue.fail(job_id, job["attempts"], job["max_attempts"], "boom")
+    assert job_row(queue, job_id)[:2] == ("pending", 1)
+    # Backed off, so not ready yet
+    assert queue.claim() is None
+
+
+def test_job_fails_permanently_after_max_attempts(queue):
+    queue.max_attempts = 2
+    job_id = queue.enqueue("review", {"pr": 1})
+    queue.claim()
+    queue.fail(job_id, 2, 2, "boom")
+    assert job_row(queue, job_id) == ("failed", 1, "boom")
+
+
+def test_worker_dying_on_the_last_attempt_fails_the_job(queue):
+    queue.max_attempts = 1
+    job_id = queue.enqueue("review", {"pr": 1})
+    queue.claim()
+    expire(queue, job_id)
+    job = queue.claim()
+    assert job["attempts"] > job["max_attempts"]
+
+    async def handler(payload):
+        raise AssertionError("ran past max_attempts")
+
+    workers = JobWorkerPool(queue, {"review": handler}, concurrency=1)
+    asyncio.run(workers._run_job(job))
+    status, _, error = job_row(queue, job_id)
+    assert status == "failed"
+    assert "final attempt" in error
+
+
+def test_failed_job_is_superseded_by_a_newer_pending_one(queue):
+    job_id = queue.enqueue("review", {"sha": "old"}, "review:1")
+    job = queue.claim()
+    # A push while the review runs queues the next one under the same key
+    newer = queue.enqueue("review", {"sha": "new"}, "review:1")
+    assert newer != job_id
+
+    queue.fail(job_id, job["attempts"], job["max_attempts"], "boom")
+    assert job_row(queue, job_id)[0] == "superseded"
+    assert queue.pending_payload("review:1") == {"sha": "new"}
+
+
+def test_feedback_is_claimed_before_queued_reviews(queue):
+    queue.enqueue("review", {"pr": 1}, "review:1")
+    queue.enqueue("review", {"pr": 2}, "review:2")
+    feedback = queue.enqueue("feedback", {"pr": 1}, priority=Priority.HIGH)
+    assert queue.claim()["id"] == feedback
+    assert queue.claim()["payload"] == {"pr": 1}
+
+
+def test_priority_workers_only_take_high_priority_jobs(queue):
+    queue.enqueue("review", {"pr": 1}, "review:1")
+    assert queue.claim(Priority.HIGH) is None
+    feedback = queue.enqueue("feedback", {"pr": 1}, priority=Priority.HIGH)
+    assert queue.claim(Priority.HIGH)["id"] == feedback
@@ -0,0 +1,81 @@
+import asyncio
+
+from review_bot.llm_clients.base_client import BaseLLMClient
+from review_bot.llm_clients.hedging import HedgedLLMClient
+from review_bot.llm_clients.limiter import RateLimitedLLMClient, get_model_limiter
+from review_bot.llm_clients.resilience import ResilientLLMClient
+
+
+class ScriptedClient(BaseLLMClient):
+    """Fails `failures` times, then answers after `seconds`"""
+
+    def __init__(self, model_name, failures=0, seconds=0.0):
+        super().__init__(model_name)
+        self.failures = failures
+        self.seconds = seconds
+        self.calls = 0
+
+    async def generate_structured_response(self, prompt, system_prompt):
+        self.calls += 1
+        await asyncio.sleep(self.seconds)
+        if self.calls <= self.failures:
+            raise TimeoutError("boom")
+        return {"response": self.model_name}
+
+
+def test_every_retry_is_counted(monkeypatch):
+    monkeypatch.setenv("LLM_RETRY_BASE_DELAY", "0")
+    inner = ScriptedClient("limiter-test-retries", failures=2)
+    client = ResilientLLMClient(RateLimitedLLMClient(inner))
+    asyncio.run(client.generate_structured_response("p", "s"))
+    assert inner.calls == 3
+    assert get_model_limiter("limiter-test-retries").requests.granted == 3
+
+
+def test_fallback_is_counted_against_its_own_model(monkeypatch):
+    monkeypatch.setenv("LLM_MAX_RETRIES", "0")
+    fallback = ResilientLLMClient(
+        RateLimitedLLMClient(ScriptedClient("limiter-test-fallback"))
+    )
+    client = ResilientLLMClient(
+        RateLimitedLLMClient(ScriptedClient("limiter-test-primary", failures=9)),
+        fallback=fallback,
+    )
+    client.breaker.failure_threshold = 1
+    response = asyncio.run(client.generate_structured_response("p", "s"))
+    assert response["fallback"] == "limiter-test-fallback"
+    assert get_model_limiter("limiter-test-primary").requests.granted == 1
+    assert get_model_limiter("limiter-test-fallback").requests.granted == 1
+
+
+def test_hedge_is_counted_against_the_hedge_model(monkeypatch):
+    monkeypatch.setenv("LLM_HEDGE_MIN_SAMPLES", "1")
+    monkeypatch.setenv("LLM_HEDGE_MIN_DELAY", "0.01")
+    primary = ScriptedClient("limiter-test-slow", seconds=1)
+    client = HedgedLLMClient(
+        RateLimitedLLMClient(primary),
+        RateLimitedLLMClient(ScriptedClient("limiter-test-hedge")),
+    )
+    client.tracker.record(0.01)
+    response = asyncio.run(client.generate_structured_response("p", "s"))
+    assert response["fallback"] == "limiter-test-hedge"
+    assert get_model_limiter("limiter-test-slow").requests.granted == 1
+    assert get_model_limiter("limiter-test-hedge").requests.granted == 1
+
+
+def test_queueing_does_not_count_against_the_deadline(monkeypatch):
+    monkeypatch.setenv("LLM_CALL_DEADLINE", "0.2")
+    monkeypatch.setenv("LLM_MAX_CONCURRENCY", "1")
+    inner = ScriptedClient("limiter-test-queued", seconds=0.15)
+    client = ResilientLLMClient(RateLimitedLLMClient(inner))
+
+    async def run():
+        # The second call waits 0.15s for the only slot, then runs 0.15s
+        return await asyncio.gather(
+            client.generate_structured_response("p", "s"),
+            client.generate_structured_response("p", "s"),
+        )
+
+    assert [r["response"] for r in asyncio.run(run())] == ["limiter-test-queued"] * 2
+    assert inner.calls == 2
+    assert client.breaker.failures == 0
@@ -0,0 +1,59 @@
+import httpx
+import pytest
+
+from review_bot.services.rate_limiter import GitHubRateLimiter
+
+
+def response(url, status=200, **headers):
+    return httpx.Response(status, headers=headers, request=httpx.Request("GET", url))
+
+
+@pytest.fixture
+def limiter():
+    return GitHubRateLimiter()
+
+
+def test_resource_from_url(limiter):
+    assert limiter.resource("https://api.github.com/graphql") == "graphql"
+    assert limiter.resource("https://api.github.com/repos/o/r/pulls/1") == "core"
+
+
+def test_quotas_are_tracked_per_resource(limiter):
+    limiter.observe(
+        response(
+            "https://api.github.com/graphql",
+            **{"X-RateLimit-Resource": "graphql", "X-RateLimit-Remaining": "3"},
+        )
+    )
+    limiter.observe(
+        response(
+            "https://api.github.com/repos/o/r/pulls/1",
+            **{"X-RateLimit-Resource": "core", "X-RateLimit-Remaining": "4000"},
+        )
+    )
+    assert limiter.remaining == {"graphql": 3, "core": 4000}
+    assert limiter.buckets["graphql"].tokens <= 3
+    assert limiter.buckets["core"].tokens > 3
+
+
+def test_other_resources_are_ignored(limiter):
+    limiter.observe(
+        response(
+            "https://api.github.com/search/issues",
+            **{"X-RateLimit-Resource": "search", "X-RateLimit-Remaining": "0"},
+        )
+    )
+    assert limiter.remaining == {}
+
+
+def test_exhausted_graphql_quota_does_not_pause_rest(limiter):
+    delay = limiter.observe(
+        response(
+            "https://api.github.com/graphql",
+            403,
+            **{"X-RateLimit-Resource": "graphql", "X-RateLimit-Remaining": "0"},
+        )
+    )
+    assert delay is not None
+    assert limiter.buckets["graphql"].stats()["paused_seconds"]["HIGH"] > 0
+    assert limiter.buckets["core"].stats()["paused_seconds"] == {}
@@ -0,0 +1,47 @@
+import asyncio
+
+from review_bot.services.review_coalescer import ReviewCoalescer
+
+KEY = ("repo", 1)
+
+
+def test_burst_of_pushes_is_reviewed_once():
+    submitted = []
+
+    async def submit(payload):
+        submitted.append(payload["head_sha"])
+
+    async def pushes():
+        coalescer = ReviewCoalescer(submit, quiet_window=0.05)
+        for sha in ("a", "b", "c"):
+            coalescer.schedule(KEY, sha, {"head_sha": sha})
+            await asyncio.sleep(0.01)
+        assert not await coalescer.is_latest(KEY, "b")
+        await asyncio.sleep(0.1)
+        # Nothing is remembered once the review is submitted: the queue
+        # decides from here on
+        assert await coalescer.is_latest(KEY, "b")
+        assert await coalescer.run(KEY, "a", lambda: asyncio.sleep(0))
+
+    asyncio.run(pushes())
+    assert submitted == ["c"]
+
+
+def test_review_superseded_by_queued_job_is_skipped():
+    queued = {KEY: "b"}
+    ran = []
+
+    async def queued_sha(key):
+        return queued.get(key)
+
+    async def review(sha):
+        ran.append(sha)
+
+    async def jobs():
+        coalescer = ReviewCoalescer(None, quiet_window=0, queued_sha=queued_sha)
+        assert not await coalescer.run(KEY, "a", lambda: review("a"))
+        queued.clear()
+        assert await coalescer.run(KEY, "a", lambda: review("a"))
+
+    asyncio.run(jobs())
+    assert ran == ["a"]
@@ -0,0 +1,12 @@
+from types import SimpleNamespace
+
+from review_bot.services.langgraph_service import ReviewWorkflow
+
+
+def test_incremental_header_is_the_same_for_every_commit():
+    workflow = SimpleNamespace(diff_legend="")
+    first = ReviewWorkflow._reviewer_header(workflow, {"previous_head_sha": "a" * 40})
+    second = ReviewWorkflow._reviewer_header(workflow, {"previous_head_sha": "b" * 40})
+    assert first == second
+    assert "since the last reviewed commit" in first
+    assert first != ReviewWorkflow._reviewer_header(workflow, {})
@@ -0,0 +1,66 @@
+import asyncio
+import importlib
+
+import httpx
+
+from review_bot.services.github_service import GitHubService
+from review_bot.services.sharding import shard_diff
+
+LOCKFILES = [
+    {"filename": "poetry.lock", "patch": "@@ -1 +1 @@\n-a\n+b", "additions": 1},
+    {"filename": "vendor/lib.js", "patch": "@@ -1 +1 @@\n-c\n+d", "deletions": 1},
+]
+
+
+def build_diff(monkeypatch, files):
+    monkeypatch.setenv("GITHUB_TOKEN", "x" * 20)
+    monkeypatch.setenv("DIFF_SKIPPED_FILES", "summarize")
+
+    def handler(request):
+        # No .gitattributes and no linked issues
+        if "/contents/" in request.url.path:
+            return httpx.Response(404)
+        return httpx.Response(200, json={"title": "", "body": ""})
+
+    async def iter_files():
+        for file_data in files:
+            yield file_data
+
+    async def run():
+        github = GitHubService()
+        github.http.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        return await github._build_diff(1, iter_files())
+
+    return asyncio.run(run())
+
+
+def test_stubs_are_not_reviewed(monkeypatch):
+    files = [*LOCKFILES, {"filename": "app.py", "patch": "@@ -1 +1 @@\n-e\n+f"}]
+    diff = build_diff(monkeypatch, files)
+    assert [file.filename for file in diff.files] == ["app.py"]
+    assert [shard.filename for shard in shard_diff(diff, 1000)] == ["app.py"]
+    assert "poetry.lock" not in diff.render()
+    assert "(not reviewed, lockfile: +1 -0 lines)" in diff.render_skipped()
+    assert "(not reviewed, vendored: +0 -1 lines)" in diff.render_skipped()
+
+
+def test_all_skipped_pr_is_not_reviewed(monkeypatch):
+    diff = build_diff(monkeypatch, LOCKFILES)
+    assert diff.files == []
+    assert shard_diff(diff, 1000) == []
+
+    monkeypatch.delenv("DATABASE_URL", raising=False)
+    monkeypatch.delenv("DB_HOST", raising=False)
+    monkeypatch.setenv("GITHUB_BACKEND", "rest")
+    monkeypatch.setenv("GEMINI_API_KEY", "x")
+    main = importlib.import_module("review_bot.main")
+
+    async def fetch_pr_diff_model(pr_number, issue_refs=None):
+        return diff
+
+    async def run_review(*args, **kwargs):
+        raise AssertionError("an all-skipped PR was reviewed")
+
+    monkeypatch.setattr(main.github_tool, "fetch_pr_diff_model", fetch_pr_diff_model)
+    monkeypatch.setattr(main.review_workflow, "run_review", run_review)
+    asyncio.run(main.process_review_workflow(1, 1, "sha"))
@@ -0,0 +1,38 @@
+from review_bot.services.diff_utils import format_file_section, join_diff, split_diff
+from review_bot.services.token_budget import TRUNCATED, trim_diff
+
+SECTIONS = {
+    "big.py": format_file_section(
+        "big.py", "@@ -1,60 +1,60 @@\n" + " keep\n" * 40 + "-old\n+new\n" * 20
+    ),
+    "small.py": format_file_section("small.py", "@@ -1 +1 @@\n-x\n+y"),
+}
+DIFF = join_diff("#7: Slow startup", SECTIONS)
+
+
+def test_fitting_diff_is_unchanged():
+    assert trim_diff(DIFF, len(DIFF), len) == DIFF
+
+
+def test_context_lines_go_first():
+    stripped = trim_diff(DIFF, len(DIFF) - 100, len)
+    issue_context, sections = split_diff(stripped)
+    assert issue_context == "#7: Slow startup"
+    assert " keep" not in sections["big.py"]
+    assert "-old\n+new" in sections["big.py"]
+    assert sections["small.py"] == SECTIONS["small.py"]
+
+
+def test_largest_patch_is_omitted_next():
+    stripped = trim_diff(DIFF, len(DIFF) - 100, len)
+    trimmed = trim_diff(DIFF, len(stripped) - 5, len)
+    _, sections = split_diff(trimmed)
+    assert "patch omitted for size: +20 -20 lines" in sections["big.py"]
+    assert sections["small.py"] == SECTIONS["small.py"]
+    assert len(trimmed) <= len(stripped) - 5
+
+
+def test_text_is_cut_as_a_last_resort():
+    trimmed = trim_diff(DIFF, 40, len)
+    assert trimmed.endswith(TRUNCATED)
+    assert len(trimmed) <= 40